@@ -0,0 +1,308 @@
+# app/backtest.py
+from __future__ import annotations
+
+import argparse
+import json
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from app.models import Settings
+from app.risk import calc_qty
+from app.strategy import signal_array
+
+DAY_MS = 86_400_000
+
+# Bybit linear perps, базовый уровень
+FEE_TAKER = 0.00055
+FEE_MAKER = 0.0002
+
+REASONS = ("SL", "TP", "TRAIL", "END")
+
+TRADE_DTYPE = np.dtype([
+    ("entry_idx", np.int64),
+    ("exit_idx", np.int64),
+    ("entry_ts", np.int64),
+    ("exit_ts", np.int64),
+    ("side", np.int8),         # +1 buy, -1 sell
+    ("qty", np.float64),
+    ("entry", np.float64),
+    ("exit", np.float64),
+    ("fee", np.float64),
+    ("pnl", np.float64),       # net, после комиссий
+    ("reason", np.int8),       # индекс в REASONS
+])
+
+
+@dataclass
+class Candles:
+    """OHLCV одного символа колонками numpy (ts в мс)."""
+    ts: np.ndarray
+    open: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+    close: np.ndarray
+    volume: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.ts)
+
+    @classmethod
+    def from_rows(cls, rows) -> "Candles":
+        """rows — список свечей ccxt [[ts, o, h, l, c, v], ...]."""
+        a = np.asarray(rows, dtype=np.float64).reshape(-1, 6)
+        return cls(a[:, 0].astype(np.int64), a[:, 1], a[:, 2], a[:, 3], a[:, 4], a[:, 5])
+
+    @classmethod
+    def from_csv(cls, path: str) -> "Candles":
+        """CSV: ts,open,high,low,close,volume (заголовок допустим)."""
+        with open(path) as f:
+            first = f.readline()
+        skip = 0 if first[:1].isdigit() else 1
+        return cls.from_rows(np.loadtxt(path, delimiter=",", skiprows=skip, ndmin=2)[:, :6])
+
+
+@dataclass
+class BacktestResult:
+    symbol: str
+    start_balance: float
+    trades: np.ndarray = field(repr=False)
+
+    @property
+    def pnl(self) -> float:
+        return float(self.trades["pnl"].sum())
+
+    @property
+    def end_balance(self) -> float:
+        return self.start_balance + self.pnl
+
+    def equity(self) -> np.ndarray:
+        return self.start_balance + np.cumsum(self.trades["pnl"])
+
+    def max_drawdown_pct(self) -> float:
+        if not len(self.trades):
+            return 0.0
+        eq = np.concatenate(([self.start_balance], self.equity()))
+        peak = np.maximum.accumulate(eq)
+        return float(((peak - eq) / peak).max() * 100.0)
+
+    def summary(self) -> dict:
+        p = self.trades["pnl"]
+        wins, losses = p[p > 0].sum(), -p[p < 0].sum()
+        return {
+            "symbol": self.symbol,
+            "trades": int(len(p)),
+            "pnl_usdt": self.pnl,
+            "return_pct": self.pnl / self.start_balance * 100.0 if self.start_balance else 0.0,
+            "fees_usdt": float(self.trades["fee"].sum()),
+            "win_rate": float((p > 0).mean()) if len(p) else 0.0,
+            "profit_factor": float(wins / losses) if losses > 0 else (float("inf") if wins > 0 else 0.0),
+            "max_drawdown_pct": self.max_drawdown_pct(),
+            "end_balance": self.end_balance,
+        }
+
+    def trades_list(self) -> list[dict]:
+        out = []
+        for t in self.trades:
+            out.append({
+                "side": "buy" if t["side"] > 0 else "sell",
+                "entry_ts": int(t["entry_ts"]),
+                "exit_ts": int(t["exit_ts"]),
+                "qty": float(t["qty"]),
+                "entry": float(t["entry"]),
+                "exit": float(t["exit"]),
+                "fee_usdt": float(t["fee"]),
+                "pnl_usdt": float(t["pnl"]),
+                "reason": REASONS[t["reason"]],
+            })
+        return out
+
+
+def _find_exit(c: Candles, i: int, side: int, entry: float, st) -> tuple[int, float, int]:
+    """
+    Первая свеча после i, где сработал SL/TP/трейл. Ищем окнами растущего размера,
+    внутри окна — векторно: лучшая цена через cummax/cummin, SL трейла — от лучшей цены
+    предыдущих свечей (как софт-трейл в BotEngine._apply_trailing).
+    Если в одной свече задеты и SL, и TP — считаем SL (консервативно).
+    """
+    n = len(c)
+    sl0 = entry * (1 - side * st.sl_pct / 100.0)
+    tp = entry * (1 + side * st.tp_pct / 100.0)
+    trailing = bool(st.trailing_enabled)
+    act = entry * (1 + side * st.trailing_activation_pct / 100.0)
+    trail = st.trailing_pct / 100.0
+
+    best = np.nan
+    s, w = i + 1, 256
+    while s < n:
+        e = min(s + w, n)
+        o, hi, lo = c.open[s:e], c.high[s:e], c.low[s:e]
+        if side > 0:
+            cm = np.fmax(np.maximum.accumulate(hi), best)
+            prev = np.concatenate(([best], cm[:-1]))
+            sl = np.full(e - s, sl0)
+            if trailing:
+                active = prev >= act
+                sl[active] = np.maximum(sl0, prev[active] * (1 - trail))
+            hit_sl = lo <= sl
+            hit_tp = hi >= tp
+        else:
+            cm = np.fmin(np.minimum.accumulate(lo), best)
+            prev = np.concatenate(([best], cm[:-1]))
+            sl = np.full(e - s, sl0)
+            if trailing:
+                active = prev <= act
+                sl[active] = np.minimum(sl0, prev[active] * (1 + trail))
+            hit_sl = hi >= sl
+            hit_tp = lo <= tp
+
+        hit = hit_sl | hit_tp
+        if hit.any():
+            j = int(np.argmax(hit))
+            if hit_sl[j]:
+                # гэп через стоп — исполнение по open
+                px = min(o[j], sl[j]) if side > 0 else max(o[j], sl[j])
+                return s + j, float(px), REASONS.index("TRAIL" if sl[j] != sl0 else "SL")
+            px = max(o[j], tp) if side > 0 else min(o[j], tp)
+            return s + j, float(px), REASONS.index("TP")
+
+        best = cm[-1]
+        s, w = e, min(w * 2, 65536)
+
+    return n - 1, float(c.close[-1]), REASONS.index("END")
+
+
+def run_backtest(
+    c: Candles,
+    st: Settings | None = None,
+    *,
+    symbol: str = "",
+    balance: float = 1000.0,
+    fee_taker: float = FEE_TAKER,
+    fee_maker: float = FEE_MAKER,
+    slippage_pct: float = 0.02,
+    signals: np.ndarray | None = None,
+) -> BacktestResult:
+    """
+    Прогон decide_signal (векторно, signal_array) + SL/TP/трейла из Settings по истории.
+    Вход по close сигнальной свечи: limit — по цене без проскальзывания и с maker fee,
+    market — со slippage_pct и taker fee. Выход всегда market (taker + slippage).
+    Учитываются cooldown_minutes, max_trades_per_day и max_daily_loss_pct.
+    RANDOM_SIGNALS здесь не действует — гоняется настоящая логика стратегии.
+    """
+    st = st or Settings()
+    sig = signal_array(c.close) if signals is None else signals
+    cand = np.flatnonzero(sig)
+
+    market_entry = st.entry_order_type == "market"
+    fee_entry = fee_taker if market_entry else fee_maker
+    slip = slippage_pct / 100.0
+    cooldown_ms = int(st.cooldown_minutes) * 60_000
+
+    trades = np.zeros(min(len(cand), 1 << 16) or 1, dtype=TRADE_DTYPE)
+    nt = 0
+    equity = float(balance)
+    day, day_start_equity, trades_today = None, equity, 0
+    day_pnl: dict[int, float] = {}
+
+    next_idx = 0
+    last_entry_ts = None
+    while True:
+        if last_entry_ts is not None and cooldown_ms:
+            next_idx = max(next_idx, int(np.searchsorted(c.ts, last_entry_ts + cooldown_ms)))
+        k = int(np.searchsorted(cand, next_idx))
+        if k >= len(cand):
+            break
+        i = int(cand[k])
+
+        d = int(c.ts[i] // DAY_MS)
+        if d != day:
+            day, day_start_equity, trades_today = d, equity, 0
+        if trades_today >= st.max_trades_per_day or (
+            day_start_equity > 0 and day_pnl.get(d, 0.0) <= -(day_start_equity * st.max_daily_loss_pct / 100.0)
+        ):
+            # лимиты дня исчерпаны — до следующих суток
+            next_idx = int(np.searchsorted(c.ts, (d + 1) * DAY_MS))
+            continue
+
+        side = int(sig[i])
+        ref = float(c.close[i])
+        entry = ref * (1 + side * slip) if market_entry else ref
+        qty = calc_qty(ref, equity, st.risk_pct, st.sl_pct, st.leverage, st.max_margin_pct)
+        if qty <= 0:
+            next_idx = i + 1
+            continue
+
+        j, px, reason = _find_exit(c, i, side, entry, st)
+        px *= 1 - side * slip
+        fee = qty * entry * fee_entry + qty * px * fee_taker
+        pnl = (px - entry) * qty * side - fee
+
+        if nt == len(trades):
+            trades = np.resize(trades, nt * 2)
+        trades[nt] = (i, j, c.ts[i], c.ts[j], side, qty, entry, px, fee, pnl, reason)
+        nt += 1
+
+        equity += pnl
+        dj = int(c.ts[j] // DAY_MS)
+        day_pnl[dj] = day_pnl.get(dj, 0.0) + pnl
+        trades_today += 1
+        last_entry_ts = int(c.ts[i])
+        next_idx = j + 1
+
+    return BacktestResult(symbol=symbol, start_balance=float(balance), trades=trades[:nt].copy())
+
+
+def run_many(data: dict[str, Candles], st: Settings | None = None, **kwargs) -> dict[str, BacktestResult]:
+    """Каждый символ — независимо, со своим стартовым balance (как отдельная задача движка)."""
+    return {sym: run_backtest(c, st, symbol=sym, **kwargs) for sym, c in data.items()}
+
+
+def load_inputs(items: list[str], store_tf: str | None = None) -> dict[str, Candles]:
+    """CSV-файлы (имя файла = символ) или, при store_tf, символы из локального OHLCVStore."""
+    if store_tf:
+        from app.ohlcv_store import OHLCVStore
+
+        store = OHLCVStore()
+        out = {}
+        for sym in items:
+            c = store.read(sym, store_tf)
+            if c is None:
+                raise SystemExit(f"No local {store_tf} candles for {sym}; run python -m app.ohlcv_store first")
+            out[sym] = c
+        return out
+    return {p.rsplit("/", 1)[-1].rsplit(".", 1)[0]: Candles.from_csv(p) for p in items}
+
+
+def _parse_overrides(items: list[str]) -> dict:
+    out = {}
+    for it in items:
+        k, _, v = it.partition("=")
+        try:
+            out[k] = json.loads(v)
+        except ValueError:
+            out[k] = v
+    return out
+
+
+def main(argv: list[str] | None = None):
+    ap = argparse.ArgumentParser(description="Backtest decide_signal + SL/TP/trailing on OHLCV CSV files")
+    ap.add_argument("inputs", nargs="+", help="CSV ts,open,high,low,close,volume (имя файла = символ) или символы с --store")
+    ap.add_argument("--store", metavar="TIMEFRAME", help="читать символы из локального OHLCVStore")
+    ap.add_argument("--set", nargs="*", default=[], metavar="FIELD=VALUE", help="переопределить поля Settings")
+    ap.add_argument("--balance", type=float, default=1000.0)
+    ap.add_argument("--slippage-pct", type=float, default=0.02)
+    ap.add_argument("--trades", action="store_true", help="печатать список сделок")
+    args = ap.parse_args(argv)
+
+    st = Settings(**_parse_overrides(args.set))
+    data = load_inputs(args.inputs, args.store)
+    for sym, r in run_many(data, st, balance=args.balance, slippage_pct=args.slippage_pct).items():
+        out = r.summary()
+        if args.trades:
+            out["trade_list"] = r.trades_list()
+        print(json.dumps(out, default=float))
+
+
+if __name__ == "__main__":
+    main()
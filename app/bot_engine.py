@@ -1,73 +1,328 @@
 # app/bot_engine.py
 from __future__ import annotations
 
+import asyncio
+import os
+import tempfile
 import threading
 import time
-from datetime import datetime, timedelta
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, time as dtime, timedelta, timezone
 
+import numpy as np
 from sqlmodel import Session
 
+from app.config import (
+    BYBIT_KEY,
+    BYBIT_SECRET,
+    BYBIT_WS_PRIVATE,
+    BYBIT_WS_PUBLIC,
+    BALANCE_TTL_SEC,
+    ENGINE_WORKERS,
+    EXCHANGE,
+    EXEC_BOOK_LEVELS,
+    MARKET_WS,
+    PORTFOLIO_PATH,
+    PORTFOLIO_SNAPSHOT_SEC,
+    PRIVATE_WS,
+    SIM_BALANCE,
+    SIM_LATENCY_MS,
+    SIM_SEED,
+    SIM_SPEED,
+    SIM_START,
+    SIM_SYMBOLS,
+    SIM_TIMEFRAME,
+    STOP_GRACE_SEC,
+)
 from app.db import engine
-from app.exchange.bybit import BybitClient
-from app.strategy import decide_signal
+from app.event_sink import events
+from app.exchange.bybit_async import AsyncBybitClient
+from app.exchange.bybit_ws import MarketDataFeed, OrderStream
+from app.execution import ExecResult, LimitExecutor
+from app import execution
+from app.live import hub
+from app import metrics
+from app.metrics import DB_WRITE, LOOP_ERRORS, SIGNAL_TO_ORDER, Gauge, stage
+from app.risk import RiskGate, calc_qty, spread_pct
+from app.scanner import Candidate, scan, stack_closes
+from app.settings import SettingsCache
+from app.strategy import SignalState, decide
 from app import repo
-from app.models import Trade
+from app.models import Execution, Trade
+from app.ohlcv_store import OHLCVStore, tf_ms
+from app.portfolio import Portfolio, SymbolState
+from app.protection import ProtectionManager
+
+# stopOrderType исполнения на бирже -> exit_reason сделки
+_STOP_REASON = {"StopLoss": "SL", "TakeProfit": "TP", "TrailingStop": "TRAIL", "PartialStopLoss": "SL",
+                "PartialTakeProfit": "TP"}
+
+
+def shard_of(symbol: str, count: int) -> int:
+    """Номер шарда символа: стабилен между рестартами и при изменении списка symbols."""
+    return zlib.crc32(symbol.encode()) % count if count > 1 else 0
 
 
 class BotEngine:
-    def __init__(self):
+    """
+    Мульти-символьный движок: один asyncio loop в фоновом потоке,
+    по задаче на символ. Биржа — через AsyncBybitClient (общий пул соединений),
+    SQLite — в пул потоков, поэтому символ, который ждёт fill лимитки,
+    не тормозит остальные.
+
+    client/store/clock подставляются (симулятор: app.exchange.sim); clock — объект
+    с time() (секунды epoch), по нему считаются кулдауны, сутки и свежесть свечей.
+    shard=(index, count) — движок воркера супервизора: торгует только своими символами.
+    """
+
+    def __init__(
+        self,
+        client=None,
+        store: OHLCVStore | None = None,
+        clock=None,
+        portfolio: Portfolio | None = None,
+        shard: tuple[int, int] | None = None,
+        risk: RiskGate | None = None,
+    ):
         self.running = False
         self.thread: threading.Thread | None = None
-        self.client = BybitClient()
+        self._client = client  # None — создаётся при первом обращении (импорт ccxt не на старте)
+        self._clock = clock
+        self.feed: MarketDataFeed | None = None
+        self.orders: OrderStream | None = None
+        self.protect: ProtectionManager | None = None
+        self.store = store or OHLCVStore()
+        self.settings = SettingsCache()
+        self._settings_changed: asyncio.Event | None = None
+        repo.subscribe_settings(self._on_settings_updated)
 
-        self.last_trade_time: datetime | None = None
-        self.trades_today = 0
-        self.day_start = datetime.utcnow().date()
-        self.daily_pnl = 0.0
+        self.portfolio = portfolio or Portfolio(PORTFOLIO_PATH, BALANCE_TTL_SEC)
+        self.shard = shard
+        self.risk = risk or RiskGate()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._stop_evt: asyncio.Event | None = None
+        self._tasks: dict[str, asyncio.Task] = {}
+        self._signals: dict[tuple[str, str], SignalState] = {}  # (symbol, timeframe) -> индикаторы
+        self._sym_locks: dict[str, asyncio.Lock] = {}  # цикл символа и реконсиляция не пересекаются
+        self._reconcile_wake: asyncio.Event | None = None
+        self._untracked: set[str] = set()  # позиции без OPEN-сделки, о которых уже предупредили
+        self._ranked: dict[str, Candidate] = {}  # сканер: top-N кандидатов на вход
+        self._ranked_at = 0.0  # loop.time() последнего скана
 
-        # trailing state (для одной позиции)
-        self.best_price: float | None = None  # для buy: max; для sell: min
+    # ---------- lifecycle ----------
 
     def start(self):
         if self.running:
             return
+        if self.thread is not None:
+            # прошлый loop ещё доводит начатые циклы (STOP_GRACE_SEC) — два супервизора не запускаем
+            self.thread.join()
         self.running = True
-        self.thread = threading.Thread(target=self._run_loop, daemon=True)
+        self.thread = threading.Thread(target=self._thread_main, daemon=True)
         self.thread.start()
-        with Session(engine) as s:
-            repo.add_event(s, "INFO", "BOT_STARTED", "Bot started")
+        events.emit("INFO", "BOT_STARTED", "Bot started")
+        self._publish_status()
 
     def stop(self):
         self.running = False
-        with Session(engine) as s:
-            repo.add_event(s, "INFO", "BOT_STOPPED", "Bot stopped")
+        loop, evt = self._loop, self._stop_evt
+        if loop is not None and evt is not None:
+            try:
+                loop.call_soon_threadsafe(evt.set)
+            except RuntimeError:
+                pass  # loop уже закрыт
+        events.emit("INFO", "BOT_STOPPED", "Bot stopped")
+        events.flush(timeout=1.0)
+        self._publish_status()
 
     def status(self):
+        states = list(self.states.items())  # states меняется из потока движка
+        last = max((x.last_trade_time for _, x in states if x.last_trade_time), default=None)
         return {
             "running": self.running,
-            "trades_today": self.trades_today,
-            "daily_pnl_usdt": self.daily_pnl,
-            "last_trade_time": self.last_trade_time.isoformat() if self.last_trade_time else None,
+            "trades_today": sum(x.trades_today for _, x in states),
+            "daily_pnl_usdt": sum(x.daily_pnl for _, x in states),
+            "last_trade_time": last.isoformat() if last else None,
+            "open_trades": len(self.portfolio.open_trades()),
+            "symbols": {sym: x.as_dict() for sym, x in states},
         }
 
-    def _reset_daily_if_needed(self):
-        now = datetime.utcnow().date()
-        if now != self.day_start:
-            self.day_start = now
-            self.trades_today = 0
-            self.daily_pnl = 0.0
+    def _publish_status(self):
+        # в живой стрим дашборда; hub сам отбрасывает неизменившийся статус
+        hub.publish_status(self.status())
+
+    @property
+    def states(self) -> dict[str, SymbolState]:
+        return self.portfolio.states
+
+    @property
+    def daily_pnl(self) -> float:
+        return self.portfolio.daily_pnl
+
+    def _lock(self, symbol: str) -> asyncio.Lock:
+        lk = self._sym_locks.get(symbol)
+        if lk is None:
+            lk = self._sym_locks[symbol] = asyncio.Lock()
+        return lk
+
+    def _state(self, symbol: str) -> SymbolState:
+        return self.portfolio.state(symbol)
+
+    def _owns(self, symbol: str) -> bool:
+        return self.shard is None or shard_of(symbol, self.shard[1]) == self.shard[0]
+
+    def _symbols(self, st) -> list[str]:
+        return [s for s in st.symbol_list() if self._owns(s)]
+
+    def _thread_main(self):
+        loop = asyncio.new_event_loop()
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=ENGINE_WORKERS, thread_name_prefix="bot-io"))
+        self._loop = loop
+        try:
+            loop.run_until_complete(self._supervise())
+        finally:
+            loop.run_until_complete(loop.shutdown_default_executor())
+            loop.close()
+            self._loop = None
+
+    # ---------- helpers ----------
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = _make_client()
+        return self._client
+
+    @client.setter
+    def client(self, c):
+        self._client = c
+
+    @property
+    def clock(self):
+        return self._clock or getattr(self.client, "clock", None) or time
 
-    def _cooldown_ok(self, cooldown_minutes: int) -> bool:
-        if not self.last_trade_time:
-            return True
-        return datetime.utcnow() - self.last_trade_time >= timedelta(minutes=cooldown_minutes)
+    def _utcnow(self) -> datetime:
+        return datetime.utcfromtimestamp(self.clock.time())
+
+    @staticmethod
+    async def _io(fn, *args, **kwargs):
+        return await asyncio.to_thread(fn, *args, **kwargs)
+
+    @staticmethod
+    def _event(level: str, type_: str, message: str, symbol: str | None = None):
+        # write-behind: в БД уйдёт пачкой из EventSink, цикл не ждёт fsync
+        events.emit(level, type_, message, symbol)
+
+    async def _balance(self) -> float:
+        # баланс общий на аккаунт: из кэша портфеля, биржа — когда протух или был fill
+        b = self.portfolio.balance()
+        if b is None:
+            b = await self.client.balance_usdt()
+            self.portfolio.set_balance(b)
+        return b
+
+    async def _load_settings(self):
+        # снимок из кэша; в БД — только при первом чтении/протухании
+        if self.settings.is_fresh():
+            return self.settings.get()
+        return await self._io(self.settings.get)
+
+    async def _ticker(self, symbol: str) -> dict:
+        # цена из стрима; REST — только если стрим выключен/протух
+        t = self.feed.ticker(symbol) if self.feed is not None else None
+        return t if t is not None else await self.client.ticker(symbol)
+
+    async def _book(self, symbol: str) -> dict:
+        # стакан из стрима; REST — только если стрим выключен/протух
+        b = self.feed.book(symbol, EXEC_BOOK_LEVELS) if self.feed is not None else None
+        return b if b is not None else await self.client.order_book(symbol, max(EXEC_BOOK_LEVELS, 25))
+
+    async def _order_state(self, symbol: str, order_id: str) -> dict | None:
+        o = self.orders.order(order_id) if self.orders is not None and self.orders.connected else None
+        if o is None:
+            # без стрима — кэш open/closed списков (общий запрос на символ); fetch_order на Bybit v5 не зовём,
+            # None — исполнитель спросит снова на следующем опросе
+            o = await self.client.get_order_status_safe(symbol, order_id)
+        return o
+
+    async def _ohlcv(self, symbol: str, timeframe: str) -> list:
+        rows = None
+        if self.feed is not None:
+            rows = self.feed.ohlcv(symbol, timeframe)
+        # без стрима текущая свеча на диске устарела — докачиваем хвост с неё
+        return rows if rows is not None else await self._warm_ohlcv(symbol, timeframe, fresh=True)
+
+    async def _warm_ohlcv(self, symbol: str, timeframe: str, limit: int = 200, fresh: bool = False) -> list:
+        """
+        Окно из limit свечей с диска (OHLCVStore); по REST докачиваем только
+        свечи после последней сохранённой, а если истории нет/она старше окна — всё окно.
+        """
+        step = tf_ms(timeframe)
+        now = int(self.clock.time() * 1000)
+        last = await self._io(self.store.last_ts, symbol, timeframe)
+
+        rows = None
+        if last is None or now - last > limit * step:
+            rows = await self.client.ohlcv(symbol, timeframe, limit=limit)
+        elif fresh or now - last >= step:
+            rows = await self.client.ohlcv(symbol, timeframe, limit=min(1000, (now - last) // step + 1), since=last)
+        if rows:
+            await self._io(self.store.write, symbol, timeframe, rows)
+        return await self._io(self.store.tail, symbol, timeframe, limit)
+
+    async def _wait_fill(self, symbol: str, order_id: str, timeout_sec: int):
+        """
+        Fill из приватного стрима (order/execution), без поллинга.
+        Если стрим не подключен или отвалился посреди ожидания —
+        остаток таймаута доживаем старым REST-поллингом.
+        """
+        loop = asyncio.get_running_loop()
+        t0 = loop.time()
+        if self.orders is not None and self.orders.connected:
+            o = await self.orders.wait_fill(order_id, timeout_sec)
+            if self.orders.connected or (o is not None and o.get("status") != "open"):
+                return o
+        remaining = timeout_sec - (loop.time() - t0)
+        return await self.client.wait_fill(symbol, order_id, max(remaining, 1.0))
+
+    async def _sleep(self, sec: float, wake: asyncio.Event | None = None) -> None:
+        # спим, но просыпаемся сразу по stop() (или по wake)
+        waits = [asyncio.ensure_future(self._stop_evt.wait())]
+        if wake is not None:
+            waits.append(asyncio.ensure_future(wake.wait()))
+        try:
+            await asyncio.wait(waits, timeout=sec, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for w in waits:
+                w.cancel()
+
+    def _on_settings_updated(self, _s):
+        # вызывается из потока API после POST /settings — будим супервизор (новые/убранные символы)
+        loop, evt = self._loop, self._settings_changed
+        if loop is not None and evt is not None:
+            try:
+                loop.call_soon_threadsafe(evt.set)
+            except RuntimeError:
+                pass
+
+    def _wake_reconcile(self, *_):
+        if self._reconcile_wake is not None:
+            self._reconcile_wake.set()
+
+    def _on_order_terminal(self, o: dict):
+        # биржевой SL/TP/трейл сработал (или закрыли руками) — сверяемся сразу, не ждём интервала
+        info = o.get("info") or {}
+        if o.get("reduceOnly") or info.get("stopOrderType") or info.get("reduceOnly"):
+            self._wake_reconcile()
+
+    @staticmethod
+    def _exchange_protect(st) -> bool:
+        return st.exit_mode == "exchange" or bool(st.use_exchange_sl_tp)
 
     @staticmethod
     def _spread_pct(bid: float, ask: float) -> float:
-        if bid <= 0 or ask <= 0:
-            return 999.0
-        mid = (bid + ask) / 2.0
-        return (ask - bid) / mid * 100.0
+        return spread_pct(bid, ask)
 
     def _calc_qty(
         self,
@@ -78,199 +333,390 @@ class BotEngine:
         leverage: int,
         max_margin_pct: float,
     ) -> float:
+        return calc_qty(price, balance, risk_pct, sl_pct, leverage, max_margin_pct)
+
+    # ---------- scheduling ----------
+
+    async def _supervise(self):
         """
-        qty в базовой монете (BTC), грубая оценка:
-        - риск = balance * risk_pct%
-        - стоп = sl_pct% => риск на 1 BTC = price * sl_pct%
-        qty = risk / (price * sl_pct%)
-        ограничение по марже: margin = (qty*price)/leverage <= balance*max_margin_pct%
+        Держит по задаче на каждый символ из Settings.symbol_list().
+        Новые символы подхватываются на лету, удалённые — гасятся.
         """
-        risk_usdt = balance * (risk_pct / 100.0)
-        sl_move = price * (sl_pct / 100.0)
-        if sl_move <= 0:
-            return 0.0
-
-        qty_by_risk = risk_usdt / sl_move
+        # всё, что привязано к loop, — заново на каждый запуск (stop()/start() поднимает новый loop)
+        self._stop_evt = asyncio.Event()
+        self._settings_changed = asyncio.Event()
+        self._reconcile_wake = asyncio.Event()
+        self._sym_locks = {}
+        self._ranked_at = 0.0
+        try:
+            await self.client.open()
+        except Exception as e:
+            self.running = False
+            self._event("ERROR", "LOOP_ERROR", f"exchange connect failed: {e}")
+            self._publish_status()
+            await self.client.close()
+            return
+        ws = getattr(self.client, "ws_streams", True)  # у симулятора стримов нет
+        if MARKET_WS and ws:
+            self.feed = MarketDataFeed(BYBIT_WS_PUBLIC, self.client._market_id, fetch_ohlcv=self._warm_ohlcv)
+            await self.feed.start()
+        if PRIVATE_WS and ws and BYBIT_KEY and BYBIT_SECRET:
+            self.orders = OrderStream(BYBIT_WS_PRIVATE, BYBIT_KEY, BYBIT_SECRET)
+            self.orders.on_terminal = self._on_order_terminal
+            await self.orders.start()
+        self.protect = ProtectionManager(self.client, on_error=self._on_protect_error)
+        try:
+            await self._rebuild()
+        except Exception as e:
+            self._event("ERROR", "LOOP_ERROR", f"portfolio rebuild failed: {e}")
+        reconciler = asyncio.create_task(self._reconcile_loop(), name="bot:reconcile")
+        snapshots = asyncio.create_task(self._snapshot_loop(), name="bot:snapshot")
+        scanner = asyncio.create_task(self._scan_loop(), name="bot:scan")
+        try:
+            while self.running:
+                try:
+                    st = await self._load_settings()
+                    wanted = self._symbols(st)
+                except Exception as e:
+                    self._event("ERROR", "LOOP_ERROR", str(e))
+                    await self._sleep(3)
+                    continue
 
-        max_margin_usdt = balance * (max_margin_pct / 100.0)
-        qty_by_margin = (max_margin_usdt * leverage) / price if price > 0 else 0.0
+                for sym in wanted:
+                    t = self._tasks.get(sym)
+                    if t is None or t.done():
+                        self._state(sym)
+                        self._tasks[sym] = asyncio.create_task(self._run_symbol(sym), name=f"bot:{sym}")
+                for sym in list(self._tasks):
+                    # убранный символ не снимаем посреди цикла: задача выйдет сама на следующей проверке
+                    if sym not in wanted and self._tasks[sym].done():
+                        del self._tasks[sym]
 
-        qty = min(qty_by_risk, qty_by_margin)
-        return float(max(0.0, round(qty, 6)))
+                self._settings_changed.clear()
+                await self._sleep(max(5, int(st.loop_interval_sec)), wake=self._settings_changed)
+        finally:
+            # символы проверяют running только между циклами: начатый вход доходит до сделки и SL/TP,
+            # снимаем лишь тех, кто не уложился в STOP_GRACE_SEC
+            symbols = list(self._tasks.values())
+            self._tasks.clear()
+            if symbols:
+                await asyncio.wait(symbols, timeout=STOP_GRACE_SEC)
+            tasks = [reconciler, snapshots, scanner, *symbols]
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self.protect.close()
+            self.protect = None
+            try:
+                await self._io(self.portfolio.save)
+            except OSError as e:
+                self._event("WARN", "PORTFOLIO_SNAPSHOT_FAIL", str(e))
+            for stream in (self.feed, self.orders):
+                if stream is not None:
+                    await stream.close()
+            self.feed = self.orders = None
+            await self.client.close()
 
-    def _run_loop(self):
+    async def _run_symbol(self, symbol: str):
+        state = self._state(symbol)
         while self.running:
             try:
-                self._reset_daily_if_needed()
+                st = await self._load_settings()
+                if symbol not in self._symbols(st):
+                    return
+                if self.feed is not None:
+                    # подписка на tickers/kline + прогрев буфера свечей
+                    await self.feed.ensure(symbol, st.timeframe, book=st.entry_order_type == "smart")
+                async with self._lock(symbol):
+                    try:
+                        with metrics.cycle(symbol):
+                            await self._cycle(symbol, state, st)
+                    finally:
+                        self.risk.release(symbol, self.portfolio)
+                self._publish_status()
+                await self._sleep(st.loop_interval_sec)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                LOOP_ERRORS.inc(symbol=symbol)
+                self._event("ERROR", "LOOP_ERROR", f"{symbol}: {e}", symbol=symbol)
+                await self._sleep(3)
 
-                with Session(engine) as session:
-                    st = repo.get_or_create_settings(session)
+    # ---------- trading cycle ----------
 
-                # дневной лимит убытка
-                bal = self.client.balance_usdt()
-                if bal > 0 and self.daily_pnl <= -(bal * (st.max_daily_loss_pct / 100.0)):
-                    with Session(engine) as s:
-                        repo.add_event(s, "WARN", "DAILY_LOSS_LIMIT", "Daily loss limit reached, bot paused")
-                    time.sleep(st.loop_interval_sec)
-                    continue
+    async def _cycle(self, symbol: str, state: SymbolState, st):
+        now = self._utcnow()
+        state.reset_daily_if_needed(now)
 
-                if self.trades_today >= st.max_trades_per_day:
-                    time.sleep(st.loop_interval_sec)
-                    continue
+        # открытая сделка и баланс — из портфеля в памяти (баланс с TTL)
+        with stage("prefetch"):
+            bal = await self._balance()
+        open_t = self.portfolio.open_trade(symbol)
 
-                if not self._cooldown_ok(st.cooldown_minutes):
-                    time.sleep(st.loop_interval_sec)
-                    continue
+        # дневной лимит убытка (общий по всем символам и шардам — это лимит аккаунта)
+        if bal > 0 and self.risk.daily_pnl(self.portfolio) <= -(bal * (st.max_daily_loss_pct / 100.0)):
+            metrics.skip("DAILY_LOSS", symbol)
+            self._event("WARN", "DAILY_LOSS_LIMIT", "Daily loss limit reached, bot paused")
+            return
 
-                # open trade?
-                with Session(engine) as session:
-                    open_t = repo.get_open_trade(session, st.symbol)
+        if state.trades_today >= st.max_trades_per_day:
+            metrics.skip("MAX_TRADES", symbol)
+            return
 
-                if open_t:
-                    self._manage_open_trade(open_t, st)
-                    time.sleep(st.loop_interval_sec)
-                    continue
+        if not state.cooldown_ok(st.cooldown_minutes, now):
+            metrics.skip("COOLDOWN", symbol)
+            return
 
-                # сигнал
-                ohlcv = self.client.ohlcv(st.symbol, st.timeframe, limit=200)
-                closes = [float(c[4]) for c in ohlcv]
-                signal = decide_signal(closes)
-                if signal == "HOLD":
-                    time.sleep(st.loop_interval_sec)
-                    continue
+        if open_t:
+            metrics.outcome("MANAGE")
+            with stage("manage"):
+                await self._manage_open_trade(open_t, state, st)
+            return
 
-                tick = self.client.ticker(st.symbol)
-                bid, ask, last = float(tick["bid"]), float(tick["ask"]), float(tick["last"])
+        # сигнал
+        if st.scan_top_n > 0:
+            # рынок уже отранжирован сканером — входим, только если символ в top-N
+            cand = self._candidate(symbol, st)
+            if cand is None:
+                metrics.skip("NOT_RANKED", symbol)
+                return
+            signal = cand.signal
+        else:
+            with stage("ohlcv"):
+                ohlcv = await self._ohlcv(symbol, st.timeframe)
+            with stage("signal"):
+                sig = self._signals.get((symbol, st.timeframe))
+                if sig is None:
+                    sig = self._signals[(symbol, st.timeframe)] = SignalState()
+                sig.sync(ohlcv)  # только новые/изменённые свечи, индикаторы O(1) на свечу
+                signal = decide(sig)
+        if signal == "HOLD":
+            metrics.skip("HOLD", symbol)
+            return
+        t_signal = time.perf_counter()
 
-                # spread filter
-                sp = self._spread_pct(bid, ask)
-                if sp > float(st.max_spread_pct):
-                    with Session(engine) as s:
-                        repo.add_event(s, "INFO", "SPREAD_SKIP", f"Spread {sp:.4f}% > {st.max_spread_pct}%")
-                    time.sleep(st.loop_interval_sec)
-                    continue
+        with stage("quote"):
+            tick, balance = await asyncio.gather(self._ticker(symbol), self._balance())
+        bid, ask, last = float(tick["bid"]), float(tick["ask"]), float(tick["last"])
 
-                # leverage (если уже такое — может ругаться, у тебя в client это уже обработано)
-                self.client.set_leverage(st.symbol, int(st.leverage))
+        # spread filter
+        sp = self._spread_pct(bid, ask)
+        if sp > float(st.max_spread_pct):
+            metrics.skip("SPREAD_SKIP", symbol)
+            self._event("INFO", "SPREAD_SKIP", f"{symbol}: spread {sp:.4f}% > {st.max_spread_pct}%", symbol=symbol)
+            return
 
-                balance = self.client.balance_usdt()
-                price_expected = last
-                qty = self._calc_qty(price_expected, balance, st.risk_pct, st.sl_pct, st.leverage, st.max_margin_pct)
-                if qty <= 0:
-                    with Session(engine) as s:
-                        repo.add_event(s, "WARN", "QTY_ZERO", "Qty=0; check balance/settings")
-                    time.sleep(st.loop_interval_sec)
-                    continue
+        # после stop() цикл дорабатывает только начатое: новых входов не открываем
+        if not self.running:
+            return
+
+        # слот под новую позицию (max_open_trades на аккаунт); отпускается после цикла
+        if not await self.risk.acquire(symbol, st, self.portfolio):
+            metrics.skip("MAX_OPEN", symbol)
+            return
+
+        # leverage (если уже такое — может ругаться, у тебя в client это уже обработано)
+        with stage("set_leverage"):
+            await self.client.set_leverage(symbol, int(st.leverage))
 
-                side = "buy" if signal == "BUY" else "sell"
-                entry_price_ref = ask if side == "buy" else bid
+        price_expected = last
+        qty = self._calc_qty(price_expected, balance, st.risk_pct, st.sl_pct, st.leverage, st.max_margin_pct)
+        if qty <= 0:
+            metrics.skip("QTY_ZERO", symbol)
+            self._event("WARN", "QTY_ZERO", f"{symbol}: qty=0; check balance/settings", symbol=symbol)
+            return
 
-                # предварительные SL/TP от reference (потом поправим по fill_avg)
-                sl = entry_price_ref * (1 - st.sl_pct / 100.0) if side == "buy" else entry_price_ref * (1 + st.sl_pct / 100.0)
-                tp = entry_price_ref * (1 + st.tp_pct / 100.0) if side == "buy" else entry_price_ref * (1 - st.tp_pct / 100.0)
+        side = "buy" if signal == "BUY" else "sell"
+        entry_price_ref = ask if side == "buy" else bid
 
-                # ---------- ENTRY EXECUTION ----------
-                entry_order = None
-                waited = None  # важно: чтобы не было UnboundLocalError
-                fill_avg = None
-                fee_cost = None
+        # ---------- ENTRY EXECUTION ----------
+        entry_order = None
+        fill_avg = None
+        fee_cost = None
+        res = ExecResult(side, qty, bid, ask)  # fill quality (таблица Execution)
+        cancelled = False
 
-                if st.entry_order_type == "market":
-                    entry_order = self.client.create_market(st.symbol, side, qty)
-                    # market: пытаемся извлечь fill из ответа create_market
+        if st.entry_order_type == "smart":
+            # лимитка по стакану с перестановкой и нарезкой, остаток — market (если разрешено)
+            ex = LimitExecutor(
+                self.client, symbol, side, qty, book=self._book, order_state=self._order_state,
+                post_only=bool(st.post_only), timeout_sec=float(st.entry_timeout_sec),
+                max_spread_pct=float(st.max_spread_pct), max_slippage_pct=float(st.max_slippage_pct),
+                reprice_sec=float(st.exec_reprice_sec), child_depth_pct=float(st.exec_child_depth_pct),
+                levels=EXEC_BOOK_LEVELS,
+            )
+            with stage("entry_exec"):
+                try:
+                    res = await ex.run()
+                except asyncio.CancelledError:
+                    # отменили посреди входа: исполненное уже позиция на бирже — дописываем сделку и SL/TP,
+                    # отмену пробрасываем в конце цикла
+                    if ex.result is None or ex.result.filled <= 0:
+                        raise
+                    res, cancelled = ex.result, True
+            if res.first_ack is not None:
+                SIGNAL_TO_ORDER.observe(res.first_ack - t_signal)
+            rest = res.remaining
+            r = getattr(self.client, "round_qty", None)
+            if r is not None:
+                rest = r(symbol, rest)
+            # цена ушла за max_slippage_pct — market не догоняем
+            if rest > 0 and st.allow_market_fallback and res.outcome not in ("SLIPPAGE", "CANCELLED"):
+                with stage("entry_fallback"):
+                    mo = await self.client.create_market(symbol, side, rest)
+                p0 = self.client.parse_fill(mo or {})
+                res.add_market((mo or {}).get("id"), rest, float(p0.get("average") or entry_price_ref), p0.get("fee_cost"))
+            res.duration = time.perf_counter() - res.t0
+            execution.record("smart", res)
+            if res.filled <= 0:
+                await self._io(self._save_execution, symbol, "smart", res, None)
+                metrics.skip("ENTRY_TIMEOUT", symbol)
+                self._event("INFO", "ENTRY_TIMEOUT", f"Smart entry not filled ({res.outcome}); {symbol} side={side} qty={qty}", symbol=symbol)
+                return
+            qty = res.filled
+            fill_avg = res.avg
+            fee_cost = res.fee
+            entry_order = {"id": res.last_order_id}
+        elif st.entry_order_type == "market":
+            with stage("entry_order"):
+                entry_order = await self.client.create_market(symbol, side, qty)
+            SIGNAL_TO_ORDER.observe(time.perf_counter() - t_signal)
+            # market: пытаемся извлечь fill из ответа create_market
+            p0 = self.client.parse_fill(entry_order or {})
+            fill_avg = p0.get("average")
+            fee_cost = p0.get("fee_cost")
+            res.taker_qty = qty
+        else:
+            # limit entry near best price
+            limit_price = entry_price_ref
+            with stage("entry_order"):
+                entry_order = await self.client.create_limit(symbol, side, qty, limit_price, post_only=False)
+            SIGNAL_TO_ORDER.observe(time.perf_counter() - t_signal)
+            res.orders = 1
+
+            with stage("wait_fill"):
+                waited = await self._wait_fill(symbol, entry_order["id"], int(st.entry_timeout_sec))
+            parsed_waited = self.client.parse_fill(waited or {})
+            status = (parsed_waited.get("status") or "").lower()
+
+            if status not in ("closed", "filled"):
+                # cancel and maybe fallback
+                try:
+                    await self.client.cancel_order(entry_order["id"], symbol)
+                except Exception:
+                    pass
+
+                if st.allow_market_fallback:
+                    with stage("entry_fallback"):
+                        entry_order = await self.client.create_market(symbol, side, qty)
                     p0 = self.client.parse_fill(entry_order or {})
                     fill_avg = p0.get("average")
                     fee_cost = p0.get("fee_cost")
+                    res.taker_qty = qty
                 else:
-                    # limit entry near best price
-                    limit_price = entry_price_ref
-                    entry_order = self.client.create_limit(st.symbol, side, qty, limit_price, post_only=False)
-
-                    waited = self.client.wait_fill(st.symbol, entry_order["id"], int(st.entry_timeout_sec))
-                    parsed_waited = self.client.parse_fill(waited or {})
-                    status = (parsed_waited.get("status") or "").lower()
-
-                    if status not in ("closed", "filled"):
-                        # cancel and maybe fallback
-                        try:
-                            self.client.cancel_order(entry_order["id"], st.symbol)
-                        except Exception:
-                            pass
-
-                        if st.allow_market_fallback:
-                            entry_order = self.client.create_market(st.symbol, side, qty)
-                            p0 = self.client.parse_fill(entry_order or {})
-                            fill_avg = p0.get("average")
-                            fee_cost = p0.get("fee_cost")
-                        else:
-                            with Session(engine) as s:
-                                repo.add_event(s, "INFO", "ENTRY_TIMEOUT", f"Limit entry timeout; canceled. side={side} qty={qty}")
-                            time.sleep(st.loop_interval_sec)
-                            continue
-                    else:
-                        # limit filled: берём фактический average/fee из waited
-                        fill_avg = parsed_waited.get("average")
-                        fee_cost = parsed_waited.get("fee_cost")
-
-                # ---- IMPORTANT FIX: НЕ используем fetch_order() ----
-                # fallback если биржа не дала average
-                if not fill_avg:
-                    fill_avg = entry_price_ref
-
-                # slippage check
-                slip = abs(float(fill_avg) - entry_price_ref) / entry_price_ref * 100.0 if entry_price_ref > 0 else 0.0
-                if slip > float(st.max_slippage_pct):
-                    with Session(engine) as s:
-                        repo.add_event(s, "WARN", "SLIPPAGE_HIGH", f"slippage={slip:.4f}% > {st.max_slippage_pct}% (still keeping trade)")
-
-                # adjust SL/TP based on real fill
-                sl = float(fill_avg) * (1 - st.sl_pct / 100.0) if side == "buy" else float(fill_avg) * (1 + st.sl_pct / 100.0)
-                tp = float(fill_avg) * (1 + st.tp_pct / 100.0) if side == "buy" else float(fill_avg) * (1 - st.tp_pct / 100.0)
-
-                with Session(engine) as session:
-                    t = Trade(
-                        symbol=st.symbol,
-                        side=side,
-                        qty=qty,
-                        entry=float(fill_avg),
-                        sl=float(sl),
-                        tp=float(tp),
-                        status="OPEN",
-                        entry_order_id=str(entry_order["id"]) if entry_order and entry_order.get("id") is not None else None,
-                        entry_avg_fill=float(fill_avg) if fill_avg else None,
-                        entry_fee_usdt=float(fee_cost) if fee_cost is not None else None,
-                    )
-                    repo.add_trade(session, t)
-                    repo.add_event(session, "INFO", "TRADE_OPENED", f"{side} {st.symbol} qty={qty} entry={fill_avg} sl={sl} tp={tp}")
-
-                # place exchange SL/TP (recommended for real)
-                if st.use_exchange_sl_tp:
-                    try:
-                        self.client.set_trading_stop(st.symbol, stop_loss=sl, take_profit=tp)
-                        with Session(engine) as s:
-                            repo.add_event(s, "INFO", "EXCHANGE_TPSL_SET", f"Exchange SL/TP set: sl={sl} tp={tp}")
-                    except Exception as e:
-                        with Session(engine) as s:
-                            repo.add_event(s, "WARN", "EXCHANGE_TPSL_FAIL", str(e))
+                    res.outcome = "TIMEOUT"
+                    res.duration = time.perf_counter() - res.t0
+                    execution.record(st.entry_order_type, res)
+                    await self._io(self._save_execution, symbol, st.entry_order_type, res, None)
+                    metrics.skip("ENTRY_TIMEOUT", symbol)
+                    self._event("INFO", "ENTRY_TIMEOUT", f"Limit entry timeout; canceled. {symbol} side={side} qty={qty}", symbol=symbol)
+                    return
+            else:
+                # limit filled: берём фактический average/fee из waited
+                fill_avg = parsed_waited.get("average")
+                fee_cost = parsed_waited.get("fee_cost")
+                res.maker_qty = qty
 
-                self.last_trade_time = datetime.utcnow()
-                self.trades_today += 1
+        # ---- IMPORTANT FIX: НЕ используем fetch_order() ----
+        # fallback если биржа не дала average
+        if not fill_avg:
+            fill_avg = entry_price_ref
+        if st.entry_order_type != "smart":
+            res.orders += 1 if res.taker_qty else 0
+            res.filled, res.cost, res.fee = qty, qty * float(fill_avg), float(fee_cost or 0.0)
+            res.outcome = "FILLED"
+            res.duration = time.perf_counter() - res.t0
+            execution.record(st.entry_order_type, res)
 
-                # reset trailing state
-                self.best_price = None
+        # slippage check
+        slip = abs(float(fill_avg) - entry_price_ref) / entry_price_ref * 100.0 if entry_price_ref > 0 else 0.0
+        if slip > float(st.max_slippage_pct):
+            self._event("WARN", "SLIPPAGE_HIGH", f"{symbol}: slippage={slip:.4f}% > {st.max_slippage_pct}% (still keeping trade)", symbol=symbol)
 
-            except Exception as e:
-                with Session(engine) as s:
-                    repo.add_event(s, "ERROR", "LOOP_ERROR", str(e))
-                time.sleep(3)
+        # SL/TP от реального fill
+        sl = float(fill_avg) * (1 - st.sl_pct / 100.0) if side == "buy" else float(fill_avg) * (1 + st.sl_pct / 100.0)
+        tp = float(fill_avg) * (1 + st.tp_pct / 100.0) if side == "buy" else float(fill_avg) * (1 - st.tp_pct / 100.0)
+
+        def _save():
+            with DB_WRITE.time(op="open_trade"), Session(engine, expire_on_commit=False) as session:  # сделка живёт в портфеле
+                t = Trade(
+                    ts=opened_at,
+                    symbol=symbol,
+                    side=side,
+                    qty=qty,
+                    entry=float(fill_avg),
+                    sl=float(sl),
+                    tp=float(tp),
+                    status="OPEN",
+                    entry_order_id=str(entry_order["id"]) if entry_order and entry_order.get("id") is not None else None,
+                    entry_avg_fill=float(fill_avg) if fill_avg else None,
+                    entry_fee_usdt=float(fee_cost) if fee_cost is not None else None,
+                )
+                repo.add_trade(session, t)
+                self._save_execution(symbol, st.entry_order_type, res, t.id, session)
+                repo.add_event(session, "INFO", "TRADE_OPENED", f"{side} {symbol} qty={qty} entry={fill_avg} sl={sl} tp={tp}", symbol)
+                return t
+        opened_at = self._utcnow()
+        with stage("db_save"):
+            trade = await self._io(_save)
+        self.portfolio.on_open(trade, opened_at)
+        metrics.outcome("ENTRY")
+
+        # place exchange SL/TP (recommended for real)
+        if self._exchange_protect(st):
+            want = {"stop_loss": sl, "take_profit": tp}
+            if st.exit_mode == "exchange" and st.trailing_enabled and st.native_trailing:
+                # трейлит сама биржа: дистанция в цене + цена активации
+                act = float(st.trailing_activation_pct) / 100.0
+                want["trailing_stop"] = float(fill_avg) * float(st.trailing_pct) / 100.0
+                want["active_price"] = float(fill_avg) * (1 + act if side == "buy" else 1 - act)
+            self.protect.request(symbol, **want)
+            with stage("tpsl"):
+                ok = await self.protect.flush(symbol)
+            if ok:
+                def _mark():
+                    with Session(engine) as session:
+                        return repo.update_trade(session, trade.id, exchange_tpsl_set=True, tpsl_set_ts=self._utcnow())
+                self.portfolio.on_update(await self._io(_mark))
+                self._event("INFO", "EXCHANGE_TPSL_SET", f"{symbol}: exchange SL/TP set: sl={sl} tp={tp}", symbol=symbol)
+            else:
+                self._event("WARN", "EXCHANGE_TPSL_FAIL", f"{symbol}: SL/TP not confirmed, reconcile will retry", symbol=symbol)
+        if cancelled:
+            raise asyncio.CancelledError
+
+    @staticmethod
+    def _save_execution(symbol: str, mode: str, res: ExecResult, trade_id: int | None, session: Session | None = None):
+        x = Execution(symbol=symbol, mode=mode, trade_id=trade_id, **res.stats())
+        if session is not None:
+            repo.add_execution(session, x)
+            return
+        with DB_WRITE.time(op="execution"), Session(engine) as session:
+            repo.add_execution(session, x)
+
+    async def _manage_open_trade(self, t: Trade, state: SymbolState, st):
+        exchange_mode = st.exit_mode == "exchange"
+        if exchange_mode and (not st.trailing_enabled or st.native_trailing):
+            return  # SL/TP/трейл целиком на бирже, закрытие подберёт реконсиляция
 
-    def _manage_open_trade(self, t: Trade, st):
-        tick = self.client.ticker(t.symbol)
+        tick = await self._ticker(t.symbol)
         price = float(tick["last"])
 
-        # trailing logic (soft)
+        # trailing logic (soft); с биржевыми SL/TP новый SL уходит amend'ом
         if st.trailing_enabled:
-            self._apply_trailing(t, st, price)
+            await self._apply_trailing(t, state, st, price)
+
+        if exchange_mode:
+            return
 
         hit_tp = price >= t.tp if t.side == "buy" else price <= t.tp
         hit_sl = price <= t.sl if t.side == "buy" else price >= t.sl
@@ -286,50 +732,296 @@ class BotEngine:
 
         # close by opposite market
         close_side = "sell" if t.side == "buy" else "buy"
-        self.client.create_market(t.symbol, close_side, t.qty)
+        with stage("exit_order"):
+            await self.client.create_market(t.symbol, close_side, t.qty)
 
-        with Session(engine) as session:
-            repo.update_trade(session, t.id, exit_price=exit_price, pnl_usdt=pnl, status="CLOSED")
-            reason = "TP" if hit_tp else "SL"
-            repo.add_event(session, "INFO", "TRADE_CLOSED", f"{reason} {t.symbol} exit={exit_price} pnl={pnl:.4f}")
+        def _close():
+            with DB_WRITE.time(op="close_trade"), Session(engine) as session:
+                repo.update_trade(session, t.id, exit_price=exit_price, pnl_usdt=pnl, status="CLOSED")
+                reason = "TP" if hit_tp else "SL"
+                repo.add_event(session, "INFO", "TRADE_CLOSED", f"{reason} {t.symbol} exit={exit_price} pnl={pnl:.4f}", t.symbol)
+        with stage("db_close"):
+            await self._io(_close)
+        metrics.outcome("CLOSE")
+        if self.protect is not None:
+            self.protect.forget(t.symbol)
+        self.portfolio.on_close(t, pnl)
 
-        self.daily_pnl += float(pnl)
-
-    def _apply_trailing(self, t: Trade, st, price: float):
+    async def _apply_trailing(self, t: Trade, state: SymbolState, st, price: float):
         """
         Soft trailing:
         - activates after profit >= trailing_activation_pct
         - keeps SL trailing_pct behind best price
         """
+        best = state.best_price
+        new_sl = self._trailing_sl(t, state, st, price)
+        if state.best_price != best:
+            self.portfolio.dirty = True  # best_price есть только в памяти — попадёт в снимок
+        if new_sl is None:
+            return
+
+        def _update():
+            with DB_WRITE.time(op="trail_sl"), Session(engine) as session:
+                repo.update_trade(session, t.id, sl=float(new_sl))
+        await self._io(_update)
+        t.sl = float(new_sl)
+        if self._exchange_protect(st) and self.protect is not None:
+            self.protect.request(t.symbol, stop_loss=new_sl)  # частые подтяжки схлопнутся в один amend
+        self._event("INFO", "TRAIL_SL_UPDATED", f"{t.symbol}: SL -> {new_sl:.2f}", symbol=t.symbol)
+
+    @staticmethod
+    def _trailing_sl(t: Trade, state: SymbolState, st, price: float) -> float | None:
+        """Новый SL, если трейл его подтянул; иначе None."""
         if t.side == "buy":
             profit_pct = (price - t.entry) / t.entry * 100.0
             if profit_pct < float(st.trailing_activation_pct):
-                return
+                return None
 
             # best price = max
-            if self.best_price is None or price > self.best_price:
-                self.best_price = price
+            if state.best_price is None or price > state.best_price:
+                state.best_price = price
+
+            new_sl = state.best_price * (1 - float(st.trailing_pct) / 100.0)
+            return new_sl if new_sl > t.sl else None
+
+        profit_pct = (t.entry - price) / t.entry * 100.0
+        if profit_pct < float(st.trailing_activation_pct):
+            return None
+
+        # best price = min
+        if state.best_price is None or price < state.best_price:
+            state.best_price = price
+
+        new_sl = state.best_price * (1 + float(st.trailing_pct) / 100.0)
+        return new_sl if new_sl < t.sl else None
+
+    # ---------- market scanner ----------
+
+    SCAN_WINDOW = 200  # свечей на символ в матрице сканера (как окно SignalState)
+
+    def candidates(self) -> list[dict]:
+        items = sorted(self._ranked.values(), key=lambda c: -c.score)
+        return [c.__dict__ for c in items]
+
+    def _candidate(self, symbol: str, st) -> Candidate | None:
+        # ранжирование старше двух интервалов — не доверяем (сканер отстал/упал)
+        if asyncio.get_running_loop().time() - self._ranked_at > 2 * max(5, int(st.loop_interval_sec)):
+            return None
+        return self._ranked.get(symbol)
+
+    async def _scan_loop(self):
+        while self.running:
+            interval = 5
+            try:
+                st = await self._load_settings()
+                interval = max(1, int(st.loop_interval_sec))
+                if st.scan_top_n > 0:
+                    with stage("scan"):
+                        await self._scan(st)
+                else:
+                    self._ranked = {}
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                LOOP_ERRORS.inc(symbol="scan")
+                self._event("ERROR", "LOOP_ERROR", f"scan: {e}")
+            await self._sleep(interval)
+
+    async def _scan(self, st):
+        """Свечи и тикеры всех symbols (шарда) -> одна матрица close -> top-N BUY/SELL (app/scanner.py)."""
+        symbols = self._symbols(st)
+        rows = await asyncio.gather(*(self._ohlcv(s, st.timeframe) for s in symbols), return_exceptions=True)
+        closes = stack_closes(
+            [() if isinstance(r, BaseException) else (r.closes() if hasattr(r, "closes") else [x[4] for x in r]) for r in rows],
+            self.SCAN_WINDOW,
+        )
+        ticks = {s: self.feed.ticker(s) for s in symbols} if self.feed is not None else {}
+        if not ticks or any(t is None or t.get("quote_volume") is None for t in ticks.values()):
+            ticks = await self.client.tickers(symbols)  # одним запросом на весь список
+        tick = [ticks.get(s) or {} for s in symbols]
+        cands = scan(
+            symbols, closes,
+            bid=np.array([float(t.get("bid") or 0) for t in tick]),
+            ask=np.array([float(t.get("ask") or 0) for t in tick]),
+            volume_usdt=np.array([float(t.get("quote_volume") or 0) for t in tick]),
+            max_spread_pct=float(st.max_spread_pct),
+            min_volume_usdt=float(st.scan_min_volume_usdt),
+            top=int(st.scan_top_n),
+        )
+        self._ranked = {c.symbol: c for c in cands}
+        self._ranked_at = asyncio.get_running_loop().time()
+
+    # ---------- exchange-side exits ----------
 
-            new_sl = self.best_price * (1 - float(st.trailing_pct) / 100.0)
-            if new_sl > t.sl:
-                with Session(engine) as session:
-                    repo.update_trade(session, t.id, sl=float(new_sl))
-                    repo.add_event(session, "INFO", "TRAIL_SL_UPDATED", f"SL -> {new_sl:.2f}")
+    def _on_protect_error(self, symbol: str, e: Exception):
+        self._event("WARN", "EXCHANGE_TPSL_FAIL", f"{symbol}: {e}", symbol=symbol)
+        self._wake_reconcile()  # "zero position" и т.п. — скорее всего позиция уже закрыта биржей
 
+    async def _reconcile_loop(self):
+        """
+        Сверка OPEN-сделок с позициями биржи, пока SL/TP стоят на бирже:
+        раз в reconcile_interval_sec или сразу, когда стрим сообщил о закрытии
+        reduce-only/стоп-ордера (или amend ответил, что позиции нет).
+        """
+        while self.running:
+            interval = 5
+            try:
+                st = await self._load_settings()
+                interval = max(1, int(st.reconcile_interval_sec))
+                self._reconcile_wake.clear()
+                if self._exchange_protect(st):
+                    with stage("reconcile"):
+                        await self._reconcile(st)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                LOOP_ERRORS.inc(symbol="reconcile")
+                self._event("ERROR", "LOOP_ERROR", f"reconcile: {e}")
+            await self._sleep(interval, wake=self._reconcile_wake)
+
+    async def _reconcile(self, st, heal: bool = True):
+        trades = self.portfolio.open_trades()
+        symbols = sorted({t.symbol for t in trades} | set(self._symbols(st)))
+        if not symbols:
+            return
+        positions = await self.client.positions(symbols)
+
+        async def _one(t: Trade):
+            async with self._lock(t.symbol):
+                cur = self.portfolio.open_trade(t.symbol)
+                if cur is None or cur.id != t.id:
+                    return  # цикл символа успел закрыть её сам
+                pos = positions.get(t.symbol)
+                qty = pos["qty"] if pos else 0.0
+                if qty and (qty > 0) == (t.side == "buy"):
+                    if heal:
+                        self._heal_protection(t, pos, st)
+                else:
+                    await self._close_from_exchange(t)
+
+        await asyncio.gather(*(_one(t) for t in trades))
+
+        tracked = {t.symbol for t in trades}
+        for sym in positions:
+            if not self._owns(sym):
+                continue  # позиция другого шарда
+            if sym not in tracked and sym not in self._untracked:
+                self._untracked.add(sym)
+                self._event("WARN", "POSITION_UNTRACKED", f"{sym}: exchange position qty={positions[sym]['qty']} has no OPEN trade", symbol=sym)
+        self._untracked &= set(positions)
+
+    async def _rebuild(self):
+        """
+        Портфель после рестарта: OPEN-сделки и дневные счётчики — из Trade,
+        трейлинг — из снимка; затем сверка с позициями биржи (сделки, чьих
+        позиций уже нет, закрываются по исполнениям).
+        """
+        now = self._utcnow()
+        day_start = datetime.combine(now.date(), dtime.min)
+        since = day_start - timedelta(days=1)  # вчера — для кулдауна через полночь
+
+        def _load():
+            with Session(engine) as session:
+                # + закрытые сегодня, но открытые раньше: их pnl — в дневном лимите убытка
+                return repo.list_open_trades(session), repo.trades_since(session, since, closed_from=day_start)
+        open_trades, recent = await self._io(_load)
+        open_trades = [t for t in open_trades if self._owns(t.symbol)]
+        recent = [t for t in recent if self._owns(t.symbol)]
+        await self._io(self.portfolio.rebuild, open_trades, recent, now)
+        if hasattr(self.client, "positions"):
+            st = await self._load_settings()
+            await self._reconcile(st, heal=self._exchange_protect(st))
+        self._event("INFO", "PORTFOLIO_REBUILT", f"{len(open_trades)} open trades, {len(recent)} since {since.date()}")
+        self._publish_status()
+
+    async def _snapshot_loop(self):
+        while self.running:
+            await self._sleep(PORTFOLIO_SNAPSHOT_SEC)
+            if self.portfolio.dirty:
+                try:
+                    await self._io(self.portfolio.save)
+                except OSError as e:
+                    self._event("WARN", "PORTFOLIO_SNAPSHOT_FAIL", str(e))
+
+    def _heal_protection(self, t: Trade, pos: dict, st):
+        """Позиция жива: если SL/TP на бирже пропали или расходятся со сделкой — ставим заново."""
+        if self.protect.pending(t.symbol):
+            return
+        native = st.exit_mode == "exchange" and st.trailing_enabled and st.native_trailing
+        want = {"stop_loss": t.sl, "take_profit": t.tp}
+        if native and pos.get("sl"):
+            want.pop("stop_loss")  # SL двигает сама биржа
+        r = getattr(self.client, "round_price", None)
+        have = {"stop_loss": pos.get("sl"), "take_profit": pos.get("tp")}
+        stale = {k: v for k, v in want.items() if have[k] != (r(t.symbol, v) if r else v)}
+        if not stale:
+            return
+        self.protect.forget(t.symbol)  # то, что мы «отправляли», биржа не держит — забываем
+        self.protect.request(t.symbol, **stale)
+        self._event("WARN", "EXCHANGE_TPSL_HEAL", f"{t.symbol}: re-sending {sorted(stale)} (exchange sl={have['stop_loss']} tp={have['take_profit']})", symbol=t.symbol)
+
+    async def _close_from_exchange(self, t: Trade):
+        """
+        Позиции по сделке на бирже больше нет: цена выхода, комиссия и причина —
+        из исполнений после открытия (stopOrderType), без них — по текущей цене.
+        """
+        since = int(t.ts.replace(tzinfo=timezone.utc).timestamp() * 1000) - 60_000
+        close_side = "sell" if t.side == "buy" else "buy"
+        fills = [
+            f for f in await self.client.my_trades(t.symbol, since)
+            if f["side"] == close_side and f["order_id"] != (t.entry_order_id or "")
+        ]
+        qty = sum(f["qty"] for f in fills)
+        if qty > 0:
+            exit_price = sum(f["price"] * f["qty"] for f in fills) / qty
+            fee = sum(f["fee"] for f in fills)
+            last = fills[-1]
+            reason = _STOP_REASON.get(last.get("stop_type") or "", "EXCHANGE")
+            exit_order_id = last["order_id"]
         else:
-            profit_pct = (t.entry - price) / t.entry * 100.0
-            if profit_pct < float(st.trailing_activation_pct):
-                return
+            exit_price = float((await self._ticker(t.symbol))["last"])
+            fee, reason, exit_order_id = None, "RECONCILED", None
+
+        pnl = (exit_price - t.entry) * t.qty
+        if t.side == "sell":
+            pnl = -pnl
+
+        def _close():
+            with DB_WRITE.time(op="close_trade"), Session(engine) as session:
+                repo.update_trade(
+                    session, t.id, exit_price=exit_price, exit_avg_fill=exit_price if qty > 0 else None,
+                    exit_fee_usdt=fee, exit_order_id=exit_order_id, exit_reason=reason,
+                    pnl_usdt=pnl, status="CLOSED",
+                )
+                repo.add_event(session, "INFO", "TRADE_CLOSED", f"{reason} {t.symbol} exit={exit_price} pnl={pnl:.4f} (exchange)", t.symbol)
+        await self._io(_close)
+        self.protect.forget(t.symbol)
+        self.portfolio.on_close(t, pnl)
+        self._publish_status()
+
+
+def _make_client():
+    if EXCHANGE == "sim":
+        # бумажная торговля на записанных свечах (см. app/exchange/sim.py)
+        from app.exchange.sim import SimExchange
+
+        return SimExchange.from_store(
+            SIM_SYMBOLS, SIM_TIMEFRAME, start=SIM_START, speed=SIM_SPEED, balance=SIM_BALANCE,
+            latency_ms=SIM_LATENCY_MS, seed=SIM_SEED,
+        )
+    return AsyncBybitClient()
+
 
-            # best price = min
-            if self.best_price is None or price < self.best_price:
-                self.best_price = price
+def _default_engine() -> BotEngine:
+    if EXCHANGE == "sim":
+        # свой временный OHLCVStore/снимок портфеля, чтобы sim не трогал настоящую историю и риск-состояние
+        tmp = tempfile.mkdtemp(prefix="sim-")
+        return BotEngine(store=OHLCVStore(tmp),
+                         portfolio=Portfolio(os.path.join(tmp, "portfolio.json"), BALANCE_TTL_SEC))
+    return BotEngine()
 
-            new_sl = self.best_price * (1 + float(st.trailing_pct) / 100.0)
-            if new_sl < t.sl:
-                with Session(engine) as session:
-                    repo.update_trade(session, t.id, sl=float(new_sl))
-                    repo.add_event(session, "INFO", "TRAIL_SL_UPDATED", f"SL -> {new_sl:.2f}")
 
+bot = _default_engine()
 
-bot = BotEngine()
+Gauge("bot_running", "1 if the engine loop is running", fn=lambda: float(bot.running))
+Gauge("bot_symbol_tasks", "Per-symbol tasks alive in the engine", fn=lambda: len(bot._tasks))
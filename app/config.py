@@ -12,3 +12,106 @@ TESTNET = TESTNET_RAW in ("1", "true", "yes", "y", "on")
 if not BYBIT_KEY or not BYBIT_SECRET:
     # Не падаем жёстко, просто предупреждение будет в /health
     pass
+
+# сколько потоков под блокирующие вызовы БД движка
+ENGINE_WORKERS = int(os.getenv("ENGINE_WORKERS", "8"))
+
+# пул HTTP-соединений async-клиента биржи
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "32"))
+
+# публичный WebSocket Bybit v5 (tickers/kline) вместо REST-поллинга цен
+MARKET_WS = os.getenv("MARKET_WS", "true").strip().lower() in ("1", "true", "yes", "y", "on")
+BYBIT_WS_PUBLIC = os.getenv(
+    "BYBIT_WS_PUBLIC",
+    "wss://stream-testnet.bybit.com/v5/public/linear" if TESTNET else "wss://stream.bybit.com/v5/public/linear",
+).strip()
+
+# приватный WebSocket (order/execution) для мгновенного детекта fill'ов
+PRIVATE_WS = os.getenv("PRIVATE_WS", "true").strip().lower() in ("1", "true", "yes", "y", "on")
+BYBIT_WS_PRIVATE = os.getenv(
+    "BYBIT_WS_PRIVATE",
+    "wss://stream-testnet.bybit.com/v5/private" if TESTNET else "wss://stream.bybit.com/v5/private",
+).strip()
+
+# локальные данные: история свечей и т.п.
+DATA_DIR = os.getenv("DATA_DIR", "data").strip()
+
+# события: пакетная запись в БД (write-behind)
+EVENT_FLUSH_MS = int(os.getenv("EVENT_FLUSH_MS", "250"))
+EVENT_BATCH = int(os.getenv("EVENT_BATCH", "500"))
+EVENT_QUEUE = int(os.getenv("EVENT_QUEUE", "10000"))
+# шум: EVENT_DROP="TYPE,TYPE" — не писать вовсе; EVENT_SAMPLE="SPREAD_SKIP=10,TRAIL_SL_UPDATED=5" — писать 1 из N
+EVENT_DROP = {x.strip() for x in os.getenv("EVENT_DROP", "").split(",") if x.strip()}
+EVENT_SAMPLE = {
+    k.strip(): int(v)
+    for k, _, v in (x.partition("=") for x in os.getenv("EVENT_SAMPLE", "").split(",") if "=" in x)
+}
+# ретеншн событий: раз в EVENT_RETENTION_SEC (0 — выкл.) одинаковые события старше
+# EVENT_COMPACT_AFTER_SEC схлопываются в строку с count (в пределах окна EVENT_COMPACT_BUCKET_SEC),
+# старше EVENT_ARCHIVE_AFTER_DAYS — уезжают в gzip-сегменты {EVENT_ARCHIVE_DIR}/events-YYYY-MM-DD.jsonl.gz,
+# сегменты старше EVENT_ARCHIVE_KEEP_DAYS удаляются (0 — хранить всегда)
+EVENT_RETENTION_SEC = float(os.getenv("EVENT_RETENTION_SEC", "3600"))
+EVENT_COMPACT_AFTER_SEC = float(os.getenv("EVENT_COMPACT_AFTER_SEC", "3600"))
+EVENT_COMPACT_BUCKET_SEC = float(os.getenv("EVENT_COMPACT_BUCKET_SEC", "3600"))
+EVENT_ARCHIVE_AFTER_DAYS = float(os.getenv("EVENT_ARCHIVE_AFTER_DAYS", "7"))
+EVENT_ARCHIVE_KEEP_DAYS = float(os.getenv("EVENT_ARCHIVE_KEEP_DAYS", "90"))
+EVENT_ARCHIVE_DIR = os.getenv("EVENT_ARCHIVE_DIR", os.path.join(DATA_DIR, "events")).strip()
+EVENT_VACUUM_PAGES = int(os.getenv("EVENT_VACUUM_PAGES", "0"))  # incremental_vacuum за проход; 0 — все свободные
+
+# БД: любой SQLAlchemy URL (sqlite:///trading.db, postgresql+psycopg://...)
+DB_URL = os.getenv("DB_URL", "sqlite:///trading.db").strip()
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+# sqlite: WAL — читатели (UI) не блокируют писателя (бот) и наоборот
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL").strip().upper()
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL").strip().upper()
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_CACHE_KB = int(os.getenv("SQLITE_CACHE_KB", "16384"))
+
+# живой стрим дашборда (SSE): кольцо для дочитки по Last-Event-ID, очередь на вкладку, keep-alive
+LIVE_REPLAY = int(os.getenv("LIVE_REPLAY", "1000"))
+LIVE_CLIENT_QUEUE = int(os.getenv("LIVE_CLIENT_QUEUE", "1000"))
+LIVE_PING_SEC = float(os.getenv("LIVE_PING_SEC", "15"))
+
+# трассировка циклов бота: стадии/latency каждого цикла в память (/metrics/traces) и JSONL
+TRACE_CYCLES = os.getenv("TRACE_CYCLES", "false").strip().lower() in ("1", "true", "yes", "y", "on")
+TRACE_KEEP = int(os.getenv("TRACE_KEEP", "500"))
+TRACE_PATH = os.getenv("TRACE_PATH", os.path.join(DATA_DIR, "traces.jsonl")).strip()
+
+# биржа движка: bybit | sim (бумажная торговля на свечах из OHLCVStore, см. app/exchange/sim.py)
+EXCHANGE = os.getenv("EXCHANGE", "bybit").strip().lower()
+SIM_SYMBOLS = [x.strip() for x in os.getenv("SIM_SYMBOLS", "BTC/USDT:USDT").split(",") if x.strip()]
+SIM_TIMEFRAME = os.getenv("SIM_TIMEFRAME", "1m").strip()
+SIM_START = float(os.getenv("SIM_START")) if os.getenv("SIM_START") else None  # секунды epoch; по умолчанию — 200-я свеча
+SIM_SPEED = float(os.getenv("SIM_SPEED", "60"))  # sim-секунд на секунду
+SIM_BALANCE = float(os.getenv("SIM_BALANCE", "10000"))
+SIM_LATENCY_MS = float(os.getenv("SIM_LATENCY_MS", "0"))
+SIM_SEED = int(os.getenv("SIM_SEED", "0"))
+
+# кэш метаданных рынков ccxt: старт без load_markets по сети, обновление в фоне раз в TTL
+MARKETS_TTL_SEC = float(os.getenv("MARKETS_TTL_SEC", str(6 * 3600)))
+MARKETS_CACHE_PATH = os.getenv("MARKETS_CACHE_PATH", "").strip()  # по умолчанию {DATA_DIR}/markets_bybit_*.json
+
+# статусы ордеров по REST (без приватного стрима): одно обновление open/closed списков на символ за tick
+ORDER_CACHE_TICK_SEC = float(os.getenv("ORDER_CACHE_TICK_SEC", "0.5"))
+
+# биржевые SL/TP: не чаще одного amend'а на символ за интервал, промежуточные значения схлопываются
+PROTECT_MIN_INTERVAL_SEC = float(os.getenv("PROTECT_MIN_INTERVAL_SEC", "1.0"))
+
+# smart-вход: сколько уровней стакана смотрим (глубина для нарезки дочерних ордеров), WS-стакан Bybit: 1/50/200/500
+EXEC_BOOK_LEVELS = int(os.getenv("EXEC_BOOK_LEVELS", "5"))
+
+# риск-состояние движка (счётчики дня, трейлинг) в памяти + снимок на диск для рестарта
+PORTFOLIO_PATH = os.getenv("PORTFOLIO_PATH", os.path.join(DATA_DIR, "portfolio.json")).strip()
+PORTFOLIO_SNAPSHOT_SEC = float(os.getenv("PORTFOLIO_SNAPSHOT_SEC", "30"))
+BALANCE_TTL_SEC = float(os.getenv("BALANCE_TTL_SEC", "10"))  # баланс из кэша; после fill — перечитываем
+# stop(): сколько ждать, пока символы допишут начатый цикл (вход → сделка → SL/TP), прежде чем снять их
+STOP_GRACE_SEC = float(os.getenv("STOP_GRACE_SEC", "30"))
+
+# супервизор: BOT_WORKERS > 0 — движки в N процессах-воркерах (символы шардятся по хэшу),
+# API только управляет ими по локальному IPC; 0 — движок в процессе API, как раньше
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "0"))
+WORKER_HEARTBEAT_SEC = float(os.getenv("WORKER_HEARTBEAT_SEC", "1.0"))
+WORKER_TIMEOUT_SEC = float(os.getenv("WORKER_TIMEOUT_SEC", "15"))  # нет heartbeat дольше — воркер перезапускается
+IPC_TIMEOUT_SEC = float(os.getenv("IPC_TIMEOUT_SEC", "5"))
@@ -1,10 +1,112 @@
 from __future__ import annotations
 
+from sqlalchemy import event, inspect, text
+from sqlalchemy.engine import Engine
 from sqlmodel import SQLModel, create_engine
 
-# файл будет рядом с main.py (корень проекта)
-engine = create_engine("sqlite:///trading.db", echo=False)
+from app.config import (
+    DB_MAX_OVERFLOW,
+    DB_POOL_SIZE,
+    DB_URL,
+    SQLITE_BUSY_TIMEOUT_MS,
+    SQLITE_CACHE_KB,
+    SQLITE_JOURNAL_MODE,
+    SQLITE_MMAP_SIZE,
+    SQLITE_SYNCHRONOUS,
+)
+
+
+def sqlite_pragmas(
+    journal_mode: str = SQLITE_JOURNAL_MODE,
+    synchronous: str = SQLITE_SYNCHRONOUS,
+    mmap_size: int = SQLITE_MMAP_SIZE,
+    busy_timeout_ms: int = SQLITE_BUSY_TIMEOUT_MS,
+    cache_kb: int = SQLITE_CACHE_KB,
+    auto_vacuum: str = "INCREMENTAL",
+) -> dict:
+    return {
+        "auto_vacuum": auto_vacuum,   # до journal_mode: действует только на новой БД (старую переводит ретеншн)
+        "journal_mode": journal_mode,
+        "synchronous": synchronous,   # NORMAL в WAL: fsync только на checkpoint
+        "mmap_size": mmap_size,
+        "busy_timeout": busy_timeout_ms,
+        "cache_size": -cache_kb,      # отрицательное = в KiB
+        "temp_store": "MEMORY",
+    }
+
+
+def make_engine(url: str = DB_URL, pragmas: dict | None = None, echo: bool = False) -> Engine:
+    """
+    SQLite: пул соединений + PRAGMA на каждое новое соединение (WAL, synchronous,
+    mmap, busy_timeout). Прочие СУБД (Postgres): обычный QueuePool с pre_ping.
+    pragmas=None — взять из config; {} — оставить дефолты SQLite.
+    """
+    if not url.startswith("sqlite"):
+        return create_engine(
+            url, echo=echo, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_pre_ping=True,
+        )
+
+    pragmas = sqlite_pragmas() if pragmas is None else pragmas
+    memory = url in ("sqlite://", "sqlite:///:memory:")
+    eng = create_engine(
+        url,
+        echo=echo,
+        connect_args={
+            "check_same_thread": False,  # соединения ходят между потоками через пул
+            "timeout": pragmas.get("busy_timeout", 5000) / 1000.0,
+        },
+        **({} if memory else {"pool_size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW}),
+    )
+
+    if pragmas:
+        @event.listens_for(eng, "connect")
+        def _set_pragmas(dbapi_conn, _record):
+            cur = dbapi_conn.cursor()
+            for k, v in pragmas.items():
+                cur.execute(f"PRAGMA {k}={v}")
+            cur.close()
+
+    return eng
+
+
+# по умолчанию файл будет рядом с main.py (корень проекта); см. DB_URL
+engine = make_engine()
+
+
+def _add_missing_columns() -> None:
+    """
+    create_all не трогает существующие таблицы — докидываем новые колонки
+    (с default) в старую БД, чтобы не терять историю.
+    """
+    insp = inspect(engine)
+    with engine.begin() as conn:
+        for table in SQLModel.metadata.sorted_tables:
+            if not insp.has_table(table.name):
+                continue
+            have = {c["name"] for c in insp.get_columns(table.name)}
+            for col in table.columns:
+                if col.name in have:
+                    continue
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {col.name} {col.type.compile(engine.dialect)}"
+                default = col.default.arg if col.default is not None and not callable(col.default.arg) else None
+                if isinstance(default, bool):
+                    ddl += " DEFAULT TRUE" if default else " DEFAULT FALSE"
+                elif isinstance(default, str):
+                    ddl += " DEFAULT '" + default.replace("'", "''") + "'"
+                elif default is not None:
+                    ddl += f" DEFAULT {default}"
+                conn.execute(text(ddl))
+
+
+def _create_missing_indexes() -> None:
+    # индексы, добавленные в модели позже, чем была создана таблица
+    with engine.begin() as conn:
+        for table in SQLModel.metadata.sorted_tables:
+            for idx in table.indexes:
+                idx.create(conn, checkfirst=True)
 
 
 def init_db() -> None:
     SQLModel.metadata.create_all(engine)
+    _add_missing_columns()
+    _create_missing_indexes()
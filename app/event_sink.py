@@ -0,0 +1,209 @@
+# app/event_sink.py
+from __future__ import annotations
+
+import atexit
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from sqlmodel import Session
+
+from app import repo
+from app.config import EVENT_BATCH, EVENT_DROP, EVENT_FLUSH_MS, EVENT_QUEUE, EVENT_SAMPLE
+from app.db import engine
+from app.metrics import DB_WRITE, Gauge
+from app.models import Event
+
+_STOP = object()
+_WAKE = object()  # разбудить писателя: в overflow что-то появилось
+log = logging.getLogger(__name__)
+
+
+class EventSink:
+    """
+    Write-behind для Event: emit() кладёт событие в ограниченную очередь,
+    фоновый поток пишет пачкой одной транзакцией раз в flush_ms или по batch_size.
+    Backpressure: при полной очереди INFO-события отбрасываются (со счётчиком),
+    WARN/ERROR уходят в отдельный overflow (до urgent_max), который писатель
+    добавляет в каждую пачку — emit() не блокирует никогда, в т.ч. на loop движка.
+    stop()/flush() дописывают всё, что в очереди.
+    Ошибка записи (например, короткий lock SQLite) — один повтор через retry_sec,
+    потом пачка теряется: счётчик write_errors + warning в лог.
+    """
+
+    def __init__(
+        self,
+        flush_ms: int = EVENT_FLUSH_MS,
+        batch_size: int = EVENT_BATCH,
+        maxsize: int = EVENT_QUEUE,
+        drop: set[str] | None = None,
+        sample: dict[str, int] | None = None,
+        urgent_max: int | None = None,
+        retry_sec: float = 0.2,
+    ):
+        self.flush_sec = flush_ms / 1000.0
+        self.batch_size = batch_size
+        self.drop = set(EVENT_DROP if drop is None else drop)
+        self.sample = dict(EVENT_SAMPLE if sample is None else sample)
+        self.urgent_max = maxsize if urgent_max is None else urgent_max
+        self.retry_sec = retry_sec
+
+        self._q: queue.Queue = queue.Queue(maxsize=maxsize)
+        self._urgent: deque = deque()  # WARN/ERROR, не влезшие в очередь
+        self._seen: dict[str, int] = {}
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self._flushed = threading.Condition()
+        self._pending = 0
+
+        self.written = 0
+        self.dropped = 0      # очередь переполнена
+        self.filtered = 0     # drop/sample
+        self.write_errors = 0  # пачки, не записанные и после повтора
+
+    # ---------- producer side ----------
+
+    def emit(self, level: str, type_: str, message: str, symbol: str | None = None) -> bool:
+        if not self._keep(type_):
+            self.filtered += 1
+            return False
+        self._ensure_started()
+        item = (datetime.utcnow(), level, type_, message, symbol)
+        with self._flushed:
+            self._pending += 1
+        try:
+            self._q.put_nowait(item)
+        except queue.Full:
+            if level in ("WARN", "ERROR") and len(self._urgent) < self.urgent_max:
+                self._urgent.append(item)
+                try:
+                    self._q.put_nowait(_WAKE)  # очередь успела освободиться — иначе писатель и так придёт
+                except queue.Full:
+                    pass
+                return True
+            self.dropped += 1
+            with self._flushed:
+                self._pending -= 1
+            return False
+        return True
+
+    def _keep(self, type_: str) -> bool:
+        if type_ in self.drop:
+            return False
+        n = self.sample.get(type_)
+        if not n or n <= 1:
+            return True
+        with self._lock:  # emit зовут из разных потоков
+            c = self._seen.get(type_, 0)
+            self._seen[type_] = c + 1
+        return c % n == 0
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Дождаться, пока всё, что уже в очереди, окажется в БД."""
+        if self._thread is None:
+            return True
+        deadline = time.monotonic() + timeout
+        with self._flushed:
+            while self._pending > 0:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    return False
+                self._flushed.wait(left)
+        return True
+
+    def stop(self, timeout: float = 5.0):
+        with self._lock:
+            t, self._thread = self._thread, None
+        if t is None:
+            return
+        self._q.put(_STOP)
+        t.join(timeout)
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._q.qsize() + len(self._urgent),
+            "written": self.written,
+            "dropped": self.dropped,
+            "filtered": self.filtered,
+            "write_errors": self.write_errors,
+        }
+
+    # ---------- writer side ----------
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="event-sink", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        stop = False
+        while not stop:
+            batch = []
+            try:
+                item = self._q.get()
+            except Exception:
+                continue
+            deadline = time.monotonic() + self.flush_sec
+            while True:
+                if item is _STOP:
+                    stop = True
+                elif item is not _WAKE:
+                    batch.append(item)
+                if stop or len(batch) >= self.batch_size:
+                    break
+                left = deadline - time.monotonic()
+                try:
+                    item = self._q.get(timeout=left) if left > 0 else self._q.get_nowait()
+                except queue.Empty:
+                    break
+            if stop:
+                # дописываем хвост после _STOP
+                while True:
+                    try:
+                        item = self._q.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is not _STOP and item is not _WAKE:
+                        batch.append(item)
+            while self._urgent:
+                batch.append(self._urgent.popleft())
+            self._write(batch)
+
+    def _insert(self, batch: list[tuple]):
+        with DB_WRITE.time(op="events"), Session(engine) as s:
+            repo.add_events(s, [
+                Event(ts=ts, level=lv, type=tp, message=msg, symbol=sym) for ts, lv, tp, msg, sym in batch
+            ])
+
+    def _write(self, batch: list[tuple]):
+        if batch:
+            for attempt in (1, 2):
+                try:
+                    self._insert(batch)
+                    self.written += len(batch)
+                    break
+                except Exception as e:
+                    if attempt == 1:
+                        time.sleep(self.retry_sec)
+                        continue
+                    self.write_errors += 1
+                    self.dropped += len(batch)
+                    log.warning("event sink: %d events lost: %s: %s", len(batch), type(e).__name__, e)
+        with self._flushed:
+            self._pending -= len(batch)
+            self._flushed.notify_all()
+
+
+events = EventSink()
+atexit.register(events.stop)
+
+Gauge(
+    "event_sink_events", "Event write-behind queue and totals", ("state",),
+    fn=lambda: {(k,): v for k, v in events.stats().items()},
+)
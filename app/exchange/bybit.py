@@ -2,12 +2,32 @@
 from __future__ import annotations
 
 import time
-import ccxt
+
 from app.config import BYBIT_KEY, BYBIT_SECRET, TESTNET
+from app.exchange.markets import MarketCache
+
+
+def normalize_ticker(symbol: str, t: dict) -> dict:
+    return {
+        "symbol": symbol,
+        "last": float(t.get("last") or 0),
+        "bid": float(t.get("bid") or 0),
+        "ask": float(t.get("ask") or 0),
+        "timestamp": t.get("timestamp"),
+    }
+
+
+def usdt_total(b: dict) -> float:
+    total = b.get("total", {}).get("USDT")
+    if total is None:
+        total = b.get("free", {}).get("USDT", 0)
+    return float(total or 0)
 
 
 class BybitClient:
-    def __init__(self):
+    def __init__(self, markets: MarketCache | None = None):
+        import ccxt  # лениво: импорт ccxt — заметная часть времени старта
+
         self.exchange = ccxt.bybit({
             "apiKey": BYBIT_KEY,
             "secret": BYBIT_SECRET,
@@ -20,30 +40,18 @@ class BybitClient:
         if TESTNET:
             self.exchange.set_sandbox_mode(True)
 
-        self.exchange.load_markets()
+        # markets из файла; без кэша ccxt сам загрузит их при первом запросе
+        self.markets = markets or MarketCache()
+        self.markets.apply(self.exchange)
 
     def ticker(self, symbol: str):
-        t = self.exchange.fetch_ticker(symbol)
-        last = float(t.get("last") or 0)
-        bid = float(t.get("bid") or 0)
-        ask = float(t.get("ask") or 0)
-        return {
-            "symbol": symbol,
-            "last": last,
-            "bid": bid,
-            "ask": ask,
-            "timestamp": t.get("timestamp"),
-        }
+        return normalize_ticker(symbol, self.exchange.fetch_ticker(symbol))
 
     def ohlcv(self, symbol: str, timeframe: str, limit: int = 200):
         return self.exchange.fetch_ohlcv(symbol, timeframe=timeframe, limit=limit)
 
     def balance_usdt(self) -> float:
-        b = self.exchange.fetch_balance()
-        total = b.get("total", {}).get("USDT")
-        if total is None:
-            total = b.get("free", {}).get("USDT", 0)
-        return float(total or 0)
+        return usdt_total(self.exchange.fetch_balance())
 
     def set_leverage(self, symbol: str, leverage: int):
         try:
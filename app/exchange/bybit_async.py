@@ -0,0 +1,323 @@
+# app/exchange/bybit_async.py
+from __future__ import annotations
+
+import asyncio
+import time
+
+import aiohttp
+
+from app.config import BYBIT_KEY, BYBIT_SECRET, TESTNET, HTTP_POOL_SIZE, ORDER_CACHE_TICK_SEC
+from app.exchange.bybit import BybitClient, normalize_ticker, usdt_total
+from app.exchange.markets import MarketCache
+from app.exchange.order_cache import OrderCache
+from app.exchange.ratelimit import EndpointRateLimiter
+from app.metrics import EXCHANGE_HTTP, RATELIMIT_WAIT, timed_call
+
+_limited_cls = None
+
+
+def _limited_bybit():
+    """
+    ccxt bybit, где вместо общего throttle стоит лимитер по endpoint'ам Bybit v5.
+    Класс строится при первом open(): импорт ccxt стоит сотни мс, старт процесса его не ждёт.
+    """
+    global _limited_cls
+    if _limited_cls is not None:
+        return _limited_cls
+    import ccxt.async_support as ccxt_async
+
+    class _LimitedBybit(ccxt_async.bybit):
+        def __init__(self, config: dict, limiter: EndpointRateLimiter):
+            super().__init__(config)
+            self.limiter = limiter
+
+        async def fetch2(self, path, api="public", method="GET", params={}, headers=None, body=None, config={}):
+            t0 = time.perf_counter()
+            await self.limiter.acquire(path)
+            t1 = time.perf_counter()
+            RATELIMIT_WAIT.observe(t1 - t0, path=path)
+            try:
+                return await super().fetch2(path, api, method, params, headers, body, config)
+            finally:
+                EXCHANGE_HTTP.observe(time.perf_counter() - t1, path=path)
+
+    _limited_cls = _LimitedBybit
+    return _limited_cls
+
+
+class AsyncBybitClient:
+    """
+    Async-аналог BybitClient (те же методы), на ccxt.async_support.
+    Один aiohttp-пул соединений на клиент, лимиты Bybit v5 по endpoint'ам.
+    Привязан к event loop, в котором вызван open().
+
+    Markets берутся из MarketCache: open() не ходит в сеть, если файл есть
+    (даже протухший), а фоновая задача перечитывает их раз в TTL.
+    """
+
+    parse_fill = staticmethod(BybitClient.parse_fill)
+
+    def __init__(self, pool_size: int = HTTP_POOL_SIZE, limiter: EndpointRateLimiter | None = None,
+                 markets: MarketCache | None = None):
+        self.pool_size = pool_size
+        self.limiter = limiter or EndpointRateLimiter()
+        self.markets = markets or MarketCache()
+        self.session: aiohttp.ClientSession | None = None
+        self.exchange = None
+        self._balance_inflight: asyncio.Future | None = None
+        self._markets_task: asyncio.Task | None = None
+        self.markets_error: str | None = None
+        self.order_cache = OrderCache(self._fetch_open_orders, self._fetch_closed_orders, tick_sec=ORDER_CACHE_TICK_SEC)
+
+    async def open(self):
+        if self.exchange is not None:
+            return
+        # futures прошлого loop (stop()/start() движка) в новом не ждём
+        self._balance_inflight = None
+        self.order_cache.reset()
+        connector = aiohttp.TCPConnector(limit=self.pool_size, ttl_dns_cache=300, enable_cleanup_closed=True)
+        self.session = aiohttp.ClientSession(connector=connector, trust_env=True)
+        self.exchange = _limited_bybit()({
+            "apiKey": BYBIT_KEY,
+            "secret": BYBIT_SECRET,
+            "enableRateLimit": False,  # лимитим сами, см. _LimitedBybit.fetch2
+            "session": self.session,
+            "options": {
+                "defaultType": "swap",  # USDT Perp
+            },
+        }, self.limiter)
+
+        if TESTNET:
+            self.exchange.set_sandbox_mode(True)
+
+        if not self.markets.apply(self.exchange):
+            await self.reload_markets()  # первый запуск: без markets работать нельзя
+        self._markets_task = asyncio.create_task(self._markets_refresher(), name="bybit:markets")
+
+    async def reload_markets(self):
+        await self.exchange.load_markets(reload=True)
+        await asyncio.to_thread(self.markets.save, self.exchange)
+
+    async def _markets_refresher(self):
+        while True:
+            age = self.markets.age()
+            await asyncio.sleep(max(0.0, self.markets.ttl_sec - age) if age is not None else 0.0)
+            try:
+                await self.reload_markets()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # биржа недоступна — работаем на старых markets, пробуем позже
+                self.markets_error = str(e)
+                await asyncio.sleep(60)
+            else:
+                self.markets_error = None
+
+    async def close(self):
+        ex, session = self.exchange, self.session
+        self.exchange = None
+        self.session = None
+        task, self._markets_task = self._markets_task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        if ex is not None:
+            await ex.close()
+        if session is not None:
+            await session.close()
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    # ---------- Market data ----------
+
+    @timed_call("ticker")
+    async def ticker(self, symbol: str):
+        return normalize_ticker(symbol, await self.exchange.fetch_ticker(symbol))
+
+    @timed_call("tickers")
+    async def tickers(self, symbols: list[str]) -> dict[str, dict]:
+        """Тикеры пачкой одним запросом (+ quote_volume — оборот за 24ч в USDT)."""
+        ts = await self.exchange.fetch_tickers(symbols, {"category": "linear"})
+        return {s: {**normalize_ticker(s, t), "quote_volume": float(t.get("quoteVolume") or 0)} for s, t in ts.items()}
+
+    @timed_call("order_book")
+    async def order_book(self, symbol: str, depth: int = 25) -> dict:
+        ob = await self.exchange.fetch_order_book(symbol, depth)
+        return {"bids": ob["bids"], "asks": ob["asks"], "timestamp": ob.get("timestamp")}
+
+    @timed_call("ohlcv")
+    async def ohlcv(self, symbol: str, timeframe: str, limit: int = 200, since: int | None = None):
+        return await self.exchange.fetch_ohlcv(symbol, timeframe=timeframe, since=since, limit=limit)
+
+    async def balance_usdt(self) -> float:
+        # баланс общий на аккаунт: параллельные вызовы от разных символов делят один запрос
+        fut = self._balance_inflight
+        if fut is None or fut.done():
+            fut = self._balance_inflight = asyncio.ensure_future(self._fetch_balance_usdt())
+        return await asyncio.shield(fut)
+
+    @timed_call("balance")
+    async def _fetch_balance_usdt(self) -> float:
+        return usdt_total(await self.exchange.fetch_balance())
+
+    @timed_call("set_leverage")
+    async def set_leverage(self, symbol: str, leverage: int):
+        try:
+            return await self.exchange.set_leverage(leverage, symbol)
+        except Exception as e:
+            msg = str(e)
+            # уже стоит такое плечо — это не ошибка
+            if "110043" in msg or "leverage not modified" in msg:
+                return {"ok": True, "note": "leverage already set"}
+            raise
+
+    # ---------- Orders / Fills ----------
+
+    @timed_call("create_limit")
+    async def create_limit(self, symbol: str, side: str, qty: float, price: float, post_only: bool = False):
+        params = {}
+        if post_only:
+            params["postOnly"] = True
+        return await self.exchange.create_order(symbol, "limit", side, qty, price, params)
+
+    @timed_call("create_market")
+    async def create_market(self, symbol: str, side: str, qty: float):
+        return await self.exchange.create_order(symbol, "market", side, qty)
+
+    @timed_call("cancel_order")
+    async def cancel_order(self, order_id: str, symbol: str):
+        try:
+            return await self.exchange.cancel_order(order_id, symbol)
+        finally:
+            self.order_cache.invalidate(symbol, order_id)
+
+    @timed_call("amend_order")
+    async def amend_order(self, order_id: str, symbol: str, price: float | None = None, qty: float | None = None):
+        """Bybit v5 /v5/order/amend — переставить лимитку без cancel+create (один запрос)."""
+        params = {"category": "linear", "symbol": self._market_id(symbol), "orderId": str(order_id)}
+        if price is not None:
+            params["price"] = self.exchange.price_to_precision(symbol, price)
+        if qty is not None:
+            params["qty"] = self.exchange.amount_to_precision(symbol, qty)
+        try:
+            return await self.exchange.privatePostV5OrderAmend(params)
+        finally:
+            self.order_cache.invalidate(symbol, order_id)
+
+    @timed_call("fetch_order")
+    async def fetch_order(self, order_id: str, symbol: str, params: dict | None = None):
+        params = params or {}
+        params.setdefault("acknowledged", True)
+        return await self.exchange.fetch_order(order_id, symbol, params)
+
+    @timed_call("set_trading_stop")
+    async def set_trading_stop(self, symbol: str, stop_loss: float | None, take_profit: float | None,
+                               trailing_stop: float | None = None, active_price: float | None = None):
+        """
+        Bybit v5 /v5/position/trading-stop — биржевой SL/TP (и трейл) позиции для swap.
+        None — поле не трогаем, 0 — снять. trailing_stop — расстояние в цене,
+        active_price — цена активации трейла.
+        """
+        params = {
+            "category": "linear",
+            "symbol": self._market_id(symbol),
+            "tpslMode": "Full",
+            "positionIdx": 0,
+        }
+        for key, v in (("stopLoss", stop_loss), ("takeProfit", take_profit),
+                       ("trailingStop", trailing_stop), ("activePrice", active_price)):
+            if v is not None:
+                params[key] = self.exchange.price_to_precision(symbol, v) if v else "0"
+
+        return await self.exchange.privatePostV5PositionTradingStop(params)
+
+    def round_price(self, symbol: str, price: float) -> float:
+        return float(self.exchange.price_to_precision(symbol, price))
+
+    def round_qty(self, symbol: str, qty: float) -> float:
+        try:
+            return float(self.exchange.amount_to_precision(symbol, qty))
+        except Exception:
+            return 0.0  # меньше минимального лота
+
+    @timed_call("positions")
+    async def positions(self, symbols: list[str] | None = None) -> dict[str, dict]:
+        """Открытые позиции: symbol -> {qty (со знаком), entry, sl, tp, trailing}."""
+        out = {}
+        for p in await self.exchange.fetch_positions(symbols, {"category": "linear"}):
+            qty = float(p.get("contracts") or 0)
+            if not qty:
+                continue
+            info = p.get("info") or {}
+            out[p["symbol"]] = {
+                "qty": qty if p.get("side") == "long" else -qty,
+                "entry": float(p.get("entryPrice") or 0),
+                "sl": float(info.get("stopLoss") or 0) or None,
+                "tp": float(info.get("takeProfit") or 0) or None,
+                "trailing": float(info.get("trailingStop") or 0) or None,
+            }
+        return out
+
+    @timed_call("my_trades")
+    async def my_trades(self, symbol: str, since: int | None = None) -> list[dict]:
+        """Исполнения аккаунта по символу: [{order_id, side, price, qty, fee, ts, stop_type}]."""
+        out = []
+        for t in await self.exchange.fetch_my_trades(symbol, since):
+            fee = t.get("fee") or {}
+            out.append({
+                "order_id": str(t.get("order")),
+                "side": t.get("side"),
+                "price": float(t.get("price") or 0),
+                "qty": float(t.get("amount") or 0),
+                "fee": float(fee.get("cost") or 0),
+                "ts": t.get("timestamp"),
+                "stop_type": (t.get("info") or {}).get("stopOrderType") or None,
+            })
+        return out
+
+    def _market_id(self, symbol: str) -> str:
+        m = self.exchange.market(symbol)
+        return m["id"]
+
+    # ---------- SAFE order status without fetch_order ----------
+
+    async def _fetch_open_orders(self, symbol: str) -> list:
+        return await self.exchange.fetch_open_orders(symbol)
+
+    async def _fetch_closed_orders(self, symbol: str, since: int | None) -> list:
+        return await self.exchange.fetch_closed_orders(symbol, since)
+
+    @timed_call("order_status")
+    async def get_order_status_safe(self, symbol: str, order_id: str) -> dict | None:
+        """
+        Из OrderCache по id: одно обновление open/closed списков на символ за tick
+        на всех ожидающих, closed — только с курсора; fetch_order() не трогаем.
+        """
+        return await self.order_cache.get(symbol, order_id)
+
+    @timed_call("wait_fill")
+    async def wait_fill(self, symbol: str, order_id: str, timeout_sec: int):
+        """Ждём исполнения ордера до timeout_sec, не блокируя event loop."""
+        loop = asyncio.get_running_loop()
+        t0 = loop.time()
+        last = None
+
+        try:
+            while loop.time() - t0 <= timeout_sec:
+                o = await self.get_order_status_safe(symbol, order_id)
+                if o:
+                    last = o
+                    status = (o.get("status") or "").lower()
+                    if status in ("closed", "filled"):
+                        return o
+
+                await asyncio.sleep(0.7)
+
+            return last
+        finally:
+            self.order_cache.forget(symbol, order_id)
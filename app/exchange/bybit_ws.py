@@ -0,0 +1,433 @@
+# app/exchange/bybit_ws.py
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import heapq
+import hmac
+import json
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+import aiohttp
+
+from app.indicators import CandleBuffer
+
+
+# ccxt timeframe -> интервал kline Bybit v5
+_TF_TO_INTERVAL = {
+    "1m": "1", "3m": "3", "5m": "5", "15m": "15", "30m": "30",
+    "1h": "60", "2h": "120", "4h": "240", "6h": "360", "12h": "720",
+    "1d": "D", "1w": "W", "1M": "M",
+}
+
+
+def kline_interval(timeframe: str) -> str:
+    try:
+        return _TF_TO_INTERVAL[timeframe]
+    except KeyError:
+        raise ValueError(f"Unsupported timeframe: {timeframe}") from None
+
+
+class _BybitStream:
+    """Общая часть WS Bybit v5: коннект, ping, переподключение с backoff."""
+
+    PING_SEC = 20
+    SUBSCRIBE_CHUNK = 10
+
+    def __init__(self, url: str):
+        self.url = url
+        self._topics: set[str] = set()
+        self._ws: aiohttp.ClientWebSocketResponse | None = None
+        self._session: aiohttp.ClientSession | None = None
+        self._task: asyncio.Task | None = None
+        self.connected = False
+
+    async def start(self):
+        if self._task is None:
+            self._session = aiohttp.ClientSession()
+            self._task = asyncio.create_task(self._run(), name=type(self).__name__)
+
+    async def close(self):
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        self._set_connected(False)
+
+    async def _subscribe(self, topics: list[str]):
+        ws = self._ws
+        if ws is None or ws.closed:
+            return  # подпишемся при (пере)подключении
+        for i in range(0, len(topics), self.SUBSCRIBE_CHUNK):
+            await ws.send_str(json.dumps({"op": "subscribe", "args": topics[i:i + self.SUBSCRIBE_CHUNK]}))
+
+    def _set_connected(self, value: bool):
+        self.connected = value
+
+    async def _on_connect(self, ws: aiohttp.ClientWebSocketResponse):
+        await self._subscribe(sorted(self._topics))
+
+    def _on_message(self, m: dict):
+        raise NotImplementedError
+
+    async def _run(self):
+        backoff = 1.0
+        while True:
+            try:
+                async with self._session.ws_connect(self.url, heartbeat=None, receive_timeout=self.PING_SEC * 2) as ws:
+                    self._ws = ws
+                    await self._on_connect(ws)
+                    self._set_connected(True)
+                    backoff = 1.0
+                    pinger = asyncio.create_task(self._ping(ws))
+                    try:
+                        async for msg in ws:
+                            if msg.type == aiohttp.WSMsgType.TEXT:
+                                self._on_message(json.loads(msg.data))
+                            elif msg.type in (aiohttp.WSMsgType.ERROR, aiohttp.WSMsgType.CLOSED):
+                                break
+                    finally:
+                        pinger.cancel()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                pass
+            finally:
+                self._ws = None
+                self._set_connected(False)
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 30.0)
+
+    async def _ping(self, ws):
+        while not ws.closed:
+            await asyncio.sleep(self.PING_SEC)
+            await ws.send_str('{"op":"ping"}')
+
+
+class MarketDataFeed(_BybitStream):
+    """
+    Публичный стрим Bybit v5: topics tickers.{id} и kline.{interval}.{id}
+    (+ orderbook.50.{id} для smart-входа).
+    Держит в памяти последний bid/ask/last, стакан и скользящий буфер свечей на символ.
+    Движок читает отсюда; если данные протухли (стрим лёг) — get-методы
+    возвращают None и движок идёт в REST.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        resolve_id: Callable[[str], str],
+        fetch_ohlcv: Callable[..., Awaitable[list]] | None = None,
+        candles: int = 200,
+        stale_sec: float = 15.0,
+    ):
+        super().__init__(url)
+        self.resolve_id = resolve_id        # "BTC/USDT:USDT" -> "BTCUSDT"
+        self.fetch_ohlcv = fetch_ohlcv      # REST warm-up буфера свечей
+        self.maxlen = candles
+        self.stale_sec = stale_sec
+
+        self._symbols: dict[str, str] = {}                      # market id -> symbol
+        self._tickers: dict[str, dict] = {}                     # symbol -> ticker
+        self._candles: dict[tuple[str, str], CandleBuffer] = {} # (symbol, tf) -> кольцевой буфер свечей
+        self._candles_ts: dict[tuple[str, str], float] = {}     # когда пришла последняя свеча (monotonic)
+        self._books: dict[str, dict] = {}                       # symbol -> {"b": {price: qty}, "a": {...}, "_rx"}
+        self._warming: dict[tuple[str, str], asyncio.Future] = {}  # (symbol, tf) -> идущий REST warm-up
+        self._warmed: set[tuple[str, str]] = set()                 # прогрев удался; до этого буфер — только стрим
+        self._interval_tf = {v: k for k, v in _TF_TO_INTERVAL.items()}
+
+    # ---------- subscriptions ----------
+
+    BOOK_DEPTH = 50
+
+    async def ensure(self, symbol: str, timeframe: str, book: bool = False):
+        """Подписаться на символ/таймфрейм (идемпотентно) и прогреть буфер свечей через REST."""
+        mid = self.resolve_id(symbol)
+        self._symbols[mid] = symbol
+        topics = [f"tickers.{mid}", f"kline.{kline_interval(timeframe)}.{mid}"]
+        if book:
+            topics.append(f"orderbook.{self.BOOK_DEPTH}.{mid}")
+        new = [t for t in topics if t not in self._topics]
+        if new:
+            self._topics.update(new)  # до await: параллельный вызов не подпишется второй раз
+            await self._subscribe(new)
+
+        key = (symbol, timeframe)
+        if self.fetch_ohlcv is None or key in self._warmed:
+            return
+        # прогрев один на ключ: параллельные вызовы ждут тот же запрос, а не сеют буфер заново;
+        # упавший повторяется на следующем ensure
+        fut = self._warming.get(key)
+        if fut is None:
+            fut = self._warming[key] = asyncio.ensure_future(self._warm(key))
+            fut.add_done_callback(lambda _, k=key: self._warming.pop(k, None))
+        await asyncio.shield(fut)
+
+    async def _warm(self, key: tuple[str, str]):
+        symbol, timeframe = key
+        rows = await self.fetch_ohlcv(symbol, timeframe, limit=self.maxlen)
+        buf = CandleBuffer(self.maxlen)
+        buf.extend(rows)
+        # пока шёл REST, стрим мог уже прислать свежие свечи — они приоритетнее
+        live = self._candles.get(key)
+        if live is not None:
+            buf.extend(live)
+        self._candles[key] = buf
+        self._candles_ts[key] = time.monotonic()
+        self._warmed.add(key)
+
+    # ---------- reads ----------
+
+    def ticker(self, symbol: str) -> dict | None:
+        t = self._tickers.get(symbol)
+        if t is None or time.monotonic() - t["_rx"] > self.stale_sec:
+            return None
+        if not (t["bid"] > 0 and t["ask"] > 0 and t["last"] > 0):
+            return None
+        return {k: t.get(k) for k in ("symbol", "last", "bid", "ask", "timestamp", "quote_volume")}
+
+    def book(self, symbol: str, levels: int = 5) -> dict | None:
+        """Верх стакана {"bids": [[price, qty], ...], "asks": ...}; None — нет подписки/протух."""
+        b = self._books.get(symbol)
+        if b is None or not b["b"] or not b["a"] or time.monotonic() - b["_rx"] > self.stale_sec:
+            return None
+        return {
+            "bids": [[p, b["b"][p]] for p in heapq.nlargest(levels, b["b"])],
+            "asks": [[p, b["a"][p]] for p in heapq.nsmallest(levels, b["a"])],
+            "timestamp": b["ts"],
+        }
+
+    def ohlcv(self, symbol: str, timeframe: str) -> CandleBuffer | None:
+        """Живой буфер (не копия): индексируется как список свечей ccxt. До прогрева — None."""
+        key = (symbol, timeframe)
+        buf = self._candles.get(key)
+        if self.fetch_ohlcv is not None and key not in self._warmed:
+            return None  # в буфере пока только свечи стрима, истории под индикаторы нет
+        if not buf or time.monotonic() - self._candles_ts.get(key, 0.0) > self.stale_sec:
+            return None
+        return buf
+
+    # ---------- stream ----------
+
+    def _on_message(self, m: dict):
+        topic = m.get("topic")
+        if not topic:
+            return  # ответы на subscribe/pong
+        if topic.startswith("tickers."):
+            self._on_ticker(topic[8:], m)
+        elif topic.startswith("kline."):
+            _, interval, mid = topic.split(".", 2)
+            self._on_kline(mid, interval, m.get("data") or [])
+        elif topic.startswith("orderbook."):
+            self._on_book(topic.split(".", 2)[2], m)
+
+    def _on_ticker(self, mid: str, m: dict):
+        symbol = self._symbols.get(mid)
+        if symbol is None:
+            return
+        d = m.get("data") or {}
+        t = self._tickers.get(symbol)
+        if t is None or m.get("type") == "snapshot":
+            t = self._tickers[symbol] = {"symbol": symbol, "last": 0.0, "bid": 0.0, "ask": 0.0, "timestamp": None}
+        # delta приходит только с изменившимися полями
+        if d.get("lastPrice"):
+            t["last"] = float(d["lastPrice"])
+        if d.get("bid1Price"):
+            t["bid"] = float(d["bid1Price"])
+        if d.get("ask1Price"):
+            t["ask"] = float(d["ask1Price"])
+        if d.get("turnover24h"):
+            t["quote_volume"] = float(d["turnover24h"])
+        t["timestamp"] = m.get("ts")
+        t["_rx"] = time.monotonic()
+
+    def _on_book(self, mid: str, m: dict):
+        symbol = self._symbols.get(mid)
+        if symbol is None:
+            return
+        d = m.get("data") or {}
+        b = self._books.get(symbol)
+        # snapshot (или u=1 — сервис перезапустился) заменяет стакан целиком, delta — поуровнево, qty=0 — удалить
+        if b is None or m.get("type") == "snapshot" or d.get("u") == 1:
+            b = self._books[symbol] = {"b": {}, "a": {}, "ts": None, "_rx": 0.0}
+        for key, side in (("b", b["b"]), ("a", b["a"])):
+            for px, qty in d.get(key) or []:
+                p, q = float(px), float(qty)
+                if q:
+                    side[p] = q
+                else:
+                    side.pop(p, None)
+        b["ts"] = m.get("ts")
+        b["_rx"] = time.monotonic()
+
+    def _on_kline(self, mid: str, interval: str, rows: list[dict]):
+        symbol = self._symbols.get(mid)
+        tf = self._interval_tf.get(interval)
+        if symbol is None or tf is None:
+            return
+        key = (symbol, tf)
+        buf = self._candles.get(key)
+        if buf is None:
+            buf = self._candles[key] = CandleBuffer(self.maxlen)
+        for k in rows:
+            # та же start — текущая свеча обновилась, новая start — дописываем
+            buf.update((int(k["start"]), float(k["open"]), float(k["high"]), float(k["low"]), float(k["close"]), float(k["volume"])))
+        self._candles_ts[key] = time.monotonic()
+
+
+# orderStatus Bybit v5 -> status ccxt
+_ORDER_STATUS = {
+    "New": "open",
+    "PartiallyFilled": "open",
+    "Untriggered": "open",
+    "Triggered": "open",
+    "Filled": "closed",
+    "Cancelled": "canceled",
+    "PartiallyFilledCanceled": "canceled",
+    "Deactivated": "canceled",
+    "Rejected": "rejected",
+}
+
+
+class OrderStream(_BybitStream):
+    """
+    Приватный стрим Bybit v5: topics order + execution.
+    wait_fill() резолвится в момент, когда пришёл fill, с реальным avg price
+    и комиссией (формат как у ccxt order — подходит для parse_fill).
+    Если стрим отвалился посреди ожидания — wait_fill возвращает управление,
+    и вызывающий доезжает остаток таймаута REST-поллингом.
+    """
+
+    RECENT_ORDERS = 1000
+
+    def __init__(self, url: str, api_key: str, secret: str):
+        super().__init__(url)
+        self.api_key = api_key
+        self.secret = secret
+        self._topics = {"order", "execution"}
+
+        self._orders: OrderedDict[str, dict] = OrderedDict()   # order id -> последнее состояние (ccxt-формат)
+        self._execs: dict[str, list[float]] = {}               # order id -> [qty, notional, fee] по execution
+        self._waiters: dict[str, list[asyncio.Future]] = {}
+        self.on_terminal: Callable[[dict], None] | None = None  # ордер закрыт/отменён (в т.ч. биржевой SL/TP)
+        self._down = asyncio.Event()
+        self._down.set()
+
+    def _set_connected(self, value: bool):
+        super()._set_connected(value)
+        if value:
+            self._down.clear()
+        else:
+            self._down.set()
+
+    async def _on_connect(self, ws: aiohttp.ClientWebSocketResponse):
+        expires = int((time.time() + 10) * 1000)
+        sig = hmac.new(self.secret.encode(), f"GET/realtime{expires}".encode(), hashlib.sha256).hexdigest()
+        await ws.send_str(json.dumps({"op": "auth", "args": [self.api_key, expires, sig]}))
+        reply = await ws.receive_json(timeout=10)
+        if not reply.get("success"):
+            raise ConnectionError(f"bybit ws auth failed: {reply.get('ret_msg')}")
+        await super()._on_connect(ws)
+
+    # ---------- waiting ----------
+
+    def order(self, order_id: str) -> dict | None:
+        return self._orders.get(str(order_id))
+
+    async def wait_fill(self, order_id: str, timeout_sec: float) -> dict | None:
+        """
+        Ждём терминального статуса ордера (closed/canceled/rejected).
+        Возвращает последнее известное состояние (или None), если вышли по
+        таймауту или из-за обрыва стрима — это видно по self.connected.
+        """
+        order_id = str(order_id)
+        o = self._orders.get(order_id)
+        if o is not None and o["status"] != "open":
+            return o  # fill успел прийти раньше, чем мы начали ждать
+
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(order_id, []).append(fut)
+        down = asyncio.ensure_future(self._down.wait())
+        try:
+            await asyncio.wait([fut, down], timeout=timeout_sec, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            down.cancel()
+            lst = self._waiters.get(order_id)
+            if lst is not None:
+                if fut in lst:
+                    lst.remove(fut)
+                if not lst:
+                    del self._waiters[order_id]
+        return fut.result() if fut.done() else self._orders.get(order_id)
+
+    # ---------- stream ----------
+
+    def _on_message(self, m: dict):
+        topic = m.get("topic")
+        if topic == "execution":
+            for e in m.get("data") or []:
+                self._on_execution(e)
+        elif topic == "order":
+            for d in m.get("data") or []:
+                self._on_order(d)
+
+    def _on_execution(self, e: dict):
+        if e.get("execType", "Trade") != "Trade":
+            return  # funding/ADL/... не относятся к fill ордера
+        oid = str(e.get("orderId"))
+        qty, px = float(e.get("execQty") or 0), float(e.get("execPrice") or 0)
+        acc = self._execs.setdefault(oid, [0.0, 0.0, 0.0])
+        acc[0] += qty
+        acc[1] += qty * px
+        acc[2] += float(e.get("execFee") or 0)
+
+        o = self._orders.get(oid)
+        if o is not None and o["status"] != "open":
+            self._fill_from_execs(o)
+
+    def _fill_from_execs(self, o: dict):
+        # order-сообщение бывает без avgPrice/cumExecFee — добиваем из execution
+        acc = self._execs.get(o["id"])
+        if not acc or acc[0] <= 0:
+            return
+        if not o.get("average"):
+            o["average"] = acc[1] / acc[0]
+        if o["fee"].get("cost") is None:
+            o["fee"]["cost"] = acc[2]
+
+    def _on_order(self, d: dict):
+        oid = str(d.get("orderId"))
+        avg = float(d.get("avgPrice") or 0) or None
+        fee = d.get("cumExecFee")
+        o = {
+            "id": oid,
+            "clientOrderId": d.get("orderLinkId") or None,
+            "info": d,
+            "status": _ORDER_STATUS.get(d.get("orderStatus"), "open"),
+            "side": (d.get("side") or "").lower() or None,
+            "price": float(d.get("price") or 0) or None,
+            "amount": float(d.get("qty") or 0),
+            "filled": float(d.get("cumExecQty") or 0),
+            "average": avg,
+            "fee": {"cost": float(fee) if fee not in (None, "") else None, "currency": "USDT"},
+            "timestamp": int(d["updatedTime"]) if d.get("updatedTime") else None,
+        }
+        self._fill_from_execs(o)
+
+        self._orders[oid] = o
+        self._orders.move_to_end(oid)
+        while len(self._orders) > self.RECENT_ORDERS:
+            old, _ = self._orders.popitem(last=False)
+            self._execs.pop(old, None)
+
+        if o["status"] != "open":
+            for fut in self._waiters.pop(oid, []):
+                if not fut.done():
+                    fut.set_result(o)
+            if self.on_terminal is not None:
+                self.on_terminal(o)
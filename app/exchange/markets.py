@@ -0,0 +1,69 @@
+# app/exchange/markets.py
+from __future__ import annotations
+
+import json
+import os
+import tempfile
+import time
+
+from app.config import DATA_DIR, MARKETS_CACHE_PATH, MARKETS_TTL_SEC, TESTNET
+
+
+class MarketCache:
+    """
+    Метаданные рынков ccxt (id, precision, limits) в локальном JSON-файле.
+    Клиент поднимается из файла без сети (exchange.set_markets), даже если
+    файл протух — тогда markets перечитываются с биржи в фоне.
+    """
+
+    def __init__(self, path: str | None = None, ttl_sec: float = MARKETS_TTL_SEC):
+        default = os.path.join(DATA_DIR, f"markets_bybit_{'testnet' if TESTNET else 'mainnet'}.json")
+        self.path = path or MARKETS_CACHE_PATH or default
+        self.ttl_sec = ttl_sec
+
+    def age(self) -> float | None:
+        try:
+            return max(0.0, time.time() - os.path.getmtime(self.path))
+        except OSError:
+            return None
+
+    def is_fresh(self) -> bool:
+        age = self.age()
+        return age is not None and age < self.ttl_sec
+
+    def load(self) -> dict | None:
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None  # нет файла / битый — как будто кэша нет
+        return data if data.get("markets") else None
+
+    def apply(self, exchange) -> bool:
+        """Подставить markets из файла в ccxt-клиент. False — кэша нет."""
+        data = self.load()
+        if data is None:
+            return False
+        exchange.set_markets(data["markets"], data.get("currencies"))
+        return True
+
+    def save(self, exchange) -> None:
+        d = os.path.dirname(self.path) or "."
+        os.makedirs(d, exist_ok=True)
+        # свой tmp на каждого писателя: воркеры супервизора сохраняют один и тот же файл одновременно
+        fd, tmp = tempfile.mkstemp(prefix=os.path.basename(self.path) + ".", suffix=".tmp", dir=d)
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump({"markets": exchange.markets, "currencies": exchange.currencies}, f, default=str)
+            os.replace(tmp, self.path)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+
+    def status(self) -> dict:
+        age = self.age()
+        return {"cached": age is not None, "age_sec": round(age, 1) if age is not None else None,
+                "fresh": age is not None and age < self.ttl_sec}
@@ -0,0 +1,153 @@
+# app/exchange/order_cache.py
+from __future__ import annotations
+
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable
+
+from app.metrics import Counter
+
+ORDER_CACHE = Counter("order_cache_total", "Order status lookups by the REST order cache", ("result",))
+ORDER_CACHE_FETCH = Counter("order_cache_fetch_total", "REST order-list requests made by the order cache", ("list",))
+
+TERMINAL = ("closed", "filled", "canceled", "cancelled", "rejected", "expired")
+
+
+def is_terminal(o: dict) -> bool:
+    return (o.get("status") or "").lower() in TERMINAL
+
+
+@dataclass
+class _SymbolOrders:
+    orders: dict[str, dict] = field(default_factory=dict)  # id -> последнее известное состояние
+    seen: dict[str, float] = field(default_factory=dict)   # id -> monotonic, когда видели
+    asked: dict[str, float] = field(default_factory=dict)  # ждут статуса: id -> когда спросили впервые
+    since: int | None = None                                # ms, курсор closed-истории
+    started: float = float("-inf")                          # monotonic начала последнего обновления
+    inflight: asyncio.Future | None = None
+
+
+class OrderCache:
+    """
+    Статусы ордеров по id из open/closed списков Bybit, без fetch_order.
+    На символ — не больше одного обновления за tick_sec, его делят все ожидающие:
+      - open-список целиком (он короткий — только наши живые ордера);
+      - closed — только с курсора since и только если кто-то из ожидающих
+        пропал из open-списка (исполнился/снят).
+    Терминальный статус больше не меняется — отдаётся из памяти без запросов.
+    """
+
+    def __init__(
+        self,
+        fetch_open: Callable[[str], Awaitable[list]],
+        fetch_closed: Callable[[str, int | None], Awaitable[list]],
+        tick_sec: float = 0.5,
+        lookback_sec: float = 600.0,
+        overlap_sec: float = 5.0,
+        keep_sec: float = 600.0,
+    ):
+        self.fetch_open = fetch_open
+        self.fetch_closed = fetch_closed
+        self.tick_sec = tick_sec
+        self.lookback_ms = int(lookback_sec * 1000)
+        self.overlap_ms = int(overlap_sec * 1000)
+        self.keep_sec = keep_sec
+        self._symbols: dict[str, _SymbolOrders] = {}
+
+    def _sym(self, symbol: str) -> _SymbolOrders:
+        st = self._symbols.get(symbol)
+        if st is None:
+            st = self._symbols[symbol] = _SymbolOrders()
+        return st
+
+    def peek(self, symbol: str, order_id: str) -> dict | None:
+        st = self._symbols.get(symbol)
+        return st.orders.get(str(order_id)) if st is not None else None
+
+    async def get(self, symbol: str, order_id: str) -> dict | None:
+        order_id = str(order_id)
+        st = self._sym(symbol)
+        o = st.orders.get(order_id)
+        if o is not None and is_terminal(o):
+            ORDER_CACHE.inc(result="hit")
+            return o
+        now = time.monotonic()
+        asked = st.asked.setdefault(order_id, now)
+        # новый id ждёт обновления, начатого после вопроса; известный — не чаще раза за tick
+        if now - st.started >= self.tick_sec or (o is None and st.started < asked):
+            ORDER_CACHE.inc(result="refresh")
+            await self.refresh(symbol)
+        else:
+            ORDER_CACHE.inc(result="hit" if o is not None else "miss")
+        return st.orders.get(order_id)
+
+    async def refresh(self, symbol: str) -> None:
+        st = self._sym(symbol)
+        fut = st.inflight
+        if fut is None or fut.done():
+            st.started = time.monotonic()
+            fut = st.inflight = asyncio.ensure_future(self._refresh(symbol, st))
+        await asyncio.shield(fut)
+
+    async def _refresh(self, symbol: str, st: _SymbolOrders) -> None:
+        now = time.monotonic()
+        ORDER_CACHE_FETCH.inc(list="open")
+        try:
+            opens = await self.fetch_open(symbol)
+        except Exception:
+            return  # без open-списка не понять, кто исполнился; спросим на следующем tick
+        open_ids = set()
+        for o in opens:
+            i = str(o.get("id"))
+            open_ids.add(i)
+            st.orders[i], st.seen[i] = o, now
+
+        missing = [i for i in st.asked if i not in open_ids]
+        if missing:
+            # курсор не позже создания известных ожидающих ордеров — их не пропустим
+            wall = int(time.time() * 1000)
+            created = [(st.orders.get(i) or {}).get("timestamp") for i in missing]
+            since = st.since
+            if since is None:
+                # первый closed-запрос: от создания ожидающих, неизвестные — на lookback назад
+                since = wall - self.lookback_ms if not all(created) else wall
+            for ts in created:
+                if ts:
+                    since = min(since, int(ts) - self.overlap_ms)
+            ORDER_CACHE_FETCH.inc(list="closed")
+            try:
+                closed = await self.fetch_closed(symbol, since)
+            except Exception:
+                closed = None  # курсор не двигаем
+            if closed is not None:
+                for o in closed:
+                    i = str(o.get("id"))
+                    st.orders[i], st.seen[i] = o, now
+                st.since = wall - self.overlap_ms
+
+        # ответ получен: терминальные больше не ждём, давно забытые не держим
+        for i in [i for i, t in st.asked.items() if (i in st.orders and is_terminal(st.orders[i])) or now - t > self.keep_sec]:
+            del st.asked[i]
+        for i in [i for i, t in st.seen.items() if now - t > self.keep_sec and i not in st.asked]:
+            del st.seen[i]
+            st.orders.pop(i, None)
+
+    def reset(self) -> None:
+        """Клиент открыт заново (новый event loop): обновления в полёте принадлежат старому."""
+        for st in self._symbols.values():
+            st.inflight = None
+            st.started = float("-inf")
+
+    def invalidate(self, symbol: str, order_id: str) -> None:
+        """Мы сами поменяли ордер (cancel/amend): следующий get() дочитает его с биржи."""
+        st = self._sym(symbol)
+        order_id = str(order_id)
+        st.orders.pop(order_id, None)
+        st.asked[order_id] = time.monotonic()
+
+    def forget(self, symbol: str, order_id: str) -> None:
+        """Ожидающий сдался (таймаут): id больше не тянет за собой closed-запрос."""
+        st = self._symbols.get(symbol)
+        if st is not None:
+            st.asked.pop(str(order_id), None)
@@ -0,0 +1,85 @@
+# app/exchange/ratelimit.py
+from __future__ import annotations
+
+import asyncio
+import time
+
+
+class TokenBucket:
+    """Асинхронный token bucket: rate токенов/сек, burst — ёмкость."""
+
+    def __init__(self, rate: float, burst: float | None = None):
+        self.rate = float(rate)
+        self.capacity = float(burst if burst is not None else rate)
+        self.tokens = self.capacity
+        self.ts = time.monotonic()
+        self._lock: asyncio.Lock | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def _loop_lock(self) -> asyncio.Lock:
+        # лимитер переживает stop()/start() движка, а Lock привязан к loop — на новом loop свой
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop, self._lock = loop, asyncio.Lock()
+        return self._lock
+
+    async def acquire(self, cost: float = 1.0) -> None:
+        async with self._loop_lock():
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.ts) * self.rate)
+                self.ts = now
+                if self.tokens >= cost:
+                    self.tokens -= cost
+                    return
+                await asyncio.sleep((cost - self.tokens) / self.rate)
+
+
+# Bybit v5, лимиты по умолчанию (запросов/сек). Приватные — на UID и на каждый endpoint отдельно,
+# публичные market-data — общий лимит на IP (600 за 5 сек).
+BYBIT_V5_LIMITS: dict[str, float] = {
+    "v5/order/create": 10,
+    "v5/order/amend": 10,
+    "v5/order/cancel": 10,
+    "v5/order/cancel-all": 10,
+    "v5/order/realtime": 50,
+    "v5/order/history": 50,
+    "v5/execution/list": 50,
+    "v5/position/list": 50,
+    "v5/position/set-leverage": 10,
+    "v5/position/trading-stop": 10,
+    "v5/account/wallet-balance": 50,
+}
+BYBIT_V5_PUBLIC_RATE = 120.0
+BYBIT_V5_DEFAULT_PRIVATE_RATE = 10.0
+
+
+class EndpointRateLimiter:
+    """
+    По bucket'у на endpoint (path вида "v5/order/create").
+    Все публичные /v5/market/* делят один IP-bucket.
+    """
+
+    def __init__(
+        self,
+        limits: dict[str, float] | None = None,
+        public_rate: float = BYBIT_V5_PUBLIC_RATE,
+        default_rate: float = BYBIT_V5_DEFAULT_PRIVATE_RATE,
+    ):
+        self.limits = dict(BYBIT_V5_LIMITS if limits is None else limits)
+        self.public_rate = public_rate
+        self.default_rate = default_rate
+        self._buckets: dict[str, TokenBucket] = {}
+
+    def _key(self, path: str) -> tuple[str, float]:
+        path = path.strip("/")
+        if path.startswith("v5/market/") or path.startswith("v5/announcements/"):
+            return "public", self.public_rate
+        return path, self.limits.get(path, self.default_rate)
+
+    async def acquire(self, path: str, cost: float = 1.0) -> None:
+        key, rate = self._key(path)
+        b = self._buckets.get(key)
+        if b is None:
+            b = self._buckets[key] = TokenBucket(rate)
+        await b.acquire(cost)
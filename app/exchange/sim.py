@@ -0,0 +1,598 @@
+# app/exchange/sim.py
+from __future__ import annotations
+
+import asyncio
+import itertools
+import random
+import time
+from datetime import datetime
+
+import ccxt
+import numpy as np
+
+from app.backtest import FEE_MAKER, FEE_TAKER, Candles
+from app.exchange.bybit import BybitClient, normalize_ticker
+from app.ohlcv_store import OHLCVStore, tf_ms
+
+
+class SimClock:
+    """
+    Время симуляции (секунды epoch).
+    speed=None — ручной режим: время стоит, пока не вызван advance() (детерминированные тесты);
+    speed=N — sim-время идёт в N раз быстрее настенного (движок целиком, быстрее реального времени).
+    """
+
+    def __init__(self, start: float, speed: float | None = None):
+        self.speed = speed
+        self._start = float(start)
+        self._t0 = time.monotonic()
+        self._manual = float(start)
+
+    def time(self) -> float:
+        if self.speed is None:
+            return self._manual
+        return self._start + (time.monotonic() - self._t0) * self.speed
+
+    def advance(self, sec: float) -> float:
+        if self.speed is None:
+            self._manual += sec
+        else:
+            self._start += sec
+        return self.time()
+
+    def utcnow(self) -> datetime:
+        return datetime.utcfromtimestamp(self.time())
+
+
+class PricePath:
+    """
+    Цена символа в любой момент по записанным свечам: внутри свечи
+    O→L→H→C (растущая) или O→H→L→C (падающая), линейно между вершинами.
+    Тот же порядок обхода, что даёт консервативный SL-first в бэктесте.
+    """
+
+    def __init__(self, c: Candles):
+        if len(c) == 0:
+            raise ValueError("empty price history")
+        self.c = c
+        ts = np.asarray(c.ts, dtype=np.int64)
+        self.step = int(np.median(np.diff(ts))) if len(ts) > 1 else 60_000
+        o, h, l, cl = (np.asarray(x, dtype=np.float64) for x in (c.open, c.high, c.low, c.close))
+        up = cl >= o
+        d = self.step
+        self.t = np.stack([ts, ts + d // 3, ts + 2 * d // 3, ts + d - 1], axis=1).ravel().astype(np.float64)
+        self.p = np.stack([o, np.where(up, l, h), np.where(up, h, l), cl], axis=1).ravel()
+
+    @property
+    def start_ms(self) -> int:
+        return int(self.c.ts[0])
+
+    @property
+    def end_ms(self) -> int:
+        return int(self.c.ts[-1]) + self.step
+
+    def price(self, t_ms: float) -> float:
+        return float(np.interp(t_ms, self.t, self.p))
+
+    def range(self, t0_ms: float, t1_ms: float) -> tuple[float, float]:
+        """min/max цены на (t0, t1]."""
+        a, b = np.searchsorted(self.t, [t0_ms, t1_ms], side="right")
+        pts = np.concatenate(([self.price(t0_ms), self.price(t1_ms)], self.p[a:b]))
+        return float(pts.min()), float(pts.max())
+
+    def ohlcv(self, t_ms: float, timeframe: str, limit: int = 200, since: int | None = None) -> list[list]:
+        """Свечи timeframe, известные к моменту t_ms (последняя — незакрытая, как у биржи)."""
+        k = int(np.searchsorted(self.c.ts, t_ms, side="right"))
+        if k == 0:
+            return []
+        c = self.c
+        rows = np.column_stack([c.ts[:k], c.open[:k], c.high[:k], c.low[:k], c.close[:k], c.volume[:k]]).astype(np.float64)
+        # текущая свеча — только то, что уже «случилось» к t_ms
+        ts0 = rows[-1, 0]
+        if t_ms < ts0 + self.step:
+            lo, hi = self.range(ts0, t_ms)
+            frac = (t_ms - ts0) / self.step
+            rows[-1, 2] = max(rows[-1, 1], hi)
+            rows[-1, 3] = min(rows[-1, 1], lo)
+            rows[-1, 4] = self.price(t_ms)
+            rows[-1, 5] *= frac
+
+        tf = tf_ms(timeframe)
+        if tf < self.step or tf % self.step:
+            raise ValueError(f"timeframe {timeframe} is not a multiple of the recorded {self.step} ms")
+        if tf != self.step:
+            g = rows[:, 0] // tf * tf
+            starts = np.flatnonzero(np.r_[True, g[1:] != g[:-1]])
+            ends = np.r_[starts[1:], len(rows)]
+            rows = np.column_stack([
+                g[starts], rows[starts, 1],
+                np.maximum.reduceat(rows[:, 2], starts), np.minimum.reduceat(rows[:, 3], starts),
+                rows[ends - 1, 4], np.add.reduceat(rows[:, 5], starts),
+            ])
+        if since is not None:
+            rows = rows[rows[:, 0] >= since][:limit]
+        else:
+            rows = rows[-limit:]
+        return [[int(r[0]), *map(float, r[1:])] for r in rows]
+
+
+class SimExchange:
+    """
+    Бумажная биржа в процессе: тот же интерфейс, что у AsyncBybitClient,
+    поэтому BotEngine гоняется без сети и ключей.
+
+    - цены — PricePath по записанным свечам (dict Candles или OHLCVStore, лениво по символу);
+    - market: по ask/bid ± slippage_bps, taker fee;
+    - limit: пересекающий спред исполняется сразу как taker (post_only — отменяется,
+      как Bybit PostOnly), остальные стоят в книге и исполняются по своей цене (maker),
+      когда путь цены их касается; с вероятностью partial_fill_prob за шаг
+      исполняется только partial_fill_ratio остатка;
+    - позиция net по символу, set_trading_stop — SL/TP и трейл позиции (при одновременном
+      касании — SL), закрытие по цене триггера как market;
+    - order_book — синтетический стакан вокруг bid/ask (book_qty на уровень), amend_order — как /v5/order/amend;
+    - latency_ms (+ jitter) перед каждым запросом.
+
+    Время — SimClock; с ручным clock и фиксированным seed прогон воспроизводим.
+    """
+
+    ws_streams = False  # у симулятора нет WS — движок ходит только через REST-интерфейс
+    parse_fill = staticmethod(BybitClient.parse_fill)
+
+    def __init__(
+        self,
+        data: dict[str, Candles] | None = None,
+        *,
+        store: OHLCVStore | None = None,
+        store_timeframe: str = "1m",
+        clock: SimClock | None = None,
+        speed: float | None = None,
+        balance: float = 10_000.0,
+        fee_maker: float = FEE_MAKER,
+        fee_taker: float = FEE_TAKER,
+        spread_bps: float = 1.0,
+        slippage_bps: float = 0.0,
+        latency_ms: float = 0.0,
+        latency_jitter_ms: float = 0.0,
+        partial_fill_prob: float = 0.0,
+        partial_fill_ratio: float = 0.5,
+        book_qty: float = 25.0,
+        seed: int = 0,
+    ):
+        self._paths = {s: PricePath(c) for s, c in (data or {}).items()}
+        self._store = store
+        self._store_tf = store_timeframe
+        if clock is None:
+            # по умолчанию — с 200-й свечи, чтобы у стратегии сразу было окно истории
+            starts = [p.t[min(200, len(p.c) - 1) * 4] / 1000.0 for p in self._paths.values()]
+            clock = SimClock(max(starts) if starts else time.time(), speed)
+        self.clock = clock
+
+        self.balance = float(balance)
+        self.fee_maker = fee_maker
+        self.fee_taker = fee_taker
+        self.spread = spread_bps / 10_000.0
+        self.slippage = slippage_bps / 10_000.0
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self.partial_fill_prob = partial_fill_prob
+        self.partial_fill_ratio = partial_fill_ratio
+        self.book_qty = book_qty
+        self._rng = random.Random(seed)
+
+        self._ids = itertools.count(1)
+        self.orders: dict[str, dict] = {}
+        self._open: dict[str, list[str]] = {}        # symbol -> id открытых лимиток
+        self._positions: dict[str, dict] = {}        # symbol -> {qty (signed), entry, sl, tp}
+        self.leverage: dict[str, int] = {}
+        self._synced: dict[str, float] = {}          # symbol -> ms, до которого обработан путь цены
+        self.fees_paid = 0.0
+        self.realized_pnl = 0.0
+        self.amends = 0
+        self.order_amends = 0
+        self.fills: list[dict] = []
+
+    @classmethod
+    def from_store(cls, symbols: list[str], timeframe: str = "1m", start: float | None = None,
+                   end: float | None = None, store: OHLCVStore | None = None, **kwargs) -> "SimExchange":
+        """Пути цен из локального OHLCVStore; start/end — секунды epoch."""
+        store = store or OHLCVStore()
+        data = {}
+        for s in symbols:
+            c = store.read(s, timeframe, None, int(end * 1000) if end else None)
+            if c is None or len(c) == 0:
+                raise ValueError(f"No local {timeframe} candles for {s}; run python -m app.ohlcv_store first")
+            data[s] = c
+        sim = cls(data, store=store, store_timeframe=timeframe, **kwargs)
+        if start is not None:
+            sim.clock = SimClock(start, kwargs.get("speed"))
+        return sim
+
+    # ---------- lifecycle ----------
+
+    async def open(self):
+        return None
+
+    async def close(self):
+        return None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    # ---------- internals ----------
+
+    def _now_ms(self) -> float:
+        return self.clock.time() * 1000.0
+
+    def _path(self, symbol: str) -> PricePath:
+        p = self._paths.get(symbol)
+        if p is None:
+            c = self._store.read(symbol, self._store_tf) if self._store is not None else None
+            if c is None or len(c) == 0:
+                raise ccxt.BadSymbol(f"sim: no price history for {symbol}")
+            p = self._paths[symbol] = PricePath(c)
+        return p
+
+    def _quote(self, symbol: str) -> tuple[float, float, float]:
+        last = self._path(symbol).price(self._now_ms())
+        half = last * self.spread / 2.0
+        return last - half, last + half, last
+
+    async def _request(self):
+        # сетевая задержка, затем мир догоняет текущее sim-время
+        if self.latency_ms or self.latency_jitter_ms:
+            delay = self.latency_ms + self._rng.uniform(0.0, self.latency_jitter_ms)
+            await asyncio.sleep(delay / 1000.0)
+        self.sync()
+
+    def sync(self):
+        """Прогнать путь цены до текущего времени: лимитки и SL/TP позиций."""
+        now = self._now_ms()
+        for symbol in set(self._open) | set(self._positions):
+            t0 = self._synced.get(symbol, now)
+            self._synced[symbol] = now
+            if now <= t0:
+                continue
+            lo, hi = self._path(symbol).range(t0, now)
+            self._match_resting(symbol, lo, hi)
+            self._check_stops(symbol, lo, hi)
+
+    def _match_resting(self, symbol: str, lo: float, hi: float):
+        ids = self._open.get(symbol, [])
+        for oid in list(ids):
+            o = self.orders[oid]
+            touched = lo <= o["price"] if o["side"] == "buy" else hi >= o["price"]
+            if not touched:
+                continue
+            qty = o["remaining"]
+            if self._rng.random() < self.partial_fill_prob:
+                qty *= self.partial_fill_ratio
+            self._fill(o, qty, o["price"], self.fee_maker)
+            if o["status"] != "open":
+                ids.remove(oid)
+        if not ids:
+            self._open.pop(symbol, None)
+
+    def _check_stops(self, symbol: str, lo: float, hi: float):
+        pos = self._positions.get(symbol)
+        if not pos or not pos["qty"]:
+            return
+        long = pos["qty"] > 0
+        sl, tp, trail = pos.get("sl"), pos.get("tp"), pos.get("trail_sl")
+        # сначала старые уровни (порядок цен внутри шага неизвестен — консервативно), потом подтягиваем трейл
+        hit_trail = trail is not None and (lo <= trail if long else hi >= trail)
+        hit_sl = sl is not None and (lo <= sl if long else hi >= sl)
+        hit_tp = tp is not None and (hi >= tp if long else lo <= tp)
+        if hit_sl or hit_trail or hit_tp:
+            # оба в одном шаге — считаем стоп (консервативно); из двух стопов — ближний к цене
+            if hit_sl or hit_trail:
+                stops = [x for x, h in ((sl, hit_sl), (trail, hit_trail)) if h]
+                px = max(stops) if long else min(stops)
+                kind = "TrailingStop" if hit_trail and px == trail else "StopLoss"
+            else:
+                px, kind = tp, "TakeProfit"
+            side = "sell" if long else "buy"
+            px *= 1 - self.slippage if long else 1 + self.slippage
+            o = self._new_order(symbol, "market", side, abs(pos["qty"]), None, reduce_only=True)
+            o["info"]["stopOrderType"] = kind
+            self._fill(o, o["amount"], px, self.fee_taker)
+            return
+        dist = pos.get("trailing")
+        if dist:
+            act = pos.get("active")
+            if long and (act is None or hi >= act):
+                pos["trail_sl"] = max(trail or 0.0, hi - dist)
+            elif not long and (act is None or lo <= act):
+                pos["trail_sl"] = min(trail if trail is not None else float("inf"), lo + dist)
+
+    def _new_order(self, symbol: str, type_: str, side: str, qty: float, price: float | None,
+                   reduce_only: bool = False) -> dict:
+        oid = str(next(self._ids))
+        ts = int(self._now_ms())
+        o = {
+            "id": oid,
+            "clientOrderId": None,
+            "symbol": symbol,
+            "type": type_,
+            "side": side,
+            "price": price,
+            "amount": float(qty),
+            "filled": 0.0,
+            "remaining": float(qty),
+            "cost": 0.0,
+            "average": None,
+            "status": "open",
+            "timestamp": ts,
+            "datetime": ccxt.Exchange.iso8601(ts),
+            "lastTradeTimestamp": None,
+            "reduceOnly": reduce_only,
+            "fee": {"cost": 0.0, "currency": "USDT"},
+            "trades": [],
+            "info": {"orderId": oid},
+        }
+        self.orders[oid] = o
+        return o
+
+    def _fill(self, o: dict, qty: float, price: float, fee_rate: float):
+        qty = min(qty, o["remaining"])
+        if qty <= 0:
+            return
+        fee = qty * price * fee_rate
+        ts = int(self._now_ms())
+        o["cost"] += qty * price
+        o["filled"] += qty
+        o["remaining"] = max(0.0, o["amount"] - o["filled"])
+        o["average"] = o["cost"] / o["filled"]
+        o["fee"]["cost"] += fee
+        o["lastTradeTimestamp"] = ts
+        o["trades"].append({"price": price, "amount": qty, "fee": {"cost": fee, "currency": "USDT"}, "timestamp": ts})
+        if o["remaining"] <= 1e-12:
+            o["remaining"] = 0.0
+            o["status"] = "closed"
+        self.fills.append({"order_id": o["id"], "symbol": o["symbol"], "side": o["side"], "qty": qty,
+                           "price": price, "fee": fee, "ts": ts, "stop_type": o["info"].get("stopOrderType")})
+        self._apply_position(o["symbol"], o["side"], qty, price, fee)
+
+    def _apply_position(self, symbol: str, side: str, qty: float, price: float, fee: float):
+        pos = self._positions.setdefault(symbol, {"qty": 0.0, "entry": 0.0, "sl": None, "tp": None,
+                                                 "trailing": None, "active": None, "trail_sl": None})
+        signed = qty if side == "buy" else -qty
+        q0 = pos["qty"]
+        if q0 == 0 or (q0 > 0) == (signed > 0):
+            q1 = q0 + signed
+            pos["entry"] = (pos["entry"] * abs(q0) + price * qty) / abs(q1)
+            pos["qty"] = q1
+        else:
+            closing = min(abs(q0), qty)
+            pnl = (price - pos["entry"]) * closing * (1 if q0 > 0 else -1)
+            self.realized_pnl += pnl
+            self.balance += pnl
+            q1 = q0 + signed
+            if abs(q1) <= 1e-12:
+                q1 = 0.0
+            elif (q1 > 0) != (q0 > 0):
+                pos["entry"] = price  # переворот: остаток открыт по цене сделки
+            pos["qty"] = q1
+        self.balance -= fee
+        self.fees_paid += fee
+        if pos["qty"] == 0:
+            self._positions.pop(symbol, None)  # вместе с SL/TP, как у биржи
+        self._synced.setdefault(symbol, self._now_ms())
+
+    def _snapshot(self, o: dict) -> dict:
+        return {**o, "fee": dict(o["fee"]), "trades": list(o["trades"]), "info": dict(o["info"])}
+
+    # ---------- Market data ----------
+
+    async def ticker(self, symbol: str):
+        await self._request()
+        bid, ask, last = self._quote(symbol)
+        return normalize_ticker(symbol, {"last": last, "bid": bid, "ask": ask, "timestamp": int(self._now_ms())})
+
+    async def tickers(self, symbols: list[str]) -> dict[str, dict]:
+        await self._request()
+        now = self._now_ms()
+        out = {}
+        for s in symbols:
+            bid, ask, last = self._quote(s)
+            c = self._path(s).c
+            a, b = np.searchsorted(c.ts, [now - 86_400_000, now])
+            out[s] = {**normalize_ticker(s, {"last": last, "bid": bid, "ask": ask, "timestamp": int(now)}),
+                      "quote_volume": float(np.dot(c.volume[a:b], c.close[a:b]))}
+        return out
+
+    async def order_book(self, symbol: str, depth: int = 25) -> dict:
+        """Синтетический стакан вокруг bid/ask: шаг — спред, объём уровня растёт с удалением."""
+        await self._request()
+        bid, ask, _ = self._quote(symbol)
+        step = max(ask - bid, ask * 1e-5)
+        lv = range(min(depth, 50))
+        return {
+            "bids": [[bid - i * step, self.book_qty * (1 + i)] for i in lv],
+            "asks": [[ask + i * step, self.book_qty * (1 + i)] for i in lv],
+            "timestamp": int(self._now_ms()),
+        }
+
+    async def ohlcv(self, symbol: str, timeframe: str, limit: int = 200, since: int | None = None):
+        await self._request()
+        return self._path(symbol).ohlcv(self._now_ms(), timeframe, limit, since)
+
+    async def balance_usdt(self) -> float:
+        await self._request()
+        return self.equity()
+
+    def equity(self) -> float:
+        upnl = 0.0
+        for s, p in self._positions.items():
+            upnl += (self._quote(s)[2] - p["entry"]) * p["qty"]
+        return self.balance + upnl
+
+    async def set_leverage(self, symbol: str, leverage: int):
+        await self._request()
+        if self.leverage.get(symbol) == int(leverage):
+            return {"ok": True, "note": "leverage already set"}
+        self.leverage[symbol] = int(leverage)
+        return {"symbol": symbol, "leverage": int(leverage)}
+
+    # ---------- Orders / Fills ----------
+
+    def _check_margin(self, symbol: str, qty: float, price: float):
+        lev = self.leverage.get(symbol, 1)
+        used = sum(abs(p["qty"]) * p["entry"] / self.leverage.get(s, 1) for s, p in self._positions.items())
+        if used + qty * price / lev > self.equity():
+            raise ccxt.InsufficientFunds(f"sim: insufficient margin for {qty} {symbol}")
+
+    async def create_limit(self, symbol: str, side: str, qty: float, price: float, post_only: bool = False):
+        await self._request()
+        if qty <= 0:
+            raise ccxt.InvalidOrder("sim: qty must be positive")
+        bid, ask, _ = self._quote(symbol)
+        self._check_margin(symbol, qty, price)
+        o = self._new_order(symbol, "limit", side, qty, float(price))
+        if post_only:
+            o["info"]["timeInForce"] = "PostOnly"
+        crosses = price >= ask if side == "buy" else price <= bid
+        if crosses and post_only:
+            o["status"] = "canceled"  # Bybit: PostOnly, который взял бы ликвидность, отменяется
+            o["info"]["rejectReason"] = "EC_PostOnlyWillTakeLiquidity"
+        elif crosses:
+            self._fill(o, qty, min(price, ask) if side == "buy" else max(price, bid), self.fee_taker)
+        else:
+            self._open.setdefault(symbol, []).append(o["id"])
+            self._synced.setdefault(symbol, self._now_ms())
+        return self._snapshot(o)
+
+    async def create_market(self, symbol: str, side: str, qty: float):
+        await self._request()
+        if qty <= 0:
+            raise ccxt.InvalidOrder("sim: qty must be positive")
+        bid, ask, _ = self._quote(symbol)
+        px = ask * (1 + self.slippage) if side == "buy" else bid * (1 - self.slippage)
+        pos = self._positions.get(symbol)
+        reduces = pos is not None and (pos["qty"] > 0) != (side == "buy")
+        if not reduces:
+            self._check_margin(symbol, qty, px)
+        o = self._new_order(symbol, "market", side, qty, None)
+        self._fill(o, qty, px, self.fee_taker)
+        return self._snapshot(o)
+
+    async def cancel_order(self, order_id: str, symbol: str):
+        await self._request()
+        o = self.orders.get(order_id)
+        if o is None or o["status"] != "open":
+            raise ccxt.OrderNotFound(f"sim: order {order_id} not open")
+        o["status"] = "canceled"
+        ids = self._open.get(symbol, [])
+        if order_id in ids:
+            ids.remove(order_id)
+        return self._snapshot(o)
+
+    async def amend_order(self, order_id: str, symbol: str, price: float | None = None, qty: float | None = None):
+        """Как /v5/order/amend: открытая лимитка меняет цену/объём; PostOnly через спред — отказ."""
+        await self._request()
+        o = self.orders.get(order_id)
+        if o is None or o["status"] != "open":
+            raise ccxt.OrderNotFound(f"sim: order {order_id} not open")
+        if qty is not None:
+            if qty <= o["filled"]:
+                raise ccxt.InvalidOrder("sim: qty below filled")
+            o["amount"] = float(qty)
+            o["remaining"] = o["amount"] - o["filled"]
+        if price is not None:
+            bid, ask, _ = self._quote(symbol)
+            crosses = price >= ask if o["side"] == "buy" else price <= bid
+            if crosses and o["info"].get("timeInForce") == "PostOnly":
+                raise ccxt.InvalidOrder("sim: PostOnly amend would take liquidity")
+            o["price"] = float(price)
+            if crosses:
+                self._fill(o, o["remaining"], min(price, ask) if o["side"] == "buy" else max(price, bid), self.fee_taker)
+                ids = self._open.get(symbol, [])
+                if o["status"] != "open" and order_id in ids:
+                    ids.remove(order_id)
+        self.order_amends += 1
+        return {"retCode": 0, "result": {"orderId": order_id}}
+
+    async def fetch_order(self, order_id: str, symbol: str, params: dict | None = None):
+        await self._request()
+        o = self.orders.get(order_id)
+        if o is None:
+            raise ccxt.OrderNotFound(f"sim: order {order_id} not found")
+        return self._snapshot(o)
+
+    async def set_trading_stop(self, symbol: str, stop_loss: float | None, take_profit: float | None,
+                               trailing_stop: float | None = None, active_price: float | None = None):
+        """Как /v5/position/trading-stop: None — не трогать, 0 — снять."""
+        await self._request()
+        pos = self._positions.get(symbol)
+        if not pos or not pos["qty"]:
+            raise ccxt.InvalidOrder("sim: can not set tp/sl/ts for zero position")
+        if stop_loss is not None:
+            pos["sl"] = float(stop_loss) or None
+        if take_profit is not None:
+            pos["tp"] = float(take_profit) or None
+        if active_price is not None:
+            pos["active"] = float(active_price) or None
+        if trailing_stop is not None:
+            pos["trailing"] = float(trailing_stop) or None
+            pos["trail_sl"] = None
+        self.amends += 1
+        return {"retCode": 0, "retMsg": "OK"}
+
+    def round_price(self, symbol: str, price: float) -> float:
+        return round(float(price), 8)
+
+    def round_qty(self, symbol: str, qty: float) -> float:
+        return round(float(qty), 6)
+
+    async def positions(self, symbols: list[str] | None = None) -> dict[str, dict]:
+        await self._request()
+        return {
+            s: {"qty": p["qty"], "entry": p["entry"], "sl": p.get("sl"), "tp": p.get("tp"), "trailing": p.get("trailing")}
+            for s, p in self._positions.items()
+            if p["qty"] and (symbols is None or s in symbols)
+        }
+
+    async def my_trades(self, symbol: str, since: int | None = None) -> list[dict]:
+        await self._request()
+        return [
+            {k: f[k] for k in ("order_id", "side", "price", "qty", "fee", "ts", "stop_type")}
+            for f in self.fills
+            if f["symbol"] == symbol and (since is None or f["ts"] >= since)
+        ]
+
+    def _market_id(self, symbol: str) -> str:
+        return symbol.split(":")[0].replace("/", "")
+
+    async def get_order_status_safe(self, symbol: str, order_id: str) -> dict | None:
+        await self._request()
+        o = self.orders.get(order_id)
+        return self._snapshot(o) if o is not None else None
+
+    async def wait_fill(self, symbol: str, order_id: str, timeout_sec: int, poll_sec: float = 0.05):
+        """Ждём исполнения (таймаут — в секундах движка, т.е. настенных)."""
+        loop = asyncio.get_running_loop()
+        t0 = loop.time()
+        last = None
+        while loop.time() - t0 <= timeout_sec:
+            last = await self.get_order_status_safe(symbol, order_id)
+            if last and last["status"] in ("closed", "filled", "canceled"):
+                return last
+            await asyncio.sleep(poll_sec)
+        return last
+
+    def stats(self) -> dict:
+        return {
+            "sim_time": self.clock.utcnow().isoformat(),
+            "balance": self.balance,
+            "equity": self.equity(),
+            "realized_pnl": self.realized_pnl,
+            "fees": self.fees_paid,
+            "fills": len(self.fills),
+            "amends": self.amends,
+            "order_amends": self.order_amends,
+            "open_orders": sum(len(v) for v in self._open.values()),
+            "positions": {s: dict(p) for s, p in self._positions.items()},
+        }
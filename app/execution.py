@@ -0,0 +1,281 @@
+# app/execution.py
+from __future__ import annotations
+
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable
+
+from app.metrics import Counter, Histogram
+from app.risk import spread_pct
+
+# bps от arrival mid: отрицательные — цена лучше mid (maker), положительные — хуже
+SLIPPAGE_BUCKETS = (-10.0, -5.0, -2.0, -1.0, 0.0, 1.0, 2.0, 5.0, 10.0, 20.0, 50.0)
+
+EXEC_SLIPPAGE = Histogram("exec_slippage_bps", "Entry fill vs arrival mid, bps (positive = worse)", ("mode",), SLIPPAGE_BUCKETS)
+EXEC_FILL_RATIO = Histogram("exec_fill_ratio", "Filled by limit orders / requested qty", ("mode",),
+                            (0.0, 0.25, 0.5, 0.75, 0.9, 0.99, 1.0))
+EXEC_ORDERS = Counter("exec_orders_total", "Orders sent by the entry executor", ("kind",))
+EXEC_OUTCOME = Counter("exec_outcome_total", "Entry executions by outcome", ("outcome",))
+
+
+def slippage_bps(side: str, price: float, bid: float, ask: float) -> float:
+    """Цена исполнения против arrival mid, bps; знак — «хуже для нас»."""
+    mid = (bid + ask) / 2.0
+    if mid <= 0 or not price:
+        return 0.0
+    d = (price - mid) / mid * 10_000.0
+    return d if side == "buy" else -d
+
+
+@dataclass
+class ExecResult:
+    side: str
+    qty: float
+    arrival_bid: float
+    arrival_ask: float
+    filled: float = 0.0
+    cost: float = 0.0
+    fee: float = 0.0
+    maker_qty: float = 0.0      # исполнено лимитками
+    taker_qty: float = 0.0      # исполнено market (fallback)
+    orders: int = 0
+    reprices: int = 0
+    last_order_id: str | None = None
+    outcome: str = ""           # FILLED | TIMEOUT | SPREAD | SLIPPAGE | CANCELLED
+    t0: float = field(default_factory=time.perf_counter)
+    first_ack: float | None = None  # perf_counter первого подтверждённого ордера
+    duration: float = 0.0
+
+    @property
+    def remaining(self) -> float:
+        return max(0.0, self.qty - self.filled)
+
+    @property
+    def avg(self) -> float | None:
+        return self.cost / self.filled if self.filled > 0 else None
+
+    def add_market(self, order_id: str | None, qty: float, price: float, fee: float | None):
+        self.orders += 1
+        self.filled += qty
+        self.taker_qty += qty
+        self.cost += qty * price
+        self.fee += fee or 0.0
+        if order_id is not None:
+            self.last_order_id = str(order_id)
+
+    def stats(self) -> dict:
+        """Строка для Execution (fill quality)."""
+        return {
+            "side": self.side, "qty": self.qty, "filled": self.filled, "avg_price": self.avg,
+            "arrival_bid": self.arrival_bid, "arrival_ask": self.arrival_ask,
+            "slippage_bps": slippage_bps(self.side, self.avg, self.arrival_bid, self.arrival_ask) if self.avg else None,
+            "maker_qty": self.maker_qty, "taker_qty": self.taker_qty, "fee_usdt": self.fee,
+            "orders": self.orders, "reprices": self.reprices, "outcome": self.outcome,
+            "duration_ms": round(self.duration * 1000.0, 1),
+        }
+
+
+class _Child:
+    __slots__ = ("id", "price", "qty", "filled", "cost", "fee")
+
+    def __init__(self, oid: str, price: float, qty: float):
+        self.id = oid
+        self.price = price
+        self.qty = qty
+        self.filled = 0.0
+        self.cost = 0.0
+        self.fee = 0.0
+
+
+class LimitExecutor:
+    """
+    Пассивный вход по стакану: лимитка стоит на лучшей цене своей стороны
+    и переставляется (amend, при отказе — cancel+new), когда стакан уходит.
+    Крупный объём режется на дочерние ордера не больше child_depth_pct%
+    видимой глубины своей стороны (top levels). В реальном времени:
+    спред шире max_spread_pct или цена ушла дальше max_slippage_pct от
+    arrival — ордер снимается и ждём возврата; post_only — как у биржи.
+
+    Что не исполнилось к таймауту — в result.remaining, решение
+    о market fallback за вызывающим. Если задачу отменили — дочерний ордер
+    снимается, CancelledError пробрасывается, а исполненное остаётся
+    в self.result (outcome=CANCELLED).
+    """
+
+    def __init__(
+        self,
+        client,
+        symbol: str,
+        side: str,
+        qty: float,
+        *,
+        book: Callable[[str], Awaitable[dict]],
+        order_state: Callable[[str, str], Awaitable[dict | None]],
+        post_only: bool,
+        timeout_sec: float,
+        max_spread_pct: float,
+        max_slippage_pct: float,
+        reprice_sec: float = 1.0,
+        child_depth_pct: float = 25.0,
+        levels: int = 5,
+    ):
+        self.client = client
+        self.symbol = symbol
+        self.side = side
+        self.qty = float(qty)
+        self.book = book
+        self.order_state = order_state
+        self.post_only = post_only
+        self.timeout_sec = timeout_sec
+        self.max_spread_pct = float(max_spread_pct)
+        self.max_slippage_pct = float(max_slippage_pct)
+        self.reprice_sec = max(0.05, float(reprice_sec))
+        self.child_depth_pct = float(child_depth_pct)
+        self.levels = levels
+        self.result: ExecResult | None = None
+
+    # ---------- helpers ----------
+
+    def _round_price(self, p: float) -> float:
+        r = getattr(self.client, "round_price", None)
+        return r(self.symbol, p) if r is not None else p
+
+    def _round_qty(self, q: float) -> float:
+        r = getattr(self.client, "round_qty", None)
+        return r(self.symbol, q) if r is not None else q
+
+    @staticmethod
+    def _top(book: dict) -> tuple[float, float]:
+        bids, asks = book.get("bids") or [], book.get("asks") or []
+        return (float(bids[0][0]) if bids else 0.0), (float(asks[0][0]) if asks else 0.0)
+
+    def _child_qty(self, book: dict) -> float:
+        rem = self.result.remaining
+        if self.child_depth_pct <= 0:
+            return rem
+        own = book.get("bids" if self.side == "buy" else "asks") or []
+        depth = sum(float(q) for _, q in own[: self.levels])
+        child = self._round_qty(min(rem, depth * self.child_depth_pct / 100.0))
+        # стакан пустой/тонкий или хвост меньше лота — отдаём весь остаток одним ордером
+        return child if child > 0 and rem - child > 0 and self._round_qty(rem - child) > 0 else rem
+
+    def _account(self, c: _Child, o: dict | None):
+        if not o:
+            return
+        filled = float(o.get("filled") or 0.0)
+        d = filled - c.filled
+        if d <= 0:
+            return
+        avg = float(o.get("average") or 0.0) or c.price
+        cost = avg * filled
+        fee = float((o.get("fee") or {}).get("cost") or 0.0)
+        r = self.result
+        r.filled += d
+        r.maker_qty += d
+        r.cost += cost - c.cost
+        r.fee += max(0.0, fee - c.fee)
+        r.last_order_id = c.id
+        c.filled, c.cost, c.fee = filled, cost, max(fee, c.fee)
+
+    async def _place(self, price: float, qty: float) -> _Child | None:
+        o = await self.client.create_limit(self.symbol, self.side, qty, price, post_only=self.post_only)
+        r = self.result
+        r.orders += 1
+        EXEC_ORDERS.inc(kind="limit")
+        if r.first_ack is None:
+            r.first_ack = time.perf_counter()
+        c = _Child(str(o["id"]), price, qty)
+        self._account(c, o)
+        return c if (o.get("status") or "open") == "open" else None
+
+    async def _cancel(self, c: _Child) -> None:
+        try:
+            o = await self.client.cancel_order(c.id, self.symbol)
+        except Exception:
+            o = None  # уже исполнился/отменён — финальное состояние дочитаем ниже
+        if not o or float(o.get("filled") or 0.0) <= c.filled:
+            try:
+                o = await self.order_state(self.symbol, c.id)
+            except Exception:
+                pass
+        self._account(c, o)
+
+    async def _reprice(self, c: _Child, price: float) -> _Child | None:
+        self.result.reprices += 1
+        amend = getattr(self.client, "amend_order", None)
+        if amend is not None:
+            try:
+                await amend(c.id, self.symbol, price=price)
+                EXEC_ORDERS.inc(kind="amend")
+                c.price = price
+                return c
+            except Exception:
+                pass  # ордер уже исполнился/биржа не дала amend — cancel+new
+        await self._cancel(c)
+        if self.result.remaining <= 0:
+            return None
+        return await self._place(price, self._round_qty(max(0.0, c.qty - c.filled)) or self.result.remaining)
+
+    # ---------- main ----------
+
+    async def run(self) -> ExecResult:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout_sec
+        bid, ask = self._top(await self.book(self.symbol))
+        r = self.result = ExecResult(self.side, self.qty, bid, ask)
+        arrival = ask if self.side == "buy" else bid
+        worst = arrival * (1 + self.max_slippage_pct / 100.0) if self.side == "buy" else arrival * (1 - self.max_slippage_pct / 100.0)
+        c: _Child | None = None
+        hold = ""
+        book = None
+        try:
+            while True:
+                if c is not None:
+                    o = await self.order_state(self.symbol, c.id)
+                    self._account(c, o)
+                    if o is not None and (o.get("status") or "open") != "open":
+                        c = None
+                if self._round_qty(r.remaining) <= 0 or loop.time() >= deadline:
+                    break
+
+                book = await self.book(self.symbol) if book is None else book
+                bid, ask = self._top(book)
+                target = self._round_price(bid if self.side == "buy" else ask)
+                if spread_pct(bid, ask) > self.max_spread_pct:
+                    hold = "SPREAD"
+                elif (target > worst) if self.side == "buy" else (target < worst):
+                    hold = "SLIPPAGE"
+                else:
+                    hold = ""
+
+                if hold:
+                    # стоять в книге по такой цене не хотим — снимаем и ждём
+                    if c is not None:
+                        await self._cancel(c)
+                        c = None
+                elif c is None:
+                    c = await self._place(target, self._child_qty(book))
+                elif target != c.price:
+                    c = await self._reprice(c, target)
+
+                await asyncio.sleep(min(self.reprice_sec, max(0.0, deadline - loop.time())))
+                book = None
+        except asyncio.CancelledError:
+            hold = "CANCELLED"
+            raise
+        finally:
+            if c is not None:
+                await asyncio.shield(self._cancel(c))
+            r.duration = time.perf_counter() - r.t0
+            r.outcome = "FILLED" if self._round_qty(r.remaining) <= 0 else (hold or "TIMEOUT")
+        return r
+
+
+def record(mode: str, r: ExecResult) -> None:
+    """Итог исполнения в метрики (строка в БД пишется вместе со сделкой)."""
+    EXEC_OUTCOME.inc(outcome=r.outcome)
+    if r.avg:
+        EXEC_SLIPPAGE.observe(slippage_bps(r.side, r.avg, r.arrival_bid, r.arrival_ask), mode=mode)
+    if r.qty > 0:
+        EXEC_FILL_RATIO.observe(r.maker_qty / r.qty, mode=mode)
@@ -0,0 +1,176 @@
+# app/indicators.py
+from __future__ import annotations
+
+import numpy as np
+
+
+class CandleBuffer:
+    """
+    Кольцевой буфер OHLCV фиксированного размера на numpy-массивах.
+    update() — O(1): новая свеча дописывается, свеча с тем же ts — заменяется.
+    Индексация как у list: buf[-1] -> (ts, o, h, l, c, v).
+    """
+
+    COLS = ("ts", "open", "high", "low", "close", "volume")
+
+    def __init__(self, maxlen: int = 200):
+        self.maxlen = int(maxlen)
+        self.ts = np.zeros(self.maxlen, dtype=np.int64)
+        self.data = np.zeros((self.maxlen, 5), dtype=np.float64)  # o, h, l, c, v
+        self._head = 0  # куда пишем следующую свечу
+        self._len = 0
+
+    def __len__(self) -> int:
+        return self._len
+
+    def _pos(self, i: int) -> int:
+        if i < 0:
+            i += self._len
+        if not 0 <= i < self._len:
+            raise IndexError("candle index out of range")
+        return (self._head - self._len + i) % self.maxlen
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self._len))]
+        p = self._pos(i)
+        return [int(self.ts[p]), *self.data[p].tolist()]
+
+    def __iter__(self):
+        for i in range(self._len):
+            yield self[i]
+
+    @property
+    def last_ts(self) -> int | None:
+        return int(self.ts[(self._head - 1) % self.maxlen]) if self._len else None
+
+    def close(self, i: int = -1) -> float:
+        return float(self.data[self._pos(i), 3])
+
+    def update(self, candle) -> str | None:
+        """Возвращает "append" | "amend" | None (свеча старше последней — игнор)."""
+        ts = int(candle[0])
+        last = self.last_ts
+        if last is not None and ts < last:
+            return None
+        if last is not None and ts == last:
+            p = (self._head - 1) % self.maxlen
+            self.data[p] = candle[1:6]
+            return "amend"
+        self.ts[self._head] = ts
+        self.data[self._head] = candle[1:6]
+        self._head = (self._head + 1) % self.maxlen
+        self._len = min(self._len + 1, self.maxlen)
+        return "append"
+
+    def extend(self, candles) -> None:
+        for c in candles:
+            self.update(c)
+
+    def column(self, name: str) -> np.ndarray:
+        """Колонка в хронологическом порядке (копия)."""
+        idx = (np.arange(self._len) + self._head - self._len) % self.maxlen
+        if name == "ts":
+            return self.ts[idx]
+        return self.data[idx, self.COLS.index(name) - 1]
+
+    def closes(self) -> np.ndarray:
+        return self.column("close")
+
+
+class EMA:
+    """
+    EMA с SMA-затравкой по первым period значениям (как strategy._ema).
+    update(x) — новая точка, amend(x) — заменить последнюю (свеча ещё не закрыта).
+    """
+
+    def __init__(self, period: int):
+        self.period = int(period)
+        self.k = 2 / (self.period + 1)
+        self.count = 0
+        self._seed = 0.0
+        self.value: float | None = None
+        self.prev: float | None = None       # значение до последней точки
+        self._saved = (0, 0.0, None, None)   # состояние до последней точки — для amend
+
+    def update(self, x: float) -> float | None:
+        self._saved = (self.count, self._seed, self.value, self.prev)
+        self._push(float(x))
+        return self.value
+
+    def amend(self, x: float) -> float | None:
+        self.count, self._seed, self.value, self.prev = self._saved
+        self._push(float(x))
+        return self.value
+
+    def _push(self, x: float):
+        self.count += 1
+        if self.count < self.period:
+            self._seed += x
+            return
+        if self.count == self.period:
+            self.prev, self.value = self.value, (self._seed + x) / self.period
+            return
+        self.prev, self.value = self.value, x * self.k + self.value * (1 - self.k)
+
+
+class ATR:
+    """ATR по Уайлдеру (затравка — среднее TR за period свечей)."""
+
+    def __init__(self, period: int = 14):
+        self.period = int(period)
+        self.count = 0
+        self._seed = 0.0
+        self.prev_close: float | None = None
+        self.value: float | None = None
+        self._saved = (0, 0.0, None, None)
+
+    def update(self, high: float, low: float, close: float) -> float | None:
+        self._saved = (self.count, self._seed, self.prev_close, self.value)
+        self._push(float(high), float(low), float(close))
+        return self.value
+
+    def amend(self, high: float, low: float, close: float) -> float | None:
+        self.count, self._seed, self.prev_close, self.value = self._saved
+        self._push(float(high), float(low), float(close))
+        return self.value
+
+    def _push(self, high: float, low: float, close: float):
+        pc = self.prev_close
+        tr = high - low if pc is None else max(high - low, abs(high - pc), abs(low - pc))
+        self.prev_close = close
+        self.count += 1
+        if self.count < self.period:
+            self._seed += tr
+        elif self.count == self.period:
+            self.value = (self._seed + tr) / self.period
+        else:
+            self.value = (self.value * (self.period - 1) + tr) / self.period
+
+
+def ema_array(x: np.ndarray, period: int) -> np.ndarray:
+    """
+    Векторный EMA вдоль последней оси (1-D ряд или 2-D символы × время),
+    та же семантика, что у EMA: SMA-затравка в точке period-1, раньше — NaN.
+    Рекурсия ema[t] = a*ema[t-1] + k*x[t] считается блоками в замкнутой форме
+    через cumsum; длина блока ограничена так, чтобы a^-B не терял точность.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    n = x.shape[-1]
+    out = np.full(x.shape, np.nan)
+    if n < period:
+        return out
+
+    k = 2 / (period + 1)
+    a = 1 - k
+    out[..., period - 1] = x[..., :period].mean(axis=-1)
+    block = int(max(1, min(1024, np.log(1e4) / -np.log(a)))) if a > 0 else 1
+
+    e0 = out[..., period - 1]
+    for s in range(period, n, block):
+        e = min(s + block, n)
+        j = np.arange(e - s)
+        cs = np.cumsum(x[..., s:e] * a ** (-j), axis=-1)
+        out[..., s:e] = a ** (j + 1) * e0[..., None] + k * a ** j * cs
+        e0 = out[..., e - 1]
+    return out
@@ -0,0 +1,146 @@
+# app/live.py
+from __future__ import annotations
+
+import asyncio
+import json
+import threading
+from collections import deque
+from datetime import date, datetime
+
+from app import repo
+from app.config import LIVE_CLIENT_QUEUE, LIVE_REPLAY
+from app.metrics import Gauge
+
+
+def _json_default(o):
+    if isinstance(o, (datetime, date)):
+        return o.isoformat()
+    raise TypeError(f"{type(o).__name__} is not JSON serializable")
+
+
+def sse_frame(kind: str, data, seq: int | None = None) -> bytes:
+    body = json.dumps(data, default=_json_default, separators=(",", ":"))
+    head = f"id: {seq}\n" if seq is not None else ""
+    return f"{head}event: {kind}\ndata: {body}\n\n".encode()
+
+
+class _Client:
+    __slots__ = ("loop", "queue", "closed")
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, maxsize: int):
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.closed = False
+
+
+class LiveHub:
+    """
+    Fan-out живых обновлений для дашборда (SSE). Источники — repo pub/sub
+    (события и сделки сразу после commit) и движок (статус), из любых потоков;
+    БД для этого не перечитывается.
+
+    Каждое сообщение сериализуется один раз в готовый SSE-кадр и раздаётся
+    всем вкладкам ссылкой, так что подключение стоит одну очередь. Последние
+    replay кадров держим в кольце: переподключение с Last-Event-ID
+    дочитывает пропущенное. Медленный клиент с переполненной очередью
+    отключается — браузер переподключится и дочитает из кольца
+    (или получит reset и перечитает списки по REST).
+    """
+
+    def __init__(self, replay: int = LIVE_REPLAY, client_queue: int = LIVE_CLIENT_QUEUE):
+        self.client_queue = client_queue
+        self._ring: deque[tuple[int, bytes]] = deque(maxlen=replay)
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._clients: dict[asyncio.AbstractEventLoop, set[_Client]] = {}
+        self._last_status: str | None = None
+        self.published = 0
+        self.kicked = 0
+
+    # ---------- producer side (любой поток) ----------
+
+    def publish(self, kind: str, data) -> None:
+        with self._lock:
+            self._seq += 1
+            item = (self._seq, sse_frame(kind, data, self._seq))
+            self._ring.append(item)
+            loops = list(self._clients)
+            self.published += 1
+        for loop in loops:
+            try:
+                loop.call_soon_threadsafe(self._fanout, loop, item)
+            except RuntimeError:
+                pass  # loop сервера уже закрыт
+
+    def publish_status(self, status: dict) -> None:
+        # статус шлём только при изменении — движок зовёт это на каждом цикле
+        body = json.dumps(status, default=_json_default, sort_keys=True)
+        with self._lock:
+            if body == self._last_status:
+                return
+            self._last_status = body
+        self.publish("status", status)
+
+    def _on_events(self, rows: list[dict]) -> None:
+        for r in rows:
+            self.publish("event", r)
+
+    def _on_trade(self, row: dict) -> None:
+        self.publish("trade", row)
+
+    # ---------- consumer side (loop сервера) ----------
+
+    def _fanout(self, loop: asyncio.AbstractEventLoop, item: tuple[int, bytes]) -> None:
+        for c in list(self._clients.get(loop, ())):
+            try:
+                c.queue.put_nowait(item)
+            except asyncio.QueueFull:
+                self.kicked += 1
+                self._drop(c)
+
+    def _drop(self, c: _Client) -> None:
+        c.closed = True
+        with self._lock:
+            s = self._clients.get(c.loop)
+            if s is not None:
+                s.discard(c)
+                if not s:
+                    del self._clients[c.loop]
+        try:
+            c.queue.put_nowait(None)  # будим генератор, чтобы он завершился
+        except asyncio.QueueFull:
+            pass
+
+    def subscribe(self, last_id: int | None = None) -> tuple[_Client, list[tuple[int, bytes]] | None]:
+        """
+        Регистрирует клиента на текущем loop. Возвращает (клиент, пропущенные (seq, кадр)):
+        None вместо списка — last_id уже выпал из кольца, клиенту нужен полный reload.
+        Кадр может прийти и в списке, и в очереди — читатель отбрасывает seq <= уже отданного.
+        """
+        c = _Client(asyncio.get_running_loop(), self.client_queue)
+        with self._lock:
+            self._clients.setdefault(c.loop, set()).add(c)
+            if last_id is None:
+                return c, []
+            if last_id > self._seq:
+                return c, None  # счётчик из прошлого запуска сервера
+            missed = [it for it in self._ring if it[0] > last_id]
+            if last_id < self._seq and (not self._ring or self._ring[0][0] > last_id + 1):
+                return c, None
+        return c, missed
+
+    def unsubscribe(self, c: _Client) -> None:
+        if not c.closed:
+            self._drop(c)
+
+    def stats(self) -> dict:
+        with self._lock:
+            n = sum(len(s) for s in self._clients.values())
+        return {"clients": n, "published": self.published, "kicked": self.kicked, "seq": self._seq}
+
+
+hub = LiveHub()
+repo.subscribe("event", hub._on_events)
+repo.subscribe("trade", hub._on_trade)
+
+Gauge("live_stream", "Dashboard SSE clients and messages", ("stat",), fn=lambda: {(k,): v for k, v in hub.stats().items()})
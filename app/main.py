@@ -1,18 +1,38 @@
 from __future__ import annotations
 
-from fastapi import FastAPI, Depends, Request
-from fastapi.responses import HTMLResponse
+import asyncio
+import zlib
+from datetime import date, datetime
+from typing import Optional
+
+from fastapi import FastAPI, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import HTMLResponse, PlainTextResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from sqlmodel import Session
 
 from app.db import init_db, engine
-from app import repo
-from app.bot_engine import bot
+from app import metrics, repo
+from app.config import BOT_WORKERS, BYBIT_KEY, BYBIT_SECRET, EXCHANGE, LIVE_PING_SEC, TESTNET
+from app.event_sink import events as event_sink
+from app.exchange.markets import MarketCache
+from app.live import hub, sse_frame
+from app.retention import merge_events, retention
+
 
+if BOT_WORKERS > 0:
+    # движки в процессах-воркерах, здесь только control plane (app/supervisor.py)
+    from app.supervisor import Supervisor
+
+    bot = Supervisor(BOT_WORKERS)
+else:
+    from app.bot_engine import bot
 
 app = FastAPI()
 templates = Jinja2Templates(directory="templates")
 
+MAX_PAGE = 1000
+markets_cache = MarketCache()
+
 
 def get_session():
     with Session(engine) as session:
@@ -22,6 +42,21 @@ def get_session():
 @app.on_event("startup")
 def on_startup():
     init_db()
+    with Session(engine) as session:
+        repo.backfill_daily_stats(session)  # старая БД: сводка по уже закрытым сделкам
+    retention.start()
+    if BOT_WORKERS > 0:
+        bot.open()
+
+
+@app.on_event("shutdown")
+def on_shutdown():
+    if bot.running:
+        bot.stop()
+    if BOT_WORKERS > 0:
+        bot.close()
+    event_sink.stop()  # дописать буфер событий
+    retention.stop()
 
 
 @app.get("/", response_class=HTMLResponse)
@@ -31,7 +66,31 @@ def ui(request: Request):
 
 @app.get("/health")
 def health():
-    return {"status": "ok"}
+    # только локальное состояние: без сети и без БД, отвечает за миллисекунды
+    client = bot._client
+    return {
+        "status": "ok",
+        "exchange": EXCHANGE,
+        "testnet": TESTNET,
+        "api_keys": bool(BYBIT_KEY and BYBIT_SECRET),
+        "bot_running": bot.running,
+        "markets": {
+            **markets_cache.status(),
+            "loaded": getattr(client, "exchange", None) is not None,
+            "refresh_error": getattr(client, "markets_error", None),
+        },
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/metrics/traces")
+def cycle_traces(limit: int = Query(100, ge=1, le=1000), symbol: Optional[str] = None):
+    """Последние трейсы циклов (стадии, ms, исход); пишутся только при TRACE_CYCLES=true."""
+    return metrics.recent_traces(limit, symbol)
 
 
 @app.get("/settings")
@@ -41,19 +100,173 @@ def get_settings(session: Session = Depends(get_session)):
 
 @app.post("/settings")
 def set_settings(payload: dict, session: Session = Depends(get_session)):
-    s = repo.update_settings(session, payload)
+    try:
+        s = repo.update_settings(session, payload)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
     repo.add_event(session, "INFO", "SETTINGS_UPDATED", str(payload))
     return s
 
 
+def _not_modified(request: Request, response: Response, version: str) -> bool:
+    """
+    Слабый ETag = версия таблицы + хэш query string: один и тот же запрос
+    при неизменной таблице отдаёт 304 без чтения и сериализации строк.
+    """
+    etag = f'W/"{version}-{zlib.crc32(str(request.query_params).encode()):08x}"'
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    return request.headers.get("if-none-match") == etag
+
+
 @app.get("/trades")
-def trades(limit: int = 50, session: Session = Depends(get_session)):
-    return repo.list_trades(session, limit=limit)
+def trades(
+    request: Request,
+    response: Response,
+    limit: int = Query(50, ge=1, le=MAX_PAGE),
+    after_id: Optional[int] = None,
+    before_id: Optional[int] = None,
+    symbol: Optional[str] = None,
+    status: Optional[str] = None,
+    since: Optional[datetime] = None,
+    ts_from: Optional[datetime] = None,
+    ts_to: Optional[datetime] = None,
+    session: Session = Depends(get_session),
+):
+    if _not_modified(request, response, repo.trades_version(session)):
+        return Response(status_code=304, headers=dict(response.headers))
+    return repo.list_trades(
+        session, limit=limit, after_id=after_id, before_id=before_id, symbol=symbol,
+        status=status, since=since, ts_from=ts_from, ts_to=ts_to,
+    )
 
 
 @app.get("/events")
-def events(limit: int = 100, session: Session = Depends(get_session)):
-    return repo.list_events(session, limit=limit)
+def events(
+    request: Request,
+    response: Response,
+    limit: int = Query(100, ge=1, le=MAX_PAGE),
+    after_id: Optional[int] = None,
+    before_id: Optional[int] = None,
+    level: Optional[str] = None,
+    type: Optional[str] = None,
+    symbol: Optional[str] = None,
+    ts_from: Optional[datetime] = None,
+    ts_to: Optional[datetime] = None,
+    session: Session = Depends(get_session),
+):
+    """
+    ts_from задан — к строкам БД добавляются события из архивных сегментов
+    за этот диапазон (см. app/retention.py); count > 1 — схлопнутые повторы.
+    """
+    if _not_modified(request, response, f"{repo.events_version(session)}.{retention.generation}"):
+        return Response(status_code=304, headers=dict(response.headers))
+    q = dict(limit=limit, after_id=after_id, before_id=before_id, level=level,
+             type_=type, symbol=symbol, ts_from=ts_from, ts_to=ts_to)
+    rows = repo.list_events(session, **q)
+    if ts_from is not None:
+        rows = merge_events(rows, retention.archive.read(**q), limit, ascending=after_id is not None)
+    return rows
+
+
+@app.get("/events/retention")
+def events_retention():
+    """Последний проход ретеншна событий и дни, лежащие в архиве."""
+    return retention.status()
+
+
+@app.get("/executions")
+def executions(
+    limit: int = Query(50, ge=1, le=MAX_PAGE),
+    after_id: Optional[int] = None,
+    before_id: Optional[int] = None,
+    symbol: Optional[str] = None,
+    mode: Optional[str] = None,
+    session: Session = Depends(get_session),
+):
+    """Качество исполнения входов: последние строки + сводка по режиму входа."""
+    return {
+        "items": repo.list_executions(session, limit=limit, after_id=after_id, before_id=before_id, symbol=symbol, mode=mode),
+        "summary": repo.execution_summary(session, symbol=symbol),
+    }
+
+
+@app.get("/stats")
+def stats(
+    request: Request,
+    response: Response,
+    day_from: Optional[date] = None,
+    day_to: Optional[date] = None,
+    symbol: Optional[str] = None,
+    session: Session = Depends(get_session),
+):
+    """Win rate, комиссии, PnL по символам и просадка — из дневной сводки (DailyStat)."""
+    if _not_modified(request, response, repo.stats_version(session)):
+        return Response(status_code=304, headers=dict(response.headers))
+    return repo.stats_summary(session, day_from=day_from, day_to=day_to, symbol=symbol)
+
+
+@app.get("/equity")
+def equity(
+    request: Request,
+    response: Response,
+    day_from: Optional[date] = None,
+    day_to: Optional[date] = None,
+    symbol: Optional[str] = None,
+    session: Session = Depends(get_session),
+):
+    """Кривая реализованного net PnL по дням с просадкой от пика."""
+    if _not_modified(request, response, repo.stats_version(session)):
+        return Response(status_code=304, headers=dict(response.headers))
+    return repo.equity_curve(session, day_from=day_from, day_to=day_to, symbol=symbol)
+
+
+@app.get("/stream")
+async def stream(last_event_id: Optional[str] = Header(None)):
+    """
+    SSE: event / trade / status по мере появления, из памяти (LiveHub), без запросов к БД.
+    При переподключении браузер шлёт Last-Event-ID и получает пропущенное из кольца;
+    reset — пропуск больше кольца, списки нужно перечитать через /trades и /events.
+    """
+    try:
+        last = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last = None
+    client, missed = hub.subscribe(last)
+
+    async def gen():
+        sent = last or 0
+        try:
+            yield b"retry: 3000\n\n"
+            if missed is None:
+                yield sse_frame("reset", {})
+                sent = 0
+            else:
+                for seq, frame in missed:
+                    sent = seq
+                    yield frame
+            yield sse_frame("status", bot.status())
+            while not client.closed:
+                try:
+                    item = await asyncio.wait_for(client.queue.get(), LIVE_PING_SEC)
+                except asyncio.TimeoutError:
+                    yield b": ping\n\n"
+                    continue
+                if item is None or client.closed:
+                    break
+                seq, frame = item
+                if seq <= sent:
+                    continue
+                sent = seq
+                yield frame
+        finally:
+            hub.unsubscribe(client)
+
+    return StreamingResponse(
+        gen(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.post("/bot/start")
@@ -71,3 +284,9 @@ def stop_bot():
 @app.get("/bot/status")
 def bot_status():
     return bot.status()
+
+
+@app.get("/bot/scan")
+def bot_scan():
+    """Текущий top-N сканера (Settings.scan_top_n > 0), по убыванию score."""
+    return bot.candidates()
@@ -0,0 +1,304 @@
+# app/metrics.py
+from __future__ import annotations
+
+import json
+import os
+import queue
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextvars import ContextVar
+from functools import wraps
+
+from app.config import TRACE_CYCLES, TRACE_KEEP, TRACE_PATH
+
+# секунды; от миллисекунды (сигнал, DB) до десятков секунд (wait_fill)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+REGISTRY: list["_Metric"] = []
+
+
+def _esc(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_esc(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values: dict[tuple, object] = {}
+        REGISTRY.append(self)
+
+    def _key(self, kw: dict) -> tuple:
+        return tuple(str(kw[n]) for n in self.labels)
+
+    def lines(self) -> list[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        head = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        return "\n".join(head + self.lines())
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, n: float = 1.0, **labels):
+        k = self._key(labels)
+        with self._lock:
+            self._values[k] = self._values.get(k, 0.0) + n
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def lines(self) -> list[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_fmt_labels(self.labels, k)} {_fmt(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    """Значение задаётся set() или считается при скрейпе: fn() -> {label-tuple: value} либо число."""
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (), fn=None):
+        super().__init__(name, help, labels)
+        self.fn = fn
+
+    def set(self, v: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = v
+
+    def lines(self) -> list[str]:
+        if self.fn is not None:
+            v = self.fn()
+            items = list(v.items()) if isinstance(v, dict) else [((), v)]
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        return [f"{self.name}{_fmt_labels(self.labels, k)} {_fmt(float(v))}" for k, v in items]
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, v: float, **labels):
+        k = self._key(labels)
+        i = bisect_left(self.buckets, v)  # le: v <= bucket
+        with self._lock:
+            st = self._values.get(k)
+            if st is None:
+                st = self._values[k] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            st[0][i] += 1
+            st[1] += v
+            st[2] += 1
+
+    def time(self, **labels) -> "_Timer":
+        return _Timer(self, labels)
+
+    def lines(self) -> list[str]:
+        with self._lock:
+            items = [(k, (list(c), s, n)) for k, (c, s, n) in self._values.items()]
+        out = []
+        for k, (counts, total, n) in items:
+            acc = 0
+            for b, c in zip((*self.buckets, float("inf")), counts):
+                acc += c
+                le = 'le="%s"' % _fmt(float(b))
+                out.append(f"{self.name}_bucket{_fmt_labels(self.labels, k, le)} {acc}")
+            out.append(f"{self.name}_sum{_fmt_labels(self.labels, k)} {_fmt(total)}")
+            out.append(f"{self.name}_count{_fmt_labels(self.labels, k)} {n}")
+        return out
+
+
+class _Timer:
+    __slots__ = ("hist", "labels", "t0")
+
+    def __init__(self, hist: Histogram, labels: dict):
+        self.hist = hist
+        self.labels = labels
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.hist.observe(time.perf_counter() - self.t0, **self.labels)
+        return False
+
+
+def render() -> str:
+    return "\n".join(m.render() for m in REGISTRY) + "\n"
+
+
+# ---------- метрики бота ----------
+
+CYCLE = Histogram("bot_cycle_seconds", "Duration of one trading cycle per symbol", ("symbol",))
+STAGE = Histogram("bot_stage_seconds", "Duration of a trading cycle stage", ("stage",))
+SIGNAL_TO_ORDER = Histogram("bot_signal_to_order_seconds", "Signal decided -> entry order acknowledged")
+SKIPS = Counter("bot_skips_total", "Cycles that ended without an order, by reason", ("reason", "symbol"))
+LOOP_ERRORS = Counter("bot_loop_errors_total", "Exceptions in the per-symbol loop", ("symbol",))
+
+EXCHANGE_CALL = Histogram("exchange_call_seconds", "AsyncBybitClient call latency", ("method",))
+EXCHANGE_ERRORS = Counter("exchange_call_errors_total", "AsyncBybitClient calls that raised", ("method",))
+EXCHANGE_HTTP = Histogram("exchange_http_seconds", "Bybit REST request latency by endpoint", ("path",))
+RATELIMIT_WAIT = Histogram("exchange_ratelimit_wait_seconds", "Time spent waiting for a rate-limit token", ("path",))
+
+DB_WRITE = Histogram("db_write_seconds", "Blocking DB write/commit time", ("op",))
+
+
+# ---------- stage timers + per-cycle traces ----------
+
+_trace: ContextVar[dict | None] = ContextVar("bot_cycle_trace", default=None)
+_traces: deque = deque(maxlen=TRACE_KEEP)
+_trace_lock = threading.Lock()
+# файл трейсов пишет отдельный поток: цикл символа только кладёт строку в очередь
+_trace_q: queue.Queue = queue.Queue(maxsize=10_000)
+_trace_writer: threading.Thread | None = None
+
+
+class stage:
+    """
+    with stage("ticker"): ... — время в bot_stage_seconds{stage} и, если идёт
+    трассировка цикла, строка в трейсе. Работает и вокруг await: contextvar
+    у каждой задачи символа свой.
+    """
+    __slots__ = ("name", "t0")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        dt = time.perf_counter() - self.t0
+        STAGE.observe(dt, stage=self.name)
+        tr = _trace.get()
+        if tr is not None:
+            tr["stages"].append((self.name, round(dt * 1000.0, 3), exc_type.__name__ if exc_type else None))
+        return False
+
+
+def skip(reason: str, symbol: str):
+    SKIPS.inc(reason=reason, symbol=symbol)
+    tr = _trace.get()
+    if tr is not None:
+        tr["outcome"] = reason
+
+
+def outcome(name: str):
+    tr = _trace.get()
+    if tr is not None:
+        tr["outcome"] = name
+
+
+class cycle:
+    """Обёртка цикла символа: bot_cycle_seconds + трейс (если TRACE_CYCLES)."""
+    __slots__ = ("symbol", "t0", "token")
+
+    def __init__(self, symbol: str):
+        self.symbol = symbol
+        self.token = None
+
+    def __enter__(self):
+        if TRACE_CYCLES:
+            self.token = _trace.set({"ts": time.time(), "symbol": self.symbol, "stages": [], "outcome": None})
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        dt = time.perf_counter() - self.t0
+        CYCLE.observe(dt, symbol=self.symbol)
+        if self.token is not None:
+            tr = _trace.get()
+            _trace.reset(self.token)
+            tr["total_ms"] = round(dt * 1000.0, 3)
+            if exc_type is not None:
+                tr["outcome"] = f"error:{exc_type.__name__}"
+            _store_trace(tr)
+        return False
+
+
+def _store_trace(tr: dict):
+    global _trace_writer
+    with _trace_lock:
+        _traces.append(tr)
+        if not TRACE_PATH:
+            return
+        if _trace_writer is None:
+            _trace_writer = threading.Thread(target=_write_traces, name="trace-writer", daemon=True)
+            _trace_writer.start()
+    try:
+        _trace_q.put_nowait(json.dumps(tr) + "\n")
+    except queue.Full:
+        pass  # диск не успевает — трейс остаётся только в памяти (recent_traces)
+
+
+def _write_traces():
+    # пачкой всё, что накопилось, одним open/append
+    while True:
+        lines = [_trace_q.get()]
+        while True:
+            try:
+                lines.append(_trace_q.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            os.makedirs(os.path.dirname(TRACE_PATH) or ".", exist_ok=True)
+            with open(TRACE_PATH, "a") as f:
+                f.writelines(lines)
+        except OSError:
+            pass
+
+
+def recent_traces(limit: int = 100, symbol: str | None = None) -> list[dict]:
+    with _trace_lock:
+        items = list(_traces)
+    if symbol:
+        items = [t for t in items if t["symbol"] == symbol]
+    return items[-limit:][::-1]
+
+
+def timed_call(method: str):
+    """Декоратор async-метода клиента биржи: latency/ошибки по имени метода + стадия в трейсе."""
+    def deco(fn):
+        @wraps(fn)
+        async def wrapper(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            except Exception:
+                EXCHANGE_ERRORS.inc(method=method)
+                raise
+            finally:
+                dt = time.perf_counter() - t0
+                EXCHANGE_CALL.observe(dt, method=method)
+                tr = _trace.get()
+                if tr is not None:
+                    tr["stages"].append((f"ex.{method}", round(dt * 1000.0, 3), None))
+        return wrapper
+    return deco
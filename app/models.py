@@ -1,16 +1,24 @@
 from __future__ import annotations
 
-from datetime import datetime
+from datetime import date, datetime
 from typing import Optional
 
+from sqlalchemy import Index
 from sqlmodel import SQLModel, Field
 
+# допустимые значения строковых настроек; timeframe — интервалы kline Bybit v5 (bybit_ws._TF_TO_INTERVAL)
+_CHOICES = {
+    "timeframe": ("1m", "3m", "5m", "15m", "30m", "1h", "2h", "4h", "6h", "12h", "1d", "1w", "1M"),
+    "entry_order_type": ("limit", "market", "smart"),
+    "exit_mode": ("soft", "exchange"),
+}
 
 class Settings(SQLModel, table=True):
     id: int = Field(default=1, primary_key=True)
 
     # trade core
     symbol: str = Field(default="BTC/USDT:USDT", index=True)
+    symbols: str = Field(default="")                # "BTC/USDT:USDT,ETH/USDT:USDT"; пусто = только symbol
     timeframe: str = Field(default="5m")
 
     leverage: int = Field(default=2)
@@ -22,16 +30,23 @@ class Settings(SQLModel, table=True):
     cooldown_minutes: int = Field(default=10)
     max_trades_per_day: int = Field(default=10)
     max_daily_loss_pct: float = Field(default=2.5)
+    max_open_trades: int = Field(default=0)         # одновременно OPEN на аккаунт (все символы и шарды); 0 — без лимита
     max_margin_pct: float = Field(default=10.0)
 
     # execution protection
-    entry_order_type: str = Field(default="limit")  # "limit" | "market"
+    entry_order_type: str = Field(default="limit")  # "limit" | "market" | "smart" (по стакану, app/execution.py)
     entry_timeout_sec: int = Field(default=12)
+    exec_reprice_sec: float = Field(default=1.0)      # smart: как часто сверяться со стаканом и переставлять лимитку
+    exec_child_depth_pct: float = Field(default=25.0) # smart: дочерний ордер <= % видимой глубины своей стороны; 0 — не резать
 
     max_spread_pct: float = Field(default=0.06)     # (ask-bid)/mid * 100
     max_slippage_pct: float = Field(default=0.12)   # |fill-expected|/expected*100
     allow_market_fallback: bool = Field(default=True)
 
+    # market scanner: сигналы по всем symbols одной матрицей, вход — только у top-N по силе сетапа
+    scan_top_n: int = Field(default=0)              # 0 — выкл: каждый символ решает сам (SignalState)
+    scan_min_volume_usdt: float = Field(default=0.0)  # фильтр ликвидности: оборот за 24ч
+
     # limit order behavior
     post_only: bool = Field(default=False)          # если True — лимитка только maker (может не зайти чаще)
 
@@ -43,6 +58,11 @@ class Settings(SQLModel, table=True):
     # SL/TP placement
     use_exchange_sl_tp: bool = Field(default=False)      # true = ставим SL/TP на бирже (надёжнее)
     reduce_only_sl_tp: bool = Field(default=True)        # защита: SL/TP не должен увеличивать позицию
+    # "soft" — SL/TP/трейл проверяет цикл бота; "exchange" — SL/TP/трейл живут на бирже
+    # (amend через set_trading_stop), бот только подтягивает трейл и реконсилит сделки с позициями
+    exit_mode: str = Field(default="soft")
+    native_trailing: bool = Field(default=False)         # exchange: трейлит сама биржа (trailingStop), без amend'ов
+    reconcile_interval_sec: int = Field(default=5)       # сверка OPEN-сделок с позициями биржи
 
     # ccxt/bybit quirks
     acknowledged_fetch: bool = Field(default=True)       # передавать params={"acknowledged": True} в fetch_order
@@ -53,10 +73,61 @@ class Settings(SQLModel, table=True):
 
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
+    @classmethod
+    def coerce_payload(cls, payload: dict) -> dict:
+        """
+        Проверить и привести типы значений из POST /settings один раз при записи.
+        Неизвестные ключи и служебные поля (id, updated_at) игнорируются.
+        """
+        out = {}
+        for k, v in payload.items():
+            f = cls.model_fields.get(k)
+            if f is None or k in ("id", "updated_at"):
+                continue
+            t = f.annotation
+            try:
+                if t is bool:
+                    if isinstance(v, str):
+                        v = v.strip().lower()
+                        if v not in ("1", "true", "yes", "y", "on", "0", "false", "no", "n", "off"):
+                            raise ValueError(v)
+                        v = v in ("1", "true", "yes", "y", "on")
+                    elif not isinstance(v, (bool, int)):
+                        raise ValueError(v)
+                    out[k] = bool(v)
+                elif t is int:
+                    if isinstance(v, float) and not v.is_integer():
+                        raise ValueError(v)
+                    out[k] = int(v)
+                elif t is float:
+                    out[k] = float(v)
+                    if out[k] != out[k]:
+                        raise ValueError(v)  # NaN
+                else:
+                    out[k] = str(v).strip()
+                    if k in _CHOICES and out[k] not in _CHOICES[k]:
+                        raise ValueError(v)
+            except (TypeError, ValueError):
+                raise ValueError(f"Invalid value for {k}: {v!r}") from None
+        return out
+
+    def symbol_list(self) -> list[str]:
+        out = [x.strip() for x in (self.symbols or "").split(",") if x.strip()]
+        if not out:
+            out = [self.symbol]
+        return list(dict.fromkeys(out))
+
 
 class Trade(SQLModel, table=True):
+    __table_args__ = (
+        # keyset-пагинация /trades с фильтрами + get_open_trade
+        Index("ix_trade_symbol_status_id", "symbol", "status", "id"),
+        Index("ix_trade_status_id", "status", "id"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     ts: datetime = Field(default_factory=datetime.utcnow, index=True)
+    updated_at: Optional[datetime] = Field(default_factory=datetime.utcnow, index=True)  # для /trades?since=
 
     symbol: str = Field(index=True)
     side: str  # "buy" | "sell"
@@ -91,9 +162,75 @@ class Trade(SQLModel, table=True):
 
 
 class Event(SQLModel, table=True):
+    __table_args__ = (
+        # keyset-пагинация /events с фильтрами
+        Index("ix_event_level_id", "level", "id"),
+        Index("ix_event_type_id", "type", "id"),
+        Index("ix_event_symbol_id", "symbol", "id"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     ts: datetime = Field(default_factory=datetime.utcnow, index=True)
 
     level: str
     type: str
     message: str
+    symbol: Optional[str] = None
+
+    # ретеншн: count одинаковых событий схлопнуто в эту строку, last_ts — время последнего
+    count: int = Field(default=1)
+    last_ts: Optional[datetime] = None
+
+
+class Execution(SQLModel, table=True):
+    """Качество исполнения входа: одна строка на вход (все дочерние ордера вместе)."""
+    __table_args__ = (
+        Index("ix_execution_symbol_id", "symbol", "id"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    ts: datetime = Field(default_factory=datetime.utcnow, index=True)
+    trade_id: Optional[int] = Field(default=None, index=True)   # None — вход не состоялся
+
+    symbol: str
+    side: str
+    mode: str                                     # entry_order_type
+    qty: float                                    # запрошено
+    filled: float = 0.0
+    avg_price: Optional[float] = None
+    arrival_bid: float = 0.0
+    arrival_ask: float = 0.0
+    slippage_bps: Optional[float] = None          # против arrival mid; > 0 — хуже
+    maker_qty: float = 0.0                        # исполнено лимитками
+    taker_qty: float = 0.0                        # исполнено market
+    fee_usdt: float = 0.0
+    orders: int = 0
+    reprices: int = 0
+    duration_ms: float = 0.0
+    outcome: str = ""                             # FILLED | TIMEOUT | SPREAD | SLIPPAGE
+
+
+class DailyStat(SQLModel, table=True):
+    """
+    Сводка закрытых сделок за сутки (UTC, по времени закрытия) × символ.
+    Обновляется инкрементально в repo.update_trade при переходе в CLOSED —
+    /stats и /equity читают её, а не всю таблицу Trade.
+    """
+    __table_args__ = (
+        Index("ux_dailystat_day_symbol", "day", "symbol", unique=True),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    day: date = Field(index=True)
+    symbol: str
+
+    trades: int = 0
+    wins: int = 0                                 # net pnl > 0
+    losses: int = 0                               # net pnl < 0
+    gross_pnl: float = 0.0                        # сумма pnl_usdt (без комиссий)
+    fees: float = 0.0                             # entry_fee_usdt + exit_fee_usdt
+    win_sum: float = 0.0                          # сумма net по выигрышным (profit factor)
+    loss_sum: float = 0.0                         # сумма net по проигрышным, <= 0
+    best: Optional[float] = None                  # лучшая/худшая сделка (net)
+    worst: Optional[float] = None
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
@@ -0,0 +1,260 @@
+# app/ohlcv_store.py
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from app.backtest import Candles
+from app.config import DATA_DIR
+
+COLS = ("ts", "open", "high", "low", "close", "volume")
+_DTYPES = {"ts": np.int64}  # остальное float64
+_MANIFEST = "manifest.json"  # {"gen": k} — какое поколение колонок читать
+
+
+# как ccxt.Exchange.parse_timeframe, без импорта ccxt (он тяжёлый для старта)
+_TF_SEC = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800, "M": 2592000, "y": 31536000}
+
+
+def tf_ms(timeframe: str) -> int:
+    try:
+        return int(timeframe[:-1]) * _TF_SEC[timeframe[-1]] * 1000
+    except (KeyError, ValueError):
+        raise ValueError(f"Unsupported timeframe: {timeframe}") from None
+
+
+class OHLCVStore:
+    """
+    Локальная история свечей: {root}/{symbol}/{timeframe}/{col}.bin — по файлу
+    на колонку (ts int64, OHLCV float64), append-only. Читатели маппят файлы
+    через np.memmap, поэтому окно из 200 свечей или годы 1m читаются без копий.
+    Последняя (незакрытая) свеча перезаписывается на месте; вставка в середину
+    (догрузка дыр) пишет новое поколение колонок {col}.{gen}.bin и переключает
+    manifest.json одним rename — читатель берёт поколение один раз и видит
+    колонки одной версии. Предыдущее поколение живёт до следующего переписывания.
+    """
+
+    def __init__(self, root: str | None = None):
+        self.root = os.path.join(root or DATA_DIR, "ohlcv")
+        self._locks: dict[str, threading.Lock] = {}
+        self._guard = threading.Lock()
+
+    def _dir(self, symbol: str, timeframe: str) -> str:
+        safe = symbol.replace("/", "-").replace(":", "_")
+        return os.path.join(self.root, safe, timeframe)
+
+    def _lock(self, d: str) -> threading.Lock:
+        with self._guard:
+            return self._locks.setdefault(d, threading.Lock())
+
+    @staticmethod
+    def _gen(d: str) -> int:
+        try:
+            with open(os.path.join(d, _MANIFEST)) as f:
+                return int(json.load(f)["gen"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return 0  # нет манифеста — колонки {col}.bin (поколение 0)
+
+    @staticmethod
+    def _col(d: str, c: str, gen: int) -> str:
+        return os.path.join(d, f"{c}.bin" if gen == 0 else f"{c}.{gen}.bin")
+
+    def _len(self, d: str, gen: int) -> int:
+        # по самой короткой колонке — на случай оборванной дозаписи
+        try:
+            return min(os.path.getsize(self._col(d, c, gen)) // 8 for c in COLS)
+        except OSError:
+            return 0
+
+    # ---------- reads ----------
+
+    def read(self, symbol: str, timeframe: str, start: int | None = None, end: int | None = None) -> Candles | None:
+        """Свечи [start, end) по ts (мс) как memmap-колонки, без копирования."""
+        d = self._dir(symbol, timeframe)
+        for attempt in range(3):
+            gen = self._gen(d)
+            n = self._len(d, gen)
+            if n == 0:
+                return None
+            try:
+                cols = {c: np.memmap(self._col(d, c, gen), dtype=_DTYPES.get(c, np.float64), mode="r", shape=(n,))
+                        for c in COLS}
+                break
+            except (FileNotFoundError, ValueError):
+                if attempt == 2:  # поколение успели сменить дважды, пока открывали
+                    raise
+        a = int(np.searchsorted(cols["ts"], start)) if start is not None else 0
+        b = int(np.searchsorted(cols["ts"], end)) if end is not None else n
+        return Candles(*(cols[c][a:b] for c in COLS))
+
+    def tail(self, symbol: str, timeframe: str, n: int = 200) -> list[list]:
+        """Последние n свечей в формате ccxt [[ts, o, h, l, c, v], ...]."""
+        c = self.read(symbol, timeframe)
+        if c is None:
+            return []
+        k = max(0, len(c) - n)
+        ts = c.ts[k:].tolist()
+        cols = [getattr(c, x)[k:].tolist() for x in COLS[1:]]
+        return [[t, *row] for t, row in zip(ts, zip(*cols))]
+
+    def last_ts(self, symbol: str, timeframe: str) -> int | None:
+        d = self._dir(symbol, timeframe)
+        gen = self._gen(d)
+        n = self._len(d, gen)
+        if n == 0:
+            return None
+        with open(self._col(d, "ts", gen), "rb") as f:
+            f.seek((n - 1) * 8)
+            return int(np.frombuffer(f.read(8), dtype=np.int64)[0])
+
+    def missing_ranges(self, symbol: str, timeframe: str, since: int, until: int) -> list[tuple[int, int]]:
+        """Диапазоны [a, b) по ts, которых нет локально, внутри [since, until)."""
+        step = tf_ms(timeframe)
+        since -= since % step
+        c = self.read(symbol, timeframe, since, until)
+        if c is None or len(c) == 0:
+            return [(since, until)] if since < until else []
+
+        ts = np.asarray(c.ts)
+        out = []
+        if ts[0] > since:
+            out.append((since, int(ts[0])))
+        gaps = np.flatnonzero(np.diff(ts) > step)
+        out.extend((int(ts[g]) + step, int(ts[g + 1])) for g in gaps)
+        if ts[-1] + step < until:
+            out.append((int(ts[-1]) + step, until))
+        return out
+
+    # ---------- writes ----------
+
+    def write(self, symbol: str, timeframe: str, rows) -> int:
+        """Слить свечи в хранилище. Возвращает число новых свечей."""
+        if rows is None or len(rows) == 0:
+            return 0
+        a = np.asarray(rows, dtype=np.float64).reshape(-1, 6)
+        a = a[np.argsort(a[:, 0], kind="stable")]
+        ts = a[:, 0].astype(np.int64)
+        keep = np.append(ts[1:] != ts[:-1], True)  # дубли ts внутри пачки: последняя версия
+        a, ts = a[keep], ts[keep]
+
+        d = self._dir(symbol, timeframe)
+        with self._lock(d):
+            os.makedirs(d, exist_ok=True)
+            gen = self._gen(d)
+            n = self._len(d, gen)
+            last = self.last_ts(symbol, timeframe) if n else None
+
+            if last is None or ts[0] >= last:
+                # быстрый путь: амендим последнюю свечу и дописываем хвост
+                start = 0
+                if last is not None and ts[0] == last:
+                    self._overwrite_last(d, gen, n, a[0])
+                    start = 1
+                self._append(d, gen, n, a[start:])
+                return len(a) - start
+
+            # пачка залезает в середину — мерджим (обе стороны отсортированы) и переписываем целиком
+            old = self.read(symbol, timeframe)
+            ots = np.asarray(old.ts)
+            m = np.column_stack([np.asarray(getattr(old, c), dtype=np.float64) for c in COLS])
+            del old
+            pos = np.searchsorted(ots, ts)
+            hit = pos < len(ots)
+            hit[hit] = ots[pos[hit]] == ts[hit]
+            m[pos[hit]] = a[hit]  # совпавшие ts: новая версия свечи
+            m = np.insert(m, pos[~hit], a[~hit], axis=0)
+            self._rewrite(d, gen, m)
+            return int((~hit).sum())
+
+    def _truncate(self, d: str, gen: int, n: int):
+        # выравниваем колонки по самой короткой (после оборванной дозаписи)
+        for c in COLS:
+            p = self._col(d, c, gen)
+            if os.path.exists(p) and os.path.getsize(p) != n * 8:
+                os.truncate(p, n * 8)
+
+    def _append(self, d: str, gen: int, n: int, a: np.ndarray):
+        self._truncate(d, gen, n)
+        if len(a) == 0:
+            return
+        for i, c in enumerate(COLS):
+            with open(self._col(d, c, gen), "ab") as f:
+                a[:, i].astype(_DTYPES.get(c, np.float64)).tofile(f)
+
+    def _overwrite_last(self, d: str, gen: int, n: int, row: np.ndarray):
+        for i, c in enumerate(COLS):
+            with open(self._col(d, c, gen), "r+b") as f:
+                f.seek((n - 1) * 8)
+                f.write(np.asarray(row[i], dtype=_DTYPES.get(c, np.float64)).tobytes())
+
+    def _rewrite(self, d: str, gen: int, a: np.ndarray):
+        new = gen + 1
+        self._append(d, new, 0, a)  # хвосты от оборванного переписывания обрезаются до 0
+        tmp = os.path.join(d, _MANIFEST + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump({"gen": new}, f)
+        # все колонки переключаются разом; открытые memmap читателей держат старые inode
+        os.replace(tmp, os.path.join(d, _MANIFEST))
+        if gen > 0:
+            for c in COLS:  # поколение до предыдущего: его уже никто не выбирает
+                try:
+                    os.remove(self._col(d, c, gen - 1))
+                except OSError:
+                    pass
+
+
+async def download(store: OHLCVStore, fetch_ohlcv, symbol: str, timeframe: str,
+                   since: int, until: int | None = None, limit: int = 1000) -> int:
+    """
+    Догрузить только недостающие диапазоны [since, until) через пагинацию ccxt
+    (fetch_ohlcv(symbol, timeframe, since=..., limit=...) — async-метод биржи).
+    Диапазон собирается целиком и пишется одним write: дыра в середине
+    истории переписывает колонки один раз, а не на каждую страницу.
+    """
+    step = tf_ms(timeframe)
+    until = until or int(time.time() * 1000)
+    added = 0
+    for a, b in store.missing_ranges(symbol, timeframe, since, until):
+        cursor = a
+        pages = []
+        while cursor < b:
+            rows = await fetch_ohlcv(symbol, timeframe, since=cursor, limit=limit)
+            rows = [r for r in rows or [] if cursor <= r[0] < b]
+            if not rows:
+                cursor += step * limit  # дыра на стороне биржи — перепрыгиваем
+                continue
+            pages.append(np.asarray(rows, dtype=np.float64).reshape(-1, 6))
+            cursor = int(rows[-1][0]) + step
+        if pages:
+            added += await asyncio.to_thread(store.write, symbol, timeframe, np.concatenate(pages))
+    return added
+
+
+def main(argv: list[str] | None = None):
+    ap = argparse.ArgumentParser(description="Download / gap-fill local OHLCV history")
+    ap.add_argument("symbols", nargs="+")
+    ap.add_argument("--timeframe", default="1m")
+    ap.add_argument("--days", type=float, default=30)
+    args = ap.parse_args(argv)
+
+    from app.exchange.bybit_async import AsyncBybitClient
+
+    async def run():
+        store = OHLCVStore()
+        since = int((time.time() - args.days * 86400) * 1000)
+        async with AsyncBybitClient() as client:
+            for sym in args.symbols:
+                n = await download(store, client.exchange.fetch_ohlcv, sym, args.timeframe, since)
+                print(f"{sym} {args.timeframe}: +{n} candles")
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+# app/portfolio.py
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+
+from app.models import Trade
+
+
+@dataclass
+class SymbolState:
+    """Состояние одного символа: кулдаун, дневные счётчики, трейлинг."""
+    symbol: str
+    last_trade_time: datetime | None = None
+    trades_today: int = 0
+    day_start: date = field(default_factory=lambda: datetime.utcnow().date())
+    daily_pnl: float = 0.0
+
+    # trailing state (для одной позиции по символу)
+    best_price: float | None = None  # для buy: max; для sell: min
+
+    def reset_daily_if_needed(self, now: datetime | None = None):
+        now = (now or datetime.utcnow()).date()
+        if now != self.day_start:
+            self.day_start = now
+            self.trades_today = 0
+            self.daily_pnl = 0.0
+
+    def cooldown_ok(self, cooldown_minutes: int, now: datetime | None = None) -> bool:
+        if not self.last_trade_time:
+            return True
+        return (now or datetime.utcnow()) - self.last_trade_time >= timedelta(minutes=cooldown_minutes)
+
+    def as_dict(self) -> dict:
+        return {
+            "trades_today": self.trades_today,
+            "daily_pnl_usdt": self.daily_pnl,
+            "last_trade_time": self.last_trade_time.isoformat() if self.last_trade_time else None,
+        }
+
+
+class Portfolio:
+    """
+    Позиции и риск-состояние движка в памяти: SymbolState по символам,
+    OPEN-сделки и баланс с TTL. Цикл символа проверяет лимиты и ищет
+    открытую сделку здесь, без SELECT и лишнего запроса баланса.
+
+    Источник правды — таблица Trade (и позиции биржи, см. BotEngine._rebuild):
+    rebuild() поднимает счётчики за текущие сутки из сделок, а трейлинг
+    (best_price), которого в БД нет, — из JSON-снимка, если он про ту же сделку.
+    Снимок пишется периодически и на остановке.
+    """
+
+    def __init__(self, path: str, balance_ttl_sec: float = 10.0):
+        self.path = path
+        self.balance_ttl_sec = balance_ttl_sec
+        self.states: dict[str, SymbolState] = {}
+        self._open: dict[str, Trade] = {}
+        self._balance: float | None = None
+        self._balance_ts = 0.0
+        self._lock = threading.Lock()  # снимок читается из пула потоков
+        self.dirty = False
+
+    # ---------- state ----------
+
+    def state(self, symbol: str) -> SymbolState:
+        s = self.states.get(symbol)
+        if s is None:
+            s = self.states[symbol] = SymbolState(symbol)
+        return s
+
+    def open_trade(self, symbol: str) -> Trade | None:
+        return self._open.get(symbol)
+
+    def open_trades(self) -> list[Trade]:
+        return list(self._open.values())
+
+    @property
+    def daily_pnl(self) -> float:
+        return sum(x.daily_pnl for x in list(self.states.values()))
+
+    # ---------- balance ----------
+
+    def balance(self) -> float | None:
+        """Кэшированный баланс; None — протух, нужен запрос к бирже."""
+        if self._balance is None or time.monotonic() - self._balance_ts > self.balance_ttl_sec:
+            return None
+        return self._balance
+
+    def set_balance(self, v: float) -> None:
+        self._balance, self._balance_ts = float(v), time.monotonic()
+
+    # ---------- incremental updates ----------
+
+    def on_open(self, t: Trade, now: datetime) -> None:
+        s = self.state(t.symbol)
+        with self._lock:
+            self._open[t.symbol] = t
+            s.last_trade_time = now
+            s.trades_today += 1
+            s.best_price = None
+            self._balance = None  # комиссия/маржа — баланс изменился
+            self.dirty = True
+
+    def on_update(self, t: Trade) -> None:
+        with self._lock:
+            if t.status == "OPEN":
+                self._open[t.symbol] = t
+            self.dirty = True
+
+    def on_close(self, t: Trade, pnl: float) -> None:
+        s = self.state(t.symbol)
+        with self._lock:
+            cur = self._open.get(t.symbol)
+            if cur is not None and cur.id == t.id:
+                del self._open[t.symbol]
+            s.daily_pnl += float(pnl)
+            s.best_price = None
+            self._balance = None
+            self.dirty = True
+
+    # ---------- rebuild / snapshot ----------
+
+    def rebuild(self, open_trades: list[Trade], recent: list[Trade], now: datetime) -> None:
+        """
+        open_trades — все OPEN; recent — сделки, открытые с начала суток (и раньше,
+        если нужны для кулдауна), и закрытые сегодня. Дневной pnl — по сделкам,
+        закрытым сегодня (updated_at), включая открытые до полуночи.
+        """
+        today = now.date()
+        snap = self.load()
+        with self._lock:
+            self.states.clear()
+            self._open = {t.symbol: t for t in open_trades}
+            for t in recent:
+                s = self.state(t.symbol)
+                if s.last_trade_time is None or t.ts > s.last_trade_time:
+                    s.last_trade_time = t.ts
+                if t.ts.date() == today:
+                    s.trades_today += 1
+                if t.status == "CLOSED" and t.pnl_usdt is not None and (t.updated_at or t.ts).date() == today:
+                    s.daily_pnl += float(t.pnl_usdt)
+            for s in self.states.values():
+                s.day_start = today
+            for sym, t in self._open.items():
+                row = (snap or {}).get("symbols", {}).get(sym) or {}
+                if row.get("open_trade_id") == t.id and row.get("best_price") is not None:
+                    self.state(sym).best_price = float(row["best_price"])
+            self._balance = None
+            self.dirty = False
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            states = list(self.states.items())
+            open_ids = {s: t.id for s, t in self._open.items()}
+            self.dirty = False
+        return {
+            "ts": datetime.utcnow().isoformat(),
+            "symbols": {
+                sym: {**x.as_dict(), "day_start": x.day_start.isoformat(), "best_price": x.best_price,
+                      "open_trade_id": open_ids.get(sym)}
+                for sym, x in states
+            },
+        }
+
+    def save(self) -> None:
+        data = self.snapshot()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, self.path)
+
+    def load(self) -> dict | None:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
@@ -0,0 +1,137 @@
+# app/protection.py
+from __future__ import annotations
+
+import asyncio
+from typing import Callable
+
+from app.config import PROTECT_MIN_INTERVAL_SEC
+from app.metrics import Counter
+
+AMENDS = Counter("protect_amends_total", "set_trading_stop calls sent", ("symbol",))
+COALESCED = Counter("protect_coalesced_total", "Protection updates merged into a later amend", ("symbol",))
+ERRORS = Counter("protect_errors_total", "set_trading_stop calls that failed", ("symbol",))
+
+FIELDS = ("stop_loss", "take_profit", "trailing_stop", "active_price")
+
+
+class ProtectionManager:
+    """
+    SL/TP/трейл позиций на бирже через client.set_trading_stop.
+
+    request() только запоминает желаемое состояние (последнее значение
+    побеждает); отправляет его фоновая задача символа — не чаще раза
+    в min_interval и только поля, которые отличаются от уже стоящих на бирже
+    (после округления до шага цены). Трейл, подтягивающий SL на каждом тике,
+    даёт один amend в интервал, а не по запросу на тик.
+    """
+
+    def __init__(self, client, min_interval: float = PROTECT_MIN_INTERVAL_SEC,
+                 on_error: Callable[[str, Exception], None] | None = None):
+        self.client = client
+        self.min_interval = min_interval
+        self.on_error = on_error
+        self._want: dict[str, dict] = {}
+        self._sent: dict[str, dict] = {}
+        self._tasks: dict[str, asyncio.Task] = {}
+        self._idle: dict[str, asyncio.Event] = {}
+        self._last: dict[str, float] = {}
+
+    def _round(self, symbol: str, v: float | None) -> float | None:
+        if not v:
+            return v
+        r = getattr(self.client, "round_price", None)
+        return r(symbol, v) if r is not None else v
+
+    def request(self, symbol: str, **fields) -> None:
+        """stop_loss / take_profit / trailing_stop / active_price; None — не менять."""
+        want = self._want.setdefault(symbol, {})
+        for k, v in fields.items():
+            if k not in FIELDS:
+                raise TypeError(f"unknown protection field: {k}")
+            if v is not None:
+                want[k] = self._round(symbol, float(v))
+        if not self._diff(symbol):
+            return
+        t = self._tasks.get(symbol)
+        if t is None or t.done():
+            self._idle.setdefault(symbol, asyncio.Event()).clear()
+            self._tasks[symbol] = asyncio.create_task(self._run(symbol), name=f"protect:{symbol}")
+        else:
+            COALESCED.inc(symbol=symbol)
+
+    def _diff(self, symbol: str) -> dict:
+        sent = self._sent.get(symbol, {})
+        return {k: v for k, v in self._want.get(symbol, {}).items() if sent.get(k) != v}
+
+    def wanted(self, symbol: str) -> dict:
+        return dict(self._want.get(symbol, {}))
+
+    def pending(self, symbol: str) -> bool:
+        t = self._tasks.get(symbol)
+        return t is not None and not t.done()
+
+    async def _run(self, symbol: str):
+        loop = asyncio.get_running_loop()
+        failures = 0
+        try:
+            while True:
+                diff = self._diff(symbol)
+                if not diff:
+                    return
+                wait = self._last.get(symbol, 0.0) + self.min_interval * (1 + failures) - loop.time()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                    diff = self._diff(symbol)  # за время ожидания могли прийти новые значения
+                    if not diff:
+                        return
+                self._last[symbol] = loop.time()
+                try:
+                    await self.client.set_trading_stop(
+                        symbol, diff.get("stop_loss"), diff.get("take_profit"),
+                        trailing_stop=diff.get("trailing_stop"), active_price=diff.get("active_price"),
+                    )
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    ERRORS.inc(symbol=symbol)
+                    failures += 1
+                    if self.on_error is not None:
+                        self.on_error(symbol, e)
+                    if "zero position" in str(e) or failures >= 5:
+                        # позиции нет (закрылась на бирже) или биржа стабильно отказывает:
+                        # реконсиляция решит, что делать со сделкой
+                        self.forget(symbol, cancel=False)
+                        return
+                    continue
+                AMENDS.inc(symbol=symbol)
+                failures = 0
+                self._sent.setdefault(symbol, {}).update(diff)
+        finally:
+            ev = self._idle.get(symbol)
+            if ev is not None:
+                ev.set()
+
+    async def flush(self, symbol: str, timeout: float = 5.0) -> bool:
+        """Дождаться, пока желаемое состояние символа окажется на бирже."""
+        ev = self._idle.get(symbol)
+        if self.pending(symbol) and ev is not None:
+            try:
+                await asyncio.wait_for(ev.wait(), timeout)
+            except asyncio.TimeoutError:
+                return False
+        return symbol in self._want and not self._diff(symbol)
+
+    def forget(self, symbol: str, cancel: bool = True) -> None:
+        """Позиция закрыта — биржа сама сняла её SL/TP."""
+        self._want.pop(symbol, None)
+        self._sent.pop(symbol, None)
+        t = self._tasks.pop(symbol, None)
+        if cancel and t is not None and not t.done():
+            t.cancel()
+
+    async def close(self):
+        tasks = [t for t in self._tasks.values() if not t.done()]
+        self._tasks.clear()
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
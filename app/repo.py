@@ -1,11 +1,12 @@
 from __future__ import annotations
 
-from datetime import datetime
-from typing import Optional
+from datetime import date, datetime
+from typing import Callable, Optional
 
+from sqlalchemy import and_, func, or_, true
 from sqlmodel import Session, select
 
-from app.models import Settings, Trade, Event
+from app.models import Settings, Trade, Event, Execution, DailyStat
 
 
 def get_or_create_settings(session: Session) -> Settings:
@@ -18,36 +19,124 @@ def get_or_create_settings(session: Session) -> Settings:
     return s
 
 
+# in-process pub/sub после commit:
+#   "settings" — свежий Settings после update_settings;
+#   "trade"    — dict сделки после add_trade/update_trade;
+#   "event"    — список dict событий после add_event/add_events.
+_listeners: dict[str, list[Callable]] = {"settings": [], "trade": [], "event": []}
+
+
+def subscribe(topic: str, fn: Callable) -> None:
+    if fn not in _listeners[topic]:
+        _listeners[topic].append(fn)
+
+
+def subscribe_settings(fn: Callable[[Settings], None]) -> None:
+    subscribe("settings", fn)
+
+
+def _notify(topic: str, obj) -> None:
+    for fn in list(_listeners[topic]):
+        fn(obj)
+
+
+def publish(topic: str, obj) -> None:
+    """Разослать подписчикам этого процесса запись, сделанную в другом (воркер супервизора)."""
+    _notify(topic, obj)
+
+
 def update_settings(session: Session, payload: dict) -> Settings:
+    values = Settings.coerce_payload(payload)  # ValueError на кривых значениях
     s = get_or_create_settings(session)
-    for k, v in payload.items():
-        if hasattr(s, k):
-            setattr(s, k, v)
+    for k, v in values.items():
+        setattr(s, k, v)
     s.updated_at = datetime.utcnow()
     session.add(s)
     session.commit()
     session.refresh(s)
+    _notify("settings", s)
     return s
 
 
-def add_event(session: Session, level: str, type_: str, message: str) -> Event:
-    e = Event(level=level, type=type_, message=message)
+def add_event(session: Session, level: str, type_: str, message: str, symbol: Optional[str] = None) -> Event:
+    e = Event(level=level, type=type_, message=message, symbol=symbol)
     session.add(e)
     session.commit()
     session.refresh(e)
+    if _listeners["event"]:
+        _notify("event", [e.model_dump()])
     return e
 
 
-def list_events(session: Session, limit: int = 100):
-    stmt = select(Event).order_by(Event.id.asc()).limit(limit)
-    return list(session.exec(stmt))
+def add_events(session: Session, events: list[Event]) -> int:
+    """Пачка событий одной транзакцией (без refresh на каждое)."""
+    session.add_all(events)
+    rows = None
+    if _listeners["event"]:
+        session.flush()  # id проставляются здесь, после commit объекты уже expired
+        rows = [e.model_dump() for e in events]
+    session.commit()
+    if rows:
+        _notify("event", rows)
+    return len(events)
+
+
+def _in(col, value: Optional[str]):
+    # "WARN,ERROR" -> IN (...); одни запятые/пробелы — фильтра нет (как EventArchive.read)
+    vals = [v.strip() for v in value.split(",") if v.strip()]
+    if not vals:
+        return true()
+    return col.in_(vals) if len(vals) > 1 else col == vals[0]
+
 
+def _keyset(stmt, model, limit: int, after_id: Optional[int], before_id: Optional[int]):
+    """
+    after_id -> id > after_id по возрастанию (дельта для поллинга: «что нового»);
+    иначе — самые новые первыми (before_id — следующая страница назад).
+    """
+    if after_id is not None:
+        return stmt.where(model.id > after_id).order_by(model.id.asc()).limit(limit)
+    if before_id is not None:
+        stmt = stmt.where(model.id < before_id)
+    return stmt.order_by(model.id.desc()).limit(limit)
+
+
+def list_events(
+    session: Session,
+    limit: int = 100,
+    after_id: Optional[int] = None,
+    before_id: Optional[int] = None,
+    level: Optional[str] = None,
+    type_: Optional[str] = None,
+    symbol: Optional[str] = None,
+    ts_from: Optional[datetime] = None,
+    ts_to: Optional[datetime] = None,
+):
+    stmt = select(Event)
+    if level:
+        stmt = stmt.where(_in(Event.level, level))
+    if type_:
+        stmt = stmt.where(_in(Event.type, type_))
+    if symbol:
+        stmt = stmt.where(Event.symbol == symbol)
+    if ts_from is not None:
+        stmt = stmt.where(Event.ts >= ts_from)
+    if ts_to is not None:
+        stmt = stmt.where(Event.ts < ts_to)
+    return list(session.exec(_keyset(stmt, Event, limit, after_id, before_id)))
+
+
+def events_version(session: Session) -> str:
+    """Дешёвая версия таблицы для ETag: события не меняются, только добавляются."""
+    return str(session.exec(select(func.max(Event.id))).one() or 0)
 
 
 def add_trade(session: Session, t: Trade) -> Trade:
     session.add(t)
     session.commit()
     session.refresh(t)
+    if _listeners["trade"]:
+        _notify("trade", t.model_dump())
     return t
 
 
@@ -59,18 +148,206 @@ def update_trade(
     t = session.get(Trade, trade_id)
     if not t:
         raise ValueError("Trade not found")
+    was_closed = t.status == "CLOSED"
     for k, v in fields.items():
         if hasattr(t, k):
             setattr(t, k, v)
+    t.updated_at = datetime.utcnow()
     session.add(t)
+    if t.status == "CLOSED" and not was_closed:
+        _rollup_close(session, t)  # та же транзакция, что и закрытие
     session.commit()
     session.refresh(t)
+    if _listeners["trade"]:
+        _notify("trade", t.model_dump())
     return t
 
 
-def list_trades(session: Session, limit: int = 50):
-    stmt = select(Trade).order_by(Trade.id.desc()).limit(limit)
-    return list(session.exec(stmt))
+def _rollup_close(session: Session, t: Trade) -> None:
+    """+1 закрытая сделка в DailyStat (день закрытия × символ)."""
+    day = (t.updated_at or datetime.utcnow()).date()
+    row = session.exec(select(DailyStat).where(DailyStat.day == day, DailyStat.symbol == t.symbol)).first()
+    if row is None:
+        row = DailyStat(day=day, symbol=t.symbol)
+    gross = float(t.pnl_usdt or 0.0)
+    fee = float(t.entry_fee_usdt or 0.0) + float(t.exit_fee_usdt or 0.0)
+    net = gross - fee
+    row.trades += 1
+    row.gross_pnl += gross
+    row.fees += fee
+    if net > 0:
+        row.wins += 1
+        row.win_sum += net
+    elif net < 0:
+        row.losses += 1
+        row.loss_sum += net
+    row.best = net if row.best is None else max(row.best, net)
+    row.worst = net if row.worst is None else min(row.worst, net)
+    row.updated_at = datetime.utcnow()
+    session.add(row)
+
+
+def backfill_daily_stats(session: Session, batch: int = 1000) -> int:
+    """
+    Разовое заполнение DailyStat по уже закрытым сделкам (старая БД без сводки).
+    Если сводка не пустая — ничего не делает. Возвращает число учтённых сделок.
+    """
+    if session.exec(select(DailyStat.id).limit(1)).first() is not None:
+        return 0
+    n, last_id = 0, 0
+    while True:
+        rows = list(session.exec(
+            select(Trade).where(Trade.status == "CLOSED", Trade.id > last_id).order_by(Trade.id).limit(batch)
+        ))
+        if not rows:
+            break
+        for t in rows:
+            _rollup_close(session, t)
+        session.flush()  # следующий батч должен видеть созданные строки дня
+        n += len(rows)
+        last_id = rows[-1].id
+    session.commit()
+    return n
+
+
+def _stat_filter(stmt, day_from: Optional[date], day_to: Optional[date], symbol: Optional[str]):
+    if day_from is not None:
+        stmt = stmt.where(DailyStat.day >= day_from)
+    if day_to is not None:
+        stmt = stmt.where(DailyStat.day <= day_to)
+    if symbol:
+        stmt = stmt.where(_in(DailyStat.symbol, symbol))
+    return stmt
+
+
+def stats_version(session: Session) -> str:
+    """Версия сводки для ETag: меняется только при закрытии сделки."""
+    n, upd = session.exec(select(func.count(DailyStat.id), func.max(DailyStat.updated_at))).one()
+    return f"{n or 0}-{upd.timestamp() if upd else 0}"
+
+
+def _stat_row(trades, wins, losses, gross, fees, win_sum, loss_sum, best, worst) -> dict:
+    trades, gross, fees = trades or 0, gross or 0.0, fees or 0.0
+    return {
+        "trades": trades,
+        "wins": wins or 0,
+        "losses": losses or 0,
+        "win_rate": round((wins or 0) / trades, 4) if trades else None,
+        "gross_pnl_usdt": gross,
+        "fees_usdt": fees,
+        "net_pnl_usdt": gross - fees,
+        "avg_win_usdt": (win_sum or 0.0) / wins if wins else None,
+        "avg_loss_usdt": (loss_sum or 0.0) / losses if losses else None,
+        "profit_factor": round((win_sum or 0.0) / -loss_sum, 4) if loss_sum else None,
+        "best_trade_usdt": best,
+        "worst_trade_usdt": worst,
+    }
+
+
+_STAT_COLS = (
+    func.sum(DailyStat.trades), func.sum(DailyStat.wins), func.sum(DailyStat.losses),
+    func.sum(DailyStat.gross_pnl), func.sum(DailyStat.fees),
+    func.sum(DailyStat.win_sum), func.sum(DailyStat.loss_sum),
+    func.max(DailyStat.best), func.min(DailyStat.worst),
+)
+
+
+def equity_curve(
+    session: Session,
+    day_from: Optional[date] = None,
+    day_to: Optional[date] = None,
+    symbol: Optional[str] = None,
+) -> list[dict]:
+    """
+    Кривая реализованного net PnL по дням (на закрытие суток): pnl дня,
+    накопленный итог, просадка от пика. Строк — по числу дней, не сделок.
+    """
+    stmt = _stat_filter(
+        select(DailyStat.day, func.sum(DailyStat.trades), func.sum(DailyStat.gross_pnl), func.sum(DailyStat.fees)),
+        day_from, day_to, symbol,
+    ).group_by(DailyStat.day).order_by(DailyStat.day)
+    out = []
+    equity = peak = 0.0
+    for day, trades, gross, fees in session.exec(stmt):
+        net = (gross or 0.0) - (fees or 0.0)
+        equity += net
+        peak = max(peak, equity)
+        out.append({
+            "day": day.isoformat(),
+            "trades": trades or 0,
+            "net_pnl_usdt": net,
+            "equity_usdt": equity,
+            "drawdown_usdt": peak - equity,
+        })
+    return out
+
+
+def stats_summary(
+    session: Session,
+    day_from: Optional[date] = None,
+    day_to: Optional[date] = None,
+    symbol: Optional[str] = None,
+) -> dict:
+    """Итоги по закрытым сделкам из DailyStat: всего, по символам и max drawdown по дням."""
+    total = session.exec(_stat_filter(select(*_STAT_COLS), day_from, day_to, symbol)).one()
+    per_symbol = session.exec(
+        _stat_filter(select(DailyStat.symbol, *_STAT_COLS), day_from, day_to, symbol)
+        .group_by(DailyStat.symbol).order_by(DailyStat.symbol)
+    )
+    curve = equity_curve(session, day_from, day_to, symbol)
+    return {
+        **_stat_row(*total),
+        "max_drawdown_usdt": max((p["drawdown_usdt"] for p in curve), default=0.0),
+        "days": len(curve),
+        "symbols": [{"symbol": sym, **_stat_row(*rest)} for sym, *rest in per_symbol],
+    }
+
+
+def list_trades(
+    session: Session,
+    limit: int = 50,
+    after_id: Optional[int] = None,
+    before_id: Optional[int] = None,
+    symbol: Optional[str] = None,
+    status: Optional[str] = None,
+    since: Optional[datetime] = None,
+    ts_from: Optional[datetime] = None,
+    ts_to: Optional[datetime] = None,
+):
+    """since — только сделки, изменённые после since (открытые/обновлённые/закрытые)."""
+    stmt = select(Trade)
+    if symbol:
+        stmt = stmt.where(Trade.symbol == symbol)
+    if status:
+        stmt = stmt.where(_in(Trade.status, status))
+    if since is not None:
+        stmt = stmt.where(Trade.updated_at > since)
+    if ts_from is not None:
+        stmt = stmt.where(Trade.ts >= ts_from)
+    if ts_to is not None:
+        stmt = stmt.where(Trade.ts < ts_to)
+    return list(session.exec(_keyset(stmt, Trade, limit, after_id, before_id)))
+
+
+def trades_version(session: Session) -> str:
+    """Версия для ETag: новые сделки двигают max(id), изменения — max(updated_at)."""
+    max_id, max_upd = session.exec(select(func.max(Trade.id), func.max(Trade.updated_at))).one()
+    return f"{max_id or 0}-{max_upd.timestamp() if max_upd else 0}"
+
+
+def list_open_trades(session: Session) -> list[Trade]:
+    return list(session.exec(select(Trade).where(Trade.status == "OPEN").order_by(Trade.id)))
+
+
+def trades_since(session: Session, ts_from: datetime, closed_from: Optional[datetime] = None) -> list[Trade]:
+    """
+    Сделки, открытые начиная с ts_from, плюс закрытые начиная с closed_from
+    (открытые раньше) — восстановление дневных счётчиков.
+    """
+    cond = Trade.ts >= ts_from
+    if closed_from is not None:
+        cond = or_(cond, and_(Trade.status == "CLOSED", Trade.updated_at >= closed_from))
+    return list(session.exec(select(Trade).where(cond).order_by(Trade.id)))
 
 
 def get_open_trade(session: Session, symbol: str) -> Optional[Trade]:
@@ -81,3 +358,57 @@ def get_open_trade(session: Session, symbol: str) -> Optional[Trade]:
         .limit(1)
     )
     return session.exec(stmt).first()
+
+
+def add_execution(session: Session, x: Execution, commit: bool = True) -> Execution:
+    session.add(x)
+    if commit:
+        session.commit()
+    return x
+
+
+def list_executions(
+    session: Session,
+    limit: int = 50,
+    after_id: Optional[int] = None,
+    before_id: Optional[int] = None,
+    symbol: Optional[str] = None,
+    mode: Optional[str] = None,
+):
+    stmt = select(Execution)
+    if symbol:
+        stmt = stmt.where(Execution.symbol == symbol)
+    if mode:
+        stmt = stmt.where(_in(Execution.mode, mode))
+    return list(session.exec(_keyset(stmt, Execution, limit, after_id, before_id)))
+
+
+def execution_summary(session: Session, symbol: Optional[str] = None) -> list[dict]:
+    """Сводка качества исполнения по режиму входа."""
+    stmt = select(
+        Execution.mode,
+        func.count(Execution.id),
+        func.avg(Execution.slippage_bps),
+        func.sum(Execution.maker_qty),
+        func.sum(Execution.taker_qty),
+        func.sum(Execution.qty),
+        func.avg(Execution.reprices),
+        func.avg(Execution.duration_ms),
+        func.sum(Execution.fee_usdt),
+    ).group_by(Execution.mode)
+    if symbol:
+        stmt = stmt.where(Execution.symbol == symbol)
+    out = []
+    for mode, n, slip, maker, taker, qty, reprices, dur, fee in session.exec(stmt):
+        filled = (maker or 0.0) + (taker or 0.0)
+        out.append({
+            "mode": mode,
+            "executions": n,
+            "avg_slippage_bps": round(slip, 3) if slip is not None else None,
+            "fill_ratio": round(filled / qty, 4) if qty else None,
+            "maker_share": round((maker or 0.0) / filled, 4) if filled else None,
+            "avg_reprices": round(reprices or 0.0, 2),
+            "avg_duration_ms": round(dur or 0.0, 1),
+            "fee_usdt": fee or 0.0,
+        })
+    return out
@@ -0,0 +1,331 @@
+# app/retention.py
+from __future__ import annotations
+
+import gzip
+import heapq
+import json
+import os
+import threading
+from datetime import date, datetime, timedelta, timezone
+
+from sqlalchemy import delete, func, text, update
+from sqlmodel import Session, select
+
+from app.config import (
+    EVENT_ARCHIVE_AFTER_DAYS,
+    EVENT_ARCHIVE_DIR,
+    EVENT_ARCHIVE_KEEP_DAYS,
+    EVENT_COMPACT_AFTER_SEC,
+    EVENT_COMPACT_BUCKET_SEC,
+    EVENT_RETENTION_SEC,
+    EVENT_VACUUM_PAGES,
+)
+from app.db import engine
+from app.metrics import Counter
+from app.models import Event
+
+RETENTION_ROWS = Counter("event_retention_rows_total", "Event rows removed from the DB by retention", ("action",))
+
+_PREFIX, _SUFFIX = "events-", ".jsonl.gz"
+
+
+def _vals(value: str | None) -> set[str] | None:
+    # "WARN,ERROR" -> {"WARN", "ERROR"}, как repo._in
+    if not value:
+        return None
+    return {v.strip() for v in value.split(",") if v.strip()}
+
+
+class EventArchive:
+    """
+    Append-only сегменты событий: один gzip JSONL на сутки (UTC) по ts.
+    Дописываем новым gzip-членом, файл не переписывается; повтор после сбоя
+    между записью и DELETE даёт дубли — read() отбрасывает их по id.
+    """
+
+    def __init__(self, root: str = EVENT_ARCHIVE_DIR):
+        self.root = root
+
+    def path(self, day: date) -> str:
+        return os.path.join(self.root, f"{_PREFIX}{day.isoformat()}{_SUFFIX}")
+
+    def days(self) -> list[date]:
+        try:
+            names = os.listdir(self.root)
+        except OSError:
+            return []
+        out = []
+        for n in names:
+            if n.startswith(_PREFIX) and n.endswith(_SUFFIX):
+                try:
+                    out.append(date.fromisoformat(n[len(_PREFIX):-len(_SUFFIX)]))
+                except ValueError:
+                    pass
+        return sorted(out)
+
+    def append(self, rows: list[dict]) -> None:
+        by_day: dict[date, list[dict]] = {}
+        for r in rows:
+            by_day.setdefault(datetime.fromisoformat(r["ts"]).date(), []).append(r)
+        os.makedirs(self.root, exist_ok=True)
+        for day, items in by_day.items():
+            with open(self.path(day), "ab") as raw:
+                with gzip.GzipFile(fileobj=raw, mode="wb") as gz:
+                    gz.write("".join(json.dumps(r, separators=(",", ":")) + "\n" for r in items).encode())
+                raw.flush()
+                os.fsync(raw.fileno())
+
+    def purge(self, before: date) -> int:
+        """Удалить сегменты за дни раньше before."""
+        n = 0
+        for day in self.days():
+            if day >= before:
+                break
+            try:
+                os.remove(self.path(day))
+                n += 1
+            except OSError:
+                pass
+        return n
+
+    def read(
+        self,
+        limit: int = 100,
+        after_id: int | None = None,
+        before_id: int | None = None,
+        level: str | None = None,
+        type_: str | None = None,
+        symbol: str | None = None,
+        ts_from: datetime | None = None,
+        ts_to: datetime | None = None,
+    ) -> list[dict]:
+        """Те же фильтры и keyset-порядок, что repo.list_events; открываются только сегменты дней из диапазона."""
+        levels, types = _vals(level), _vals(type_)
+        d_from = ts_from.date() if ts_from is not None else None
+        d_to = ts_to.date() if ts_to is not None else None
+        found: dict[int, dict] = {}
+        for day in self.days():
+            if (d_from is not None and day < d_from) or (d_to is not None and day > d_to):
+                continue
+            try:
+                with gzip.open(self.path(day), "rt") as f:
+                    for line in f:
+                        try:
+                            r = json.loads(line)
+                        except ValueError:
+                            continue  # недописанный хвост
+                        i = r["id"]
+                        if (after_id is not None and i <= after_id) or (before_id is not None and i >= before_id):
+                            continue
+                        if (levels and r["level"] not in levels) or (types and r["type"] not in types):
+                            continue
+                        if symbol and r.get("symbol") != symbol:
+                            continue
+                        ts = datetime.fromisoformat(r["ts"])
+                        if (ts_from is not None and ts < ts_from) or (ts_to is not None and ts >= ts_to):
+                            continue
+                        found[i] = r
+            except (OSError, EOFError):
+                continue  # битый сегмент не должен ронять /events
+        pick = heapq.nsmallest if after_id is not None else heapq.nlargest
+        return pick(limit, found.values(), key=lambda r: r["id"])
+
+
+def merge_events(db_rows: list, archived: list[dict], limit: int, ascending: bool) -> list:
+    """БД + архив одной страницей: по id, без дублей (строка могла ещё не удалиться из БД)."""
+    if not archived:
+        return db_rows
+    rows = {r["id"]: r for r in archived}
+    rows.update({e.id: e for e in db_rows})
+    key = lambda r: r["id"] if isinstance(r, dict) else r.id
+    return sorted(rows.values(), key=key, reverse=not ascending)[:limit]
+
+
+class EventRetention:
+    """
+    Фоновый проход по таблице Event раз в interval_sec:
+      1) compact — одинаковые (level, type, symbol, message) старше compact_after_sec
+         в одном окне bucket_sec схлопываются в первую строку (count, last_ts);
+      2) archive — строки старше archive_after_days уходят в EventArchive и удаляются;
+      3) purge — сегменты старше keep_days удаляются;
+      4) SQLite: PRAGMA incremental_vacuum — освобождённые страницы отдаются ОС.
+    generation растёт, когда содержимое таблицы поменялось (для ETag /events).
+    """
+
+    def __init__(
+        self,
+        archive: EventArchive | None = None,
+        interval_sec: float = EVENT_RETENTION_SEC,
+        compact_after_sec: float = EVENT_COMPACT_AFTER_SEC,
+        bucket_sec: float = EVENT_COMPACT_BUCKET_SEC,
+        archive_after_days: float = EVENT_ARCHIVE_AFTER_DAYS,
+        keep_days: float = EVENT_ARCHIVE_KEEP_DAYS,
+        vacuum_pages: int = EVENT_VACUUM_PAGES,
+        batch: int = 5000,
+        db=None,
+    ):
+        self.archive = archive or EventArchive()
+        self.interval_sec = interval_sec
+        self.compact_after_sec = compact_after_sec
+        self.bucket_sec = max(1.0, bucket_sec)
+        self.archive_after_days = archive_after_days
+        self.keep_days = keep_days
+        self.vacuum_pages = vacuum_pages
+        self.batch = batch
+        self.db = db if db is not None else engine
+
+        self.generation = 0
+        self.last_run: dict | None = None
+        self.last_error: str | None = None
+        self._compacted_id = 0  # строки до него уже схлопнуты
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._run_lock = threading.Lock()
+
+    # ---------- lifecycle ----------
+
+    def start(self) -> None:
+        if self.interval_sec <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="event-retention", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        t, self._thread = self._thread, None
+        if t is None:
+            return
+        self._stop.set()
+        t.join(timeout)
+
+    def _loop(self) -> None:
+        # первый проход вскоре после старта: частые рестарты не должны откладывать ретеншн
+        wait = min(60.0, self.interval_sec)
+        while not self._stop.wait(wait):
+            wait = self.interval_sec
+            try:
+                self.run_once()
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+
+    # ---------- pass ----------
+
+    def run_once(self, now: datetime | None = None) -> dict:
+        now = now or datetime.utcnow()
+        with self._run_lock:
+            out = {"ts": now.isoformat(), "compacted": 0, "archived": 0, "segments_purged": 0, "vacuum_pages": 0}
+            if self.compact_after_sec > 0:
+                # граница по окну: схлопываем только целиком закрытые окна
+                cut = now - timedelta(seconds=self.compact_after_sec)
+                cut = datetime.fromtimestamp(self._bucket(cut) * self.bucket_sec, timezone.utc).replace(tzinfo=None)
+                out["compacted"] = self.compact(cut)
+            if self.archive_after_days > 0:
+                out["archived"] = self.archive_rows(now - timedelta(days=self.archive_after_days))
+            if self.keep_days > 0:
+                out["segments_purged"] = self.archive.purge((now - timedelta(days=self.keep_days)).date())
+            if out["compacted"] or out["archived"]:
+                self.generation += 1
+                out["vacuum_pages"] = self.vacuum()
+            self.last_run = out
+            self.last_error = None
+            return out
+
+    def _bucket(self, ts: datetime) -> int:
+        if ts.tzinfo is None:
+            ts = ts.replace(tzinfo=timezone.utc)  # ts в БД — naive UTC
+        return int(ts.timestamp() // self.bucket_sec)
+
+    def compact(self, before: datetime) -> int:
+        """Схлопнуть дубли с ts < before; возвращает число удалённых строк."""
+        removed = 0
+        keep: dict[tuple, list] = {}  # ключ -> [id, count, last_ts, изменён]
+        with Session(self.db) as s:
+            # ts ставится до вставки (write-behind), id — при вставке: строка с меньшим id
+            # может быть новее before. Курсор не заходит за первую такую — она ещё дозреет;
+            # строки за ней на следующем проходе просто пересмотрятся (схлопывание идемпотентно)
+            stop = s.exec(select(func.min(Event.id)).where(Event.id > self._compacted_id, Event.ts >= before)).first()
+            page = self._compacted_id
+            while True:
+                rows = list(s.exec(
+                    select(Event.id, Event.ts, Event.level, Event.type, Event.symbol, Event.message,
+                           Event.count, Event.last_ts)
+                    .where(Event.id > page, Event.ts < before)
+                    .order_by(Event.id)
+                    .limit(self.batch)
+                ))
+                if not rows:
+                    break
+                dup: list[int] = []
+                for i, ts, lv, tp, sym, msg, cnt, last in rows:
+                    b = self._bucket(ts)
+                    k = (b, lv, tp, sym, msg)
+                    cur = keep.get(k)
+                    if cur is None:
+                        keep[k] = [i, cnt or 1, last or ts, False]
+                        continue
+                    cur[1] += cnt or 1
+                    cur[2] = max(cur[2], last or ts)
+                    cur[3] = True
+                    dup.append(i)
+                for k, (i, cnt, last, changed) in keep.items():
+                    if changed:
+                        s.exec(update(Event).where(Event.id == i).values(count=cnt, last_ts=last))
+                if dup:
+                    s.exec(delete(Event).where(Event.id.in_(dup)))
+                s.commit()
+                removed += len(dup)
+                page = rows[-1][0]
+                self._compacted_id = page if stop is None else min(page, stop - 1)
+                # окна, которые уже позади, больше не пополнятся — держим в памяти только текущие
+                low = self._bucket(rows[-1][1]) - 1
+                keep = {k: [i, c, l, False] for k, (i, c, l, _) in keep.items() if k[0] >= low}
+        RETENTION_ROWS.inc(removed, action="compact")
+        return removed
+
+    def archive_rows(self, before: datetime) -> int:
+        """Перенести строки с ts < before в сегменты; сначала fsync сегмента, потом DELETE."""
+        moved = 0
+        with Session(self.db) as s:
+            while True:
+                rows = list(s.exec(select(Event).where(Event.ts < before).order_by(Event.id).limit(self.batch)))
+                if not rows:
+                    break
+                self.archive.append([
+                    {**r.model_dump(), "ts": r.ts.isoformat(), "last_ts": r.last_ts.isoformat() if r.last_ts else None}
+                    for r in rows
+                ])
+                s.exec(delete(Event).where(Event.id.in_([r.id for r in rows])))
+                s.commit()
+                moved += len(rows)
+        RETENTION_ROWS.inc(moved, action="archive")
+        return moved
+
+    def vacuum(self) -> int:
+        """
+        SQLite: отдать свободные страницы ОС. Старая БД без auto_vacuum
+        переводится в INCREMENTAL один раз полным VACUUM.
+        """
+        if self.db.dialect.name != "sqlite":
+            return 0
+        with self.db.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            free = conn.execute(text("PRAGMA freelist_count")).scalar() or 0
+            if conn.execute(text("PRAGMA auto_vacuum")).scalar() != 2:
+                conn.execute(text("PRAGMA auto_vacuum=INCREMENTAL"))
+                conn.execute(text("VACUUM"))
+                return free
+            n = min(free, self.vacuum_pages) if self.vacuum_pages > 0 else free
+            if n:
+                conn.execute(text(f"PRAGMA incremental_vacuum({int(n)})")).fetchall()
+            return n
+
+    def status(self) -> dict:
+        return {
+            "enabled": self.interval_sec > 0,
+            "interval_sec": self.interval_sec,
+            "last_run": self.last_run,
+            "last_error": self.last_error,
+            "archive_days": [d.isoformat() for d in self.archive.days()],
+        }
+
+
+retention = EventRetention()
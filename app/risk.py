@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import threading
+
+
+def spread_pct(bid: float, ask: float) -> float:
+    if bid <= 0 or ask <= 0:
+        return 999.0
+    mid = (bid + ask) / 2.0
+    return (ask - bid) / mid * 100.0
+
+
+def calc_qty(
+    price: float,
+    balance: float,
+    risk_pct: float,
+    sl_pct: float,
+    leverage: int,
+    max_margin_pct: float,
+) -> float:
+    """
+    qty в базовой монете (BTC), грубая оценка:
+    - риск = balance * risk_pct%
+    - стоп = sl_pct% => риск на 1 BTC = price * sl_pct%
+    qty = risk / (price * sl_pct%)
+    ограничение по марже: margin = (qty*price)/leverage <= balance*max_margin_pct%
+    """
+    risk_usdt = balance * (risk_pct / 100.0)
+    sl_move = price * (sl_pct / 100.0)
+    if sl_move <= 0:
+        return 0.0
+
+    qty_by_risk = risk_usdt / sl_move
+
+    max_margin_usdt = balance * (max_margin_pct / 100.0)
+    qty_by_margin = (max_margin_usdt * leverage) / price if price > 0 else 0.0
+
+    qty = min(qty_by_risk, qty_by_margin)
+    return float(max(0.0, round(qty, 6)))
+
+
+class RiskGate:
+    """
+    Лимиты на аккаунт целиком (все символы). Движок в одном процессе видит
+    весь портфель сам; в шардах (app/supervisor.py) daily_pnl добирает pnl
+    других воркеров, а слот под вход выдаёт супервизор.
+    """
+
+    external_pnl: float = 0.0  # дневной pnl, который не виден в этом портфеле (другие шарды)
+
+    def __init__(self):
+        # символы, чей вход идёт прямо сейчас: слот занят до release, как _reserved у супервизора
+        self._pending: set[str] = set()
+        self._lock = threading.Lock()
+
+    def daily_pnl(self, portfolio) -> float:
+        return portfolio.daily_pnl + self.external_pnl
+
+    async def acquire(self, symbol: str, st, portfolio) -> bool:
+        """Занять слот под ещё одну сделку (max_open_trades): открытые + входы в процессе."""
+        if st.max_open_trades <= 0:
+            return True
+        with self._lock:
+            # символ, чья сделка уже открылась в этом цикле, не считаем дважды
+            if len({t.symbol for t in portfolio.open_trades()} | self._pending) >= st.max_open_trades:
+                return False
+            self._pending.add(symbol)
+            return True
+
+    def release(self, symbol: str, portfolio) -> None:
+        """Вход по symbol завершён (сделка открыта или нет)."""
+        with self._lock:
+            self._pending.discard(symbol)
@@ -0,0 +1,118 @@
+# app/scanner.py
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+import numpy as np
+
+from app.indicators import ema_array
+from app.strategy import EMA_PERIOD, N, THRESH
+
+VOL_WINDOW = 50  # свечей для волатильности 1-бар доходностей (нормировка импульса)
+
+
+@dataclass
+class Candidate:
+    symbol: str
+    signal: str            # "BUY" | "SELL"
+    score: float           # импульс за N свечей в единицах волатильности (больше — сильнее сетап)
+    change_pct: float
+    spread_pct: float | None
+    volume_usdt: float | None
+
+
+def stack_closes(rows: list, length: int) -> np.ndarray:
+    """
+    Ряды close разной длины -> матрица (символы × length), выровненная по последней
+    свече; недостающая история слева — NaN (такие символы сканер пропускает).
+    """
+    out = np.full((len(rows), length), np.nan)
+    for i, r in enumerate(rows):
+        r = np.asarray(r, dtype=np.float64)[-length:]
+        if len(r):
+            out[i, length - len(r):] = r
+    return out
+
+
+def scan_arrays(closes: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Сигнал на последней свече для всех символов сразу (та же логика, что
+    SignalState.signal()/signal_array): +1/-1/0, изменение за N свечей в %
+    и score = |изменение| / (std 1-бар доходностей * sqrt(N)).
+    Символы с NaN в ряду (короткая история) — 0.
+    """
+    c = np.asarray(closes, dtype=np.float64)
+    s, n = c.shape
+    sig = np.zeros(s, dtype=np.int8)
+    change = np.zeros(s)
+    score = np.zeros(s)
+    need = max(EMA_PERIOD, N, VOL_WINDOW) + 1
+    if n < need:
+        return sig, change, score
+
+    # EMA — по всему ряду, как signal_array; символ без полной истории (NaN слева) не торгуем
+    valid = np.isfinite(c).all(axis=1) & (np.nan_to_num(c, nan=0.0) > 0).all(axis=1)
+    c = np.where(valid[:, None], c, 1.0)
+    ema = ema_array(c, EMA_PERIOD)
+    d_ema = ema[:, -1] - ema[:, -2]
+
+    w = c[:, -(VOL_WINDOW + 1):]
+    prev = c[:, -1 - N]
+    change = (c[:, -1] - prev) / prev * 100.0
+    rets = np.diff(np.log(w), axis=1)
+    vol = rets.std(axis=1) * np.sqrt(N) * 100.0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        score = np.where(vol > 0, np.abs(change) / vol, 0.0)
+
+    buy = valid & (change >= THRESH) & (d_ema > 0)
+    sell = valid & (change <= -THRESH) & (d_ema < 0)
+    sig[buy] = 1
+    sig[sell] = -1
+    change = np.where(valid, change, 0.0)
+    score = np.where(sig != 0, score, 0.0)
+    return sig, change, score
+
+
+def scan(
+    symbols: list[str],
+    closes: np.ndarray,
+    bid: np.ndarray | None = None,
+    ask: np.ndarray | None = None,
+    volume_usdt: np.ndarray | None = None,
+    max_spread_pct: float | None = None,
+    min_volume_usdt: float = 0.0,
+    top: int | None = None,
+) -> list[Candidate]:
+    """
+    BUY/SELL-кандидаты по рынку, по убыванию score. Фильтры (тоже векторно):
+    спред по bid/ask <= max_spread_pct, оборот >= min_volume_usdt.
+    """
+    sig, change, score = scan_arrays(closes)
+    ok = sig != 0
+    spread = None
+    if bid is not None and ask is not None:
+        bid, ask = np.asarray(bid, dtype=np.float64), np.asarray(ask, dtype=np.float64)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            spread = np.where((bid > 0) & (ask > 0), (ask - bid) / ((ask + bid) / 2.0) * 100.0, np.inf)
+        if max_spread_pct is not None:
+            ok &= spread <= max_spread_pct
+    if volume_usdt is not None:
+        volume_usdt = np.asarray(volume_usdt, dtype=np.float64)
+        if min_volume_usdt > 0:
+            ok &= np.nan_to_num(volume_usdt, nan=0.0) >= min_volume_usdt
+
+    idx = np.flatnonzero(ok)
+    idx = idx[np.argsort(-score[idx], kind="stable")]
+    if top:
+        idx = idx[:top]
+    return [
+        Candidate(
+            symbol=symbols[i],
+            signal="BUY" if sig[i] > 0 else "SELL",
+            score=float(score[i]),
+            change_pct=float(change[i]),
+            spread_pct=float(spread[i]) if spread is not None else None,
+            volume_usdt=float(volume_usdt[i]) if volume_usdt is not None else None,
+        )
+        for i in idx
+    ]
@@ -1,7 +1,70 @@
 from __future__ import annotations
+
+import threading
+import time
+from dataclasses import make_dataclass
+
 from sqlmodel import Session
+
+from app.db import engine
 from app.models import Settings
 from app import repo
 
+
 def get_settings(session: Session) -> Settings:
     return repo.get_or_create_settings(session)
+
+
+# неизменяемый снимок Settings для цикла бота: те же поля + symbol_list()
+SettingsSnapshot = make_dataclass(
+    "SettingsSnapshot",
+    [(name, f.annotation) for name, f in Settings.model_fields.items()],
+    namespace={"symbol_list": Settings.symbol_list},
+    frozen=True,
+    slots=True,
+)
+
+
+def snapshot(s: Settings) -> SettingsSnapshot:
+    return SettingsSnapshot(**{name: getattr(s, name) for name in Settings.model_fields})
+
+
+class SettingsCache:
+    """
+    Кэш Settings в памяти процесса. repo.update_settings пушит сюда новую версию
+    (subscribe_settings), так что изменения применяются сразу, без чтения БД
+    в каждом цикле. max_age_sec — страховка на случай записи в БД мимо repo
+    (другой процесс): тогда перечитываем не чаще раза в max_age_sec.
+    """
+
+    def __init__(self, max_age_sec: float = 60.0):
+        self.max_age_sec = max_age_sec
+        self._snap: SettingsSnapshot | None = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self.version = 0
+        repo.subscribe_settings(self._on_update)
+
+    def _on_update(self, s: Settings):
+        self._set(snapshot(s))
+
+    def _set(self, snap: SettingsSnapshot):
+        with self._lock:
+            self._snap = snap
+            self._loaded_at = time.monotonic()
+            self.version += 1
+
+    def invalidate(self):
+        with self._lock:
+            self._snap = None
+
+    def is_fresh(self) -> bool:
+        return self._snap is not None and time.monotonic() - self._loaded_at < self.max_age_sec
+
+    def get(self) -> SettingsSnapshot:
+        """Снимок из памяти; в БД идём только если кэш пуст или протух."""
+        if self.is_fresh():
+            return self._snap
+        with Session(engine) as session:
+            self._set(snapshot(repo.get_or_create_settings(session)))
+        return self._snap
@@ -1,5 +1,21 @@
 from __future__ import annotations
 
+import random
+
+import numpy as np
+
+from app.indicators import ATR, EMA, CandleBuffer, ema_array
+
+
+# --- Настройки теста ---
+N = 3                 # сколько свечей назад сравниваем
+THRESH = 0.15         # порог движения в % (0.15% даст сигналы часто на BTC 5m)
+EMA_PERIOD = 50       # фильтр тренда
+ATR_PERIOD = 14
+
+# тестовый режим: 20% шанс открыть сделку каждый цикл (настоящая логика — SignalState)
+RANDOM_SIGNALS = True
+
 
 def _ema(values: list[float], period: int) -> list[float]:
     if len(values) < period:
@@ -10,10 +26,8 @@ def _ema(values: list[float], period: int) -> list[float]:
         ema.append(v * k + ema[-1] * (1 - k))
     return ema
 
-def decide_signal(closes: list[float]) -> str:
-    import random
 
-    # 20% шанс открыть сделку каждый цикл
+def _random_signal() -> str:
     r = random.random()
 
     if r < 0.10:
@@ -24,29 +38,115 @@ def decide_signal(closes: list[float]) -> str:
         return "HOLD"
 
 
+def _decide(change_pct: float, ema_last: float, ema_prev: float) -> str:
+    trend_up = ema_last > ema_prev
+    trend_down = ema_last < ema_prev
+
+    if change_pct >= THRESH and trend_up:
+        return "BUY"
+    if change_pct <= -THRESH and trend_down:
+        return "SELL"
+    return "HOLD"
+
+
+class SignalState:
+    """
+    Инкрементальное состояние стратегии на символ/таймфрейм:
+    кольцевой буфер свечей + EMA/ATR, которые обновляются за O(1)
+    на каждую новую или изменённую (ещё не закрытую) свечу.
+    """
+
+    def __init__(self, maxlen: int = 200):
+        self.candles = CandleBuffer(maxlen)
+        self.ema = EMA(EMA_PERIOD)
+        self.atr = ATR(ATR_PERIOD)
 
-    # --- Настройки теста ---
-    N = 3                 # сколько свечей назад сравниваем
-    THRESH = 0.15         # порог движения в % (0.15% даст сигналы часто на BTC 5m)
+    def update(self, candle) -> None:
+        how = self.candles.update(candle)
+        if how is None:
+            return
+        h, l, c = float(candle[2]), float(candle[3]), float(candle[4])
+        if how == "amend":
+            self.ema.amend(c)
+            self.atr.amend(h, l, c)
+        else:
+            self.ema.update(c)
+            self.atr.update(h, l, c)
 
-    last = float(closes[-1])
-    prev = float(closes[-1 - N])
+    def push_close(self, close: float) -> None:
+        """Для ряда одних close (без OHLC) — ts = порядковый номер."""
+        ts = (self.candles.last_ts + 1) if len(self.candles) else 0
+        self.update((ts, close, close, close, close, 0.0))
+
+    def sync(self, candles) -> None:
+        """
+        Догнать состояние по последовательности свечей [ts,o,h,l,c,v] (по возрастанию ts):
+        list от ccxt или CandleBuffer стрима. Обрабатываются только хвост с ts >= последней
+        известной свечи, т.е. O(число новых свечей), а не весь список.
+        """
+        last = self.candles.last_ts
+        i = len(candles)
+        while i > 0 and (last is None or int(candles[i - 1][0]) >= last):
+            i -= 1
+        for j in range(i, len(candles)):
+            self.update(candles[j])
+
+    def change_pct(self, n: int = N) -> float | None:
+        if len(self.candles) < n + 1:
+            return None
+        prev = self.candles.close(-1 - n)
+        if prev <= 0:
+            return None
+        return (self.candles.close(-1) - prev) / prev * 100.0
+
+    def signal(self) -> str:
+        change = self.change_pct()
+        if change is None or self.ema.prev is None:
+            return "HOLD"
+        return _decide(change, self.ema.value, self.ema.prev)
+
+
+def decide(state: SignalState) -> str:
+    if RANDOM_SIGNALS:
+        return _random_signal()
+    return state.signal()
+
+
+def decide_signal(closes: list[float]) -> str:
+    """
+    Старый API: весь ряд close -> сигнал на последней свече. Разовый расчёт —
+    векторно (ema_array, как signal_array); SignalState — для инкрементального пути движка.
+    """
+    if RANDOM_SIGNALS:
+        return _random_signal()
+    c = np.asarray(closes, dtype=np.float64)
+    if len(c) <= max(N, EMA_PERIOD):
+        return "HOLD"
+    prev = c[-1 - N]
     if prev <= 0:
         return "HOLD"
+    ema = ema_array(c, EMA_PERIOD)
+    return _decide((c[-1] - prev) / prev * 100.0, ema[-1], ema[-2])
 
-    change_pct = (last - prev) / prev * 100.0
 
-    # --- Фильтр тренда (чтобы не ловить совсем шум) ---
-    ema50 = _ema(closes, 50)
-    if not ema50:
-        return "HOLD"
-    trend_up = ema50[-1] > ema50[-2]
-    trend_down = ema50[-1] < ema50[-2]
+def signal_array(closes: np.ndarray) -> np.ndarray:
+    """
+    Векторный аналог SignalState.signal() по каждой свече сразу:
+    +1 = BUY, -1 = SELL, 0 = HOLD. closes — 1-D ряд или 2-D (символы × время).
+    """
+    c = np.asarray(closes, dtype=np.float64)
+    out = np.zeros(c.shape, dtype=np.int8)
+    n = c.shape[-1]
+    start = max(N, EMA_PERIOD)
+    if n <= start:
+        return out
 
-    # --- Сигнал ---
-    if change_pct >= THRESH and trend_up:
-        return "BUY"
-    if change_pct <= -THRESH and trend_down:
-        return "SELL"
+    ema = ema_array(c, EMA_PERIOD)
+    prev = c[..., start - N:n - N]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        change = np.where(prev > 0, (c[..., start:] - prev) / prev * 100.0, 0.0)
+    d_ema = ema[..., start:] - ema[..., start - 1:n - 1]
 
-    return "HOLD"
+    out[..., start:] = np.where((change >= THRESH) & (d_ema > 0), 1, 0)
+    out[..., start:] -= np.where((change <= -THRESH) & (d_ema < 0), 1, 0).astype(np.int8)
+    return out
@@ -0,0 +1,457 @@
+# app/supervisor.py
+from __future__ import annotations
+
+import asyncio
+import itertools
+import multiprocessing as mp
+import os
+import threading
+import time
+
+from sqlmodel import Session
+
+from app import repo
+from app.config import IPC_TIMEOUT_SEC, WORKER_HEARTBEAT_SEC, WORKER_TIMEOUT_SEC
+from app.db import engine as db
+from app.event_sink import events
+from app.live import hub
+from app.risk import RiskGate
+
+
+class Channel:
+    """
+    Pipe между процессами: уведомления send() и запрос-ответ request() по одному
+    соединению. Входящие сообщения разбирает фоновый поток: ответы будят
+    ждущий request(), остальное уходит в handler (его результат — ответ, если
+    у сообщения есть id). handler выполняется в этом потоке, поэтому внутри
+    него можно только send(), не request().
+    """
+
+    def __init__(self, conn, handler, name: str = "ipc"):
+        self.conn = conn
+        self.handler = handler
+        self.name = name
+        self.closed = False
+        self._send_lock = threading.Lock()
+        self._seq = itertools.count(1)
+        self._waiters: dict[int, list] = {}  # id -> [Event, result, error]
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._read, name=self.name, daemon=True)
+        self._thread.start()
+
+    def send(self, op: str, **kw) -> bool:
+        return self._send({"op": op, **kw})
+
+    def request(self, op: str, timeout: float = IPC_TIMEOUT_SEC, **kw):
+        i = next(self._seq)
+        slot = [threading.Event(), None, None]
+        self._waiters[i] = slot
+        try:
+            if not self._send({"op": op, "id": i, **kw}):
+                raise ConnectionError(f"{self.name}: channel closed")
+            if not slot[0].wait(timeout):
+                raise TimeoutError(f"{self.name}: no reply to {op} in {timeout}s")
+        finally:
+            self._waiters.pop(i, None)
+        if slot[2]:
+            raise RuntimeError(slot[2])
+        return slot[1]
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        for slot in list(self._waiters.values()):
+            slot[2] = "channel closed"
+            slot[0].set()
+        try:
+            self.conn.close()
+        except OSError:
+            pass
+
+    def _send(self, msg: dict) -> bool:
+        if self.closed:
+            return False
+        try:
+            with self._send_lock:
+                self.conn.send(msg)
+            return True
+        except (OSError, EOFError, ValueError):
+            self.close()
+            return False
+
+    def _read(self) -> None:
+        while not self.closed:
+            try:
+                msg = self.conn.recv()
+            except (EOFError, OSError):
+                break
+            if "reply" in msg:
+                slot = self._waiters.get(msg["reply"])
+                if slot is not None:
+                    slot[1], slot[2] = msg.get("result"), msg.get("error")
+                    slot[0].set()
+                continue
+            try:
+                res, err = self.handler(msg), None
+            except Exception as e:
+                res, err = None, f"{type(e).__name__}: {e}"
+            if "id" in msg:
+                self._send({"reply": msg["id"], "result": res, "error": err})
+        self.close()
+
+
+# ---------- worker process ----------
+
+class ShardRiskGate(RiskGate):
+    """
+    Риск-лимиты воркера: pnl других шардов приходит от супервизора с каждым
+    heartbeat, слот под вход (max_open_trades) выдаёт супервизор — он видит
+    открытые сделки всех шардов. Нет ответа — входа нет.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.channel: Channel | None = None
+        self._held: set[str] = set()
+
+    async def acquire(self, symbol: str, st, portfolio) -> bool:
+        if st.max_open_trades <= 0:
+            return True
+        try:
+            ok = await asyncio.to_thread(
+                self.channel.request, "reserve", symbol=symbol, max_open=int(st.max_open_trades),
+            )
+        except Exception:
+            return False
+        if ok:
+            self._held.add(symbol)
+        return bool(ok)
+
+    def release(self, symbol: str, portfolio) -> None:
+        if symbol in self._held:
+            self._held.discard(symbol)
+            self.channel.send("release", symbol=symbol, open=len(portfolio.open_trades()))
+
+
+def _shard_path(path: str, index: int) -> str:
+    root, ext = os.path.splitext(path)
+    return f"{root}.shard{index}{ext}"
+
+
+def worker_main(index: int, count: int, conn) -> None:
+    """Процесс-воркер: BotEngine на шард символов, управляется супервизором через conn."""
+    from app import bot_engine  # движок (и клиент биржи) создаётся только в воркере
+
+    eng = bot_engine.bot
+    eng.shard = (index, count)
+    eng.portfolio.path = _shard_path(eng.portfolio.path, index)
+    gate = eng.risk = ShardRiskGate()
+    done = threading.Event()
+
+    def _settings():
+        # POST /settings пришёл в процесс API: перечитать и разослать своим подписчикам
+        with Session(db) as session:
+            repo.publish("settings", repo.get_or_create_settings(session))
+
+    def handle(msg: dict):
+        op = msg["op"]
+        if op == "start":
+            eng.start()
+            return True
+        if op == "stop":
+            eng.stop()
+            return True
+        if op == "status":
+            return eng.status()
+        if op == "candidates":
+            return eng.candidates()
+        if op == "risk":
+            gate.external_pnl = float(msg["external_pnl"])
+            return None
+        if op == "settings":
+            _settings()
+            return None
+        if op == "shutdown":
+            done.set()
+            return True
+        raise ValueError(f"unknown op {op!r}")
+
+    ch = gate.channel = Channel(conn, handle, name=f"worker-{index}")
+    # события и сделки воркера — в LiveHub процесса API (дашборд /stream)
+    repo.subscribe("event", lambda rows: ch.send("pub", topic="event", obj=rows))
+    repo.subscribe("trade", lambda row: ch.send("pub", topic="trade", obj=row))
+    ch.start()
+    ch.send("hello", pid=os.getpid())
+    try:
+        while not done.is_set() and not ch.closed:
+            ch.send("beat", status=eng.status())
+            done.wait(WORKER_HEARTBEAT_SEC)
+    finally:
+        # супервизор велел выйти или умер сам (EOF) — позиции не бросаем без снимка
+        if eng.running:
+            eng.stop()
+        if eng.thread is not None:
+            eng.thread.join(30)
+        events.stop()
+        ch.close()
+
+
+# ---------- supervisor (API process) ----------
+
+class _Worker:
+    def __init__(self, index: int):
+        self.index = index
+        self.proc = None
+        self.ch: Channel | None = None
+        self.status: dict = {}
+        self.last_beat = 0.0
+        self.spawned_at = 0.0
+        self.restarts = 0
+        self.next_spawn = 0.0
+        self.last_exit: str | None = None
+
+    @property
+    def alive(self) -> bool:
+        return self.proc is not None and self.proc.is_alive() and self.ch is not None and not self.ch.closed
+
+
+class Supervisor:
+    """
+    Control plane для BOT_WORKERS процессов BotEngine: символ торгует воркер
+    shard_of(symbol, N). Тот же интерфейс, что у BotEngine для app/main.py
+    (start/stop/status/candidates/running).
+
+    Health-check: воркер шлёт heartbeat со статусом раз в heartbeat_sec;
+    умер или молчит дольше timeout_sec — убиваем и поднимаем заново
+    (с backoff), и если бот должен работать — сразу шлём start.
+
+    Общие лимиты: дневной убыток считается по сумме pnl всех шардов
+    (каждому воркеру уходит pnl остальных), max_open_trades — через
+    резервирование слота здесь, под одним lock.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        heartbeat_sec: float = WORKER_HEARTBEAT_SEC,
+        timeout_sec: float = WORKER_TIMEOUT_SEC,
+    ):
+        self.count = max(1, int(workers))
+        self.heartbeat_sec = heartbeat_sec
+        self.timeout_sec = timeout_sec
+        self.running = False  # желаемое состояние: воркеры после рестарта поднимаются в нём
+        self._client = None  # /health: биржевые клиенты живут в воркерах
+        self._ctx = mp.get_context("spawn")  # fork из процесса с потоками uvicorn небезопасен
+        self._workers = [_Worker(i) for i in range(self.count)]
+        self._open: dict[int, int] = {}  # воркер -> OPEN-сделок (из heartbeat/release)
+        self._reserved: set[tuple[int, str]] = set()
+        self._risk_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._monitor: threading.Thread | None = None
+
+    # ---------- lifecycle ----------
+
+    def open(self) -> None:
+        """Поднять воркеры и монитор (на старте API)."""
+        if self._monitor is not None:
+            return
+        repo.subscribe_settings(self._on_settings)
+        with self._lock:
+            for w in self._workers:
+                self._spawn(w)
+        self._stop.clear()
+        self._monitor = threading.Thread(target=self._watch, name="bot-supervisor", daemon=True)
+        self._monitor.start()
+
+    def close(self, timeout: float = 30.0) -> None:
+        """Остановить воркеры: shutdown, затем terminate тех, кто не вышел."""
+        self._stop.set()
+        if self._monitor is not None:
+            self._monitor.join(5)
+            self._monitor = None
+        for w in self._workers:
+            if w.ch is not None:
+                w.ch.send("shutdown")
+        deadline = time.monotonic() + timeout
+        for w in self._workers:
+            if w.proc is not None:
+                w.proc.join(max(0.0, deadline - time.monotonic()))
+            self._kill(w)
+
+    def start(self) -> None:
+        self.running = True
+        self._broadcast("start")
+        self._emit("INFO", "BOT_STARTED", f"Bot started ({self.count} workers)")
+
+    def stop(self) -> None:
+        self.running = False
+        self._broadcast("stop")
+        self._emit("INFO", "BOT_STOPPED", f"Bot stopped ({self.count} workers)")
+
+    def status(self) -> dict:
+        for w in self._workers:
+            if w.alive:
+                try:
+                    w.status = w.ch.request("status", timeout=min(2.0, IPC_TIMEOUT_SEC)) or w.status
+                except Exception:
+                    pass  # отвечаем последним heartbeat
+        now = time.monotonic()
+        return {
+            **self._merged(),
+            "workers": [
+                {
+                    "index": w.index,
+                    "pid": w.proc.pid if w.proc is not None else None,
+                    "alive": w.alive,
+                    "running": bool(w.status.get("running")),
+                    "symbols": sorted(w.status.get("symbols") or {}),
+                    "open_trades": self._open.get(w.index, 0),
+                    "heartbeat_age_sec": round(now - w.last_beat, 2) if w.last_beat else None,
+                    "restarts": w.restarts,
+                    "last_exit": w.last_exit,
+                }
+                for w in self._workers
+            ],
+        }
+
+    def candidates(self) -> list[dict]:
+        out = []
+        for w in self._workers:
+            if w.alive:
+                try:
+                    out.extend(w.ch.request("candidates") or [])
+                except Exception:
+                    pass
+        return sorted(out, key=lambda c: -c["score"])
+
+    # ---------- status / risk ----------
+
+    def _merged(self) -> dict:
+        """Статус всех шардов в формате BotEngine.status()."""
+        sts = [w.status for w in self._workers if w.status]
+        lasts = [s["last_trade_time"] for s in sts if s.get("last_trade_time")]
+        symbols = {}
+        for s in sts:
+            symbols.update(s.get("symbols") or {})
+        return {
+            "running": self.running and any(s.get("running") for s in sts),
+            "trades_today": sum(s.get("trades_today", 0) for s in sts),
+            "daily_pnl_usdt": sum(s.get("daily_pnl_usdt", 0.0) for s in sts),
+            "last_trade_time": max(lasts) if lasts else None,
+            "open_trades": sum(self._open.values()),
+            "symbols": symbols,
+        }
+
+    def _reserve(self, w: _Worker, symbol: str, max_open: int) -> bool:
+        with self._risk_lock:
+            used = sum(self._open.values()) + len(self._reserved)
+            if max_open > 0 and used >= max_open:
+                return False
+            self._reserved.add((w.index, symbol))
+            return True
+
+    def _release(self, w: _Worker, symbol: str, open_: int) -> None:
+        with self._risk_lock:
+            self._reserved.discard((w.index, symbol))
+            self._open[w.index] = int(open_)
+
+    def _on_beat(self, w: _Worker, status: dict) -> None:
+        w.status = status
+        w.last_beat = time.monotonic()
+        with self._risk_lock:
+            if not any(i == w.index for i, _ in self._reserved):
+                self._open[w.index] = int(status.get("open_trades", 0))  # иначе ждём release с точным числом
+        total = sum(s.status.get("daily_pnl_usdt", 0.0) for s in self._workers if s.status)
+        w.ch.send("risk", external_pnl=total - status.get("daily_pnl_usdt", 0.0))
+        hub.publish_status(self._merged())
+
+    def _handler(self, w: _Worker):
+        def handle(msg: dict):
+            op = msg["op"]
+            if op == "beat":
+                self._on_beat(w, msg["status"])
+            elif op == "reserve":
+                return self._reserve(w, msg["symbol"], msg["max_open"])
+            elif op == "release":
+                self._release(w, msg["symbol"], msg["open"])
+            elif op == "pub":
+                repo.publish(msg["topic"], msg["obj"])
+            elif op == "hello":
+                w.last_beat = time.monotonic()
+                if self.running:
+                    w.ch.send("start")  # рестарт воркера при работающем боте
+            return None
+        return handle
+
+    # ---------- processes ----------
+
+    def _spawn(self, w: _Worker) -> None:
+        parent, child = self._ctx.Pipe()
+        w.proc = self._ctx.Process(
+            target=worker_main, args=(w.index, self.count, child), name=f"bot-worker-{w.index}", daemon=True,
+        )
+        w.proc.start()
+        child.close()
+        w.ch = Channel(parent, self._handler(w), name=f"supervisor-{w.index}")
+        w.ch.start()
+        w.spawned_at = w.last_beat = time.monotonic()
+
+    def _kill(self, w: _Worker) -> None:
+        p = w.proc
+        if p is not None and p.is_alive():
+            p.terminate()
+            p.join(5)
+            if p.is_alive():
+                p.kill()
+                p.join(5)
+        if w.ch is not None:
+            w.ch.close()
+        with self._risk_lock:
+            self._reserved = {r for r in self._reserved if r[0] != w.index}
+            # позиции умершего воркера остаются открытыми — self._open[index] не трогаем
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.heartbeat_sec):
+            now = time.monotonic()
+            for w in self._workers:
+                with self._lock:
+                    if self._stop.is_set():
+                        return
+                    if w.proc is None:
+                        if now >= w.next_spawn:
+                            self._spawn(w)
+                        continue
+                    dead = not w.proc.is_alive() or w.ch is None or w.ch.closed
+                    silent = now - w.last_beat > self.timeout_sec
+                    if not (dead or silent):
+                        if now - w.spawned_at > 60:
+                            w.restarts = 0  # прожил минуту — backoff сначала
+                        continue
+                    code = w.proc.exitcode
+                    w.last_exit = f"exit code {code}" if dead and code is not None else "heartbeat timeout"
+                    self._kill(w)
+                    w.proc = None
+                    w.restarts += 1
+                    w.next_spawn = now + min(30.0, 2.0 ** (w.restarts - 1))
+                    self._emit("WARN", "WORKER_RESTART", f"worker {w.index}: {w.last_exit}, restart #{w.restarts}")
+
+    def _broadcast(self, op: str) -> None:
+        for w in self._workers:
+            if w.alive:
+                try:
+                    w.ch.request(op)
+                except Exception:
+                    pass  # монитор перезапустит воркер, и тот получит текущее состояние в hello
+
+    def _on_settings(self, _s) -> None:
+        for w in self._workers:
+            if w.ch is not None:
+                w.ch.send("settings")
+
+    @staticmethod
+    def _emit(level: str, type_: str, message: str) -> None:
+        events.emit(level, type_, message)
@@ -0,0 +1,259 @@
+# app/sweep.py
+from __future__ import annotations
+
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from app.backtest import Candles, load_inputs, run_backtest
+from app.models import Settings
+from app.strategy import signal_array
+
+
+class SharedCandles:
+    """
+    OHLCV всех символов одним блоком shared memory:
+    [ts int64 × total][o,h,l,c,v float64 × 5 × total][signals int8 × total].
+    Воркеры маппят его по имени — данные не пиклятся и не копируются.
+    """
+
+    def __init__(self, data: dict[str, Candles]):
+        self.symbols = list(data)
+        lens = [len(data[s]) for s in self.symbols]
+        self.offsets = np.concatenate(([0], np.cumsum(lens))).tolist()
+        total = self.offsets[-1]
+        self.shm = shared_memory.SharedMemory(create=True, size=max(1, total * (8 + 8 * 5 + 1)))
+        ts, ohlcv, sig = _views(self.shm.buf, total)
+        for k, s in enumerate(self.symbols):
+            a, b = self.offsets[k], self.offsets[k + 1]
+            c = data[s]
+            ts[a:b] = c.ts
+            for row, col in enumerate((c.open, c.high, c.low, c.close, c.volume)):
+                ohlcv[row, a:b] = col
+            sig[a:b] = signal_array(c.close)  # сигнал не зависит от крутимых полей — считаем один раз
+
+    @property
+    def layout(self) -> tuple:
+        return self.shm.name, self.symbols, self.offsets
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+def _views(buf, total: int):
+    ts = np.ndarray((total,), dtype=np.int64, buffer=buf)
+    ohlcv = np.ndarray((5, total), dtype=np.float64, buffer=buf, offset=total * 8)
+    sig = np.ndarray((total,), dtype=np.int8, buffer=buf, offset=total * 8 * 6)
+    return ts, ohlcv, sig
+
+
+# ---------- worker side ----------
+
+_W: dict = {}
+
+
+def _init_worker(name: str, symbols: list[str], offsets: list[int], base: dict, bt_kwargs: dict):
+    # сегмент создан родителем до старта пула — resource_tracker у нас общий, unlink делает родитель
+    shm = shared_memory.SharedMemory(name=name)
+    ts, ohlcv, sig = _views(shm.buf, offsets[-1])
+    data = {}
+    for k, s in enumerate(symbols):
+        a, b = offsets[k], offsets[k + 1]
+        data[s] = (Candles(ts[a:b], *(ohlcv[r, a:b] for r in range(5))), sig[a:b])
+    _W.update(shm=shm, data=data, base=base, bt_kwargs=bt_kwargs)
+
+
+def _run_one(params: dict) -> dict:
+    st = Settings(**{**_W["base"], **params})
+    results = [
+        run_backtest(c, st, symbol=s, signals=sig, **_W["bt_kwargs"])
+        for s, (c, sig) in _W["data"].items()
+    ]
+    return {"params": params, "metrics": aggregate([r.summary() for r in results])}
+
+
+def aggregate(summaries: list[dict]) -> dict:
+    """Сводка по символам: суммы PnL/комиссий, взвешенный win rate, худший drawdown."""
+    n = sum(s["trades"] for s in summaries)
+    pnl = sum(s["pnl_usdt"] for s in summaries)
+    start = sum(s["end_balance"] - s["pnl_usdt"] for s in summaries)
+    wins = sum(s["win_rate"] * s["trades"] for s in summaries)
+    return {
+        "trades": n,
+        "pnl_usdt": pnl,
+        "return_pct": pnl / start * 100.0 if start else 0.0,
+        "fees_usdt": sum(s["fees_usdt"] for s in summaries),
+        "win_rate": wins / n if n else 0.0,
+        "max_drawdown_pct": max((s["max_drawdown_pct"] for s in summaries), default=0.0),
+    }
+
+
+# ---------- parameter space ----------
+
+def _coerce(field: str, value):
+    ann = Settings.model_fields[field].annotation
+    return int(round(value)) if ann is int else float(value)
+
+
+def param_grid(grid: dict[str, list] | None = None, ranges: dict[str, tuple] | None = None,
+               samples: int = 0, seed: int = 0) -> list[dict]:
+    """
+    grid — полный перебор; ranges — случайная выборка samples точек (uniform),
+    поля из grid при этом выбираются случайно из своих значений.
+    seed фиксирован, чтобы повторный запуск давал те же точки (для resume).
+    """
+    grid, ranges = grid or {}, ranges or {}
+    for f in (*grid, *ranges):
+        if f not in Settings.model_fields:
+            raise ValueError(f"Unknown Settings field: {f}")
+
+    if not ranges:
+        keys = list(grid)
+        return [{k: _coerce(k, v) for k, v in zip(keys, combo)} for combo in itertools.product(*grid.values())]
+
+    rnd = random.Random(seed)
+    out = []
+    for _ in range(samples):
+        p = {k: _coerce(k, rnd.choice(v)) for k, v in grid.items()}
+        p.update({k: _coerce(k, rnd.uniform(lo, hi)) for k, (lo, hi) in ranges.items()})
+        out.append(p)
+    return out
+
+
+def _key(params: dict) -> str:
+    return json.dumps(params, sort_keys=True)
+
+
+def rank(results: list[dict], by: list[str]) -> list[dict]:
+    """by: метрики по приоритету; без префикса — больше лучше, "-metric" — меньше лучше."""
+    def k(r):
+        m = r["metrics"]
+        return tuple(m[x[1:]] if x.startswith("-") else -m[x] for x in by)
+    return sorted(results, key=k)
+
+
+def fingerprint(data: dict[str, Candles], base: dict | None = None, bt_kwargs: dict | None = None) -> str:
+    """Хэш входа sweep'а: символы, свечи (ts и close), base и bt_kwargs — результаты от другого входа не переиспользуем."""
+    h = hashlib.sha256()
+    h.update(json.dumps({"base": base or {}, "bt_kwargs": bt_kwargs or {}}, sort_keys=True, default=str).encode())
+    for s in sorted(data):
+        c = data[s]
+        h.update(s.encode())
+        h.update(np.ascontiguousarray(c.ts, dtype=np.int64).tobytes())
+        h.update(np.ascontiguousarray(c.close, dtype=np.float64).tobytes())
+    return h.hexdigest()
+
+
+def _read(path: str) -> tuple[dict | None, list[dict]]:
+    """JSONL sweep'а: (заголовок {"fingerprint", ...} или None, результаты)."""
+    if not os.path.exists(path):
+        return None, []
+    header, out = None, []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                r = json.loads(line)
+            except ValueError:
+                continue  # оборванная последняя строка после kill
+            if "fingerprint" in r:
+                header = header or r
+            else:
+                out.append(r)
+    return header, out
+
+
+def load_results(path: str) -> list[dict]:
+    return _read(path)[1]
+
+
+def run_sweep(
+    data: dict[str, Candles],
+    params: list[dict],
+    out_path: str,
+    *,
+    base: dict | None = None,
+    workers: int | None = None,
+    rank_by: list[str] | None = None,
+    **bt_kwargs,
+) -> list[dict]:
+    """
+    Гоняет бэктесты по всем params на пуле процессов. Каждый результат сразу
+    дописывается в out_path (JSONL); уже посчитанные точки при повторном
+    запуске пропускаются — прерванный sweep продолжается с места остановки.
+    Первая строка файла — fingerprint входа (свечи, base, bt_kwargs): resume
+    с другими символами/диапазоном/настройками — ValueError, а не чужие результаты.
+    """
+    fp = fingerprint(data, base, bt_kwargs)
+    header, rows = _read(out_path)
+    if (header or {}).get("fingerprint") != fp:
+        if rows:
+            raise ValueError(f"{out_path}: results were computed for different data/settings; use another --out")
+        with open(out_path, "w") as f:  # пустой файл или только чужой заголовок — начинаем заново
+            f.write(json.dumps({"fingerprint": fp, "symbols": sorted(data)}) + "\n")
+    done = {_key(r["params"]): r for r in rows}
+    todo = [p for p in dict.fromkeys(map(_key, params)) if p not in done]
+
+    if todo:
+        shared = SharedCandles(data)
+        try:
+            with ProcessPoolExecutor(
+                max_workers=workers or os.cpu_count(),
+                initializer=_init_worker,
+                initargs=(*shared.layout, base or {}, bt_kwargs),
+            ) as pool, open(out_path, "a") as f:
+                futs = [pool.submit(_run_one, json.loads(k)) for k in todo]
+                for fut in as_completed(futs):
+                    r = fut.result()
+                    f.write(json.dumps(r) + "\n")
+                    f.flush()
+                    done[_key(r["params"])] = r
+        finally:
+            shared.close()
+
+    wanted = [done[k] for k in dict.fromkeys(map(_key, params))]
+    return rank(wanted, rank_by or ["pnl_usdt"])
+
+
+def _parse_kv(items: list[str], sep: str) -> dict:
+    out = {}
+    for it in items:
+        k, _, v = it.partition("=")
+        vals = [float(x) for x in v.split(sep)]
+        out[k] = vals if sep == "," else tuple(vals)
+    return out
+
+
+def main(argv: list[str] | None = None):
+    ap = argparse.ArgumentParser(description="Parallel parameter sweep over Settings")
+    ap.add_argument("inputs", nargs="+", help="OHLCV CSV на символ или символы с --store (см. app.backtest)")
+    ap.add_argument("--store", metavar="TIMEFRAME", help="читать символы из локального OHLCVStore")
+    ap.add_argument("--grid", nargs="*", default=[], metavar="FIELD=V1,V2,...")
+    ap.add_argument("--random", nargs="*", default=[], metavar="FIELD=LO:HI")
+    ap.add_argument("--samples", type=int, default=100)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", default="sweep_results.jsonl")
+    ap.add_argument("--rank", default="pnl_usdt", help="через запятую; '-metric' = меньше лучше")
+    ap.add_argument("--top", type=int, default=10)
+    ap.add_argument("--workers", type=int, default=None)
+    args = ap.parse_args(argv)
+
+    data = load_inputs(args.inputs, args.store)
+    params = param_grid(_parse_kv(args.grid, ","), _parse_kv(args.random, ":"), args.samples, args.seed)
+    ranked = run_sweep(data, params, args.out, workers=args.workers, rank_by=args.rank.split(","))
+    for r in ranked[:args.top]:
+        print(json.dumps(r))
+
+
+if __name__ == "__main__":
+    main()
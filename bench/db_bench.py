@@ -0,0 +1,108 @@
+"""
+SQLite: дефолтный create_engine vs WAL/pragmas/пул из app.db.make_engine.
+
+Писатель имитирует бота (trade insert/update + event, каждое своей транзакцией),
+N читателей — вкладки UI, которые без пауз дергают /trades и /events.
+Меряем записи/сек и латентность чтения p50/p99.
+
+    python -m bench.db_bench --seconds 5 --readers 4
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from sqlmodel import Session, SQLModel, create_engine
+
+from app import repo
+from app.db import make_engine, sqlite_pragmas
+from app.models import Event, Trade
+
+
+def _pct(xs: list[float], p: float) -> float:
+    if not xs:
+        return 0.0
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(len(xs) * p))]
+
+
+def _seed(eng, trades: int, events: int):
+    with Session(eng) as s:
+        s.add_all(Trade(symbol="BTC/USDT:USDT", side="buy", qty=0.01, entry=100, sl=99, tp=102, status="CLOSED")
+                  for _ in range(trades))
+        s.add_all(Event(level="INFO", type="SEED", message="x" * 40) for _ in range(events))
+        s.commit()
+
+
+def run(name: str, eng, seconds: float, readers: int) -> dict:
+    SQLModel.metadata.create_all(eng)
+    _seed(eng, 2_000, 20_000)
+
+    stop = threading.Event()
+    writes = [0]
+    write_errors = [0]
+    read_lat: list[list[float]] = [[] for _ in range(readers)]
+
+    def writer():
+        while not stop.is_set():
+            try:
+                with Session(eng) as s:
+                    t = repo.add_trade(s, Trade(symbol="BTC/USDT:USDT", side="buy", qty=0.01, entry=100, sl=99, tp=102))
+                    repo.update_trade(s, t.id, sl=99.5)
+                    repo.add_event(s, "INFO", "TRAIL_SL_UPDATED", "SL -> 99.5")
+                writes[0] += 3
+            except Exception:
+                write_errors[0] += 1
+
+    def reader(i: int):
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            with Session(eng) as s:
+                repo.list_trades(s, limit=50)
+                repo.list_events(s, limit=200)
+            read_lat[i].append((time.perf_counter() - t0) * 1000.0)
+
+    threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    lat = [x for xs in read_lat for x in xs]
+    return {
+        "config": name,
+        "writes_per_sec": round(writes[0] / seconds, 1),
+        "write_errors": write_errors[0],
+        "reads": len(lat),
+        "read_p50_ms": round(statistics.median(lat), 3) if lat else 0.0,
+        "read_p99_ms": round(_pct(lat, 0.99), 3),
+    }
+
+
+def main(argv: list[str] | None = None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--seconds", type=float, default=5.0)
+    ap.add_argument("--readers", type=int, default=4)
+    args = ap.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as d:
+        configs = {
+            # как было: create_engine("sqlite:///...") без настроек
+            "default": lambda p: create_engine(f"sqlite:///{p}", connect_args={"check_same_thread": False}),
+            "wal_tuned": lambda p: make_engine(f"sqlite:///{p}", pragmas=sqlite_pragmas(journal_mode="WAL", synchronous="NORMAL")),
+        }
+        for name, factory in configs.items():
+            eng = factory(os.path.join(d, f"{name}.db"))
+            print(json.dumps(run(name, eng, args.seconds, args.readers)))
+            eng.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,484 @@
+"""
+Бенчмарки горячих путей: стратегия, движок, repo/события, API.
+Полностью офлайн: биржа — SimExchange на синтетических свечах (ручные часы),
+БД — временный SQLite с теми же PRAGMA, что у приложения.
+
+Результат — JSON {"meta", "metrics": {name: {value, unit, better, tol}}}.
+Время и пропускная способность в сравнении нормируются на калибровочный цикл
+(meta.calibration_us), поэтому baseline переносим между машинами; у каждой метрики
+свой допуск tol (хвосты и I/O шумят сильнее). --compare только печатает таблицу;
+код 1 при регрессии — лишь с явным --tolerance (порог — больший из него и tol).
+
+    python -m bench.suite                                  # JSON в stdout
+    python -m bench.suite --compare bench/baseline.json    # + сравнение (отчёт)
+    python -m bench.suite --compare bench/baseline.json --tolerance 0.5   # гейт: exit 1 при регрессии
+    python -m bench.suite --save bench/baseline.json       # обновить baseline
+    python -m bench.suite --only strategy,engine --quick
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.request
+from datetime import datetime
+
+SYMBOL = "BTC/USDT:USDT"
+
+
+def _env(tmp: str) -> None:
+    # до первого импорта app.*: config читает окружение при импорте
+    os.environ.update(
+        DB_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+        DATA_DIR=os.path.join(tmp, "data"),
+        EXCHANGE="sim",
+        MARKET_WS="false",
+        PRIVATE_WS="false",
+        EVENT_RETENTION_SEC="0",
+        BOT_WORKERS="0",
+        TRACE_CYCLES="false",
+    )
+
+
+def _pct(xs: list[float], p: float) -> float:
+    if not xs:
+        return 0.0
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(len(xs) * p))]
+
+
+def _m(value: float, unit: str, better: str = "lower", tol: float = 0.5) -> dict:
+    return {"value": round(float(value), 4), "unit": unit, "better": better, "tol": tol}
+
+
+def _calibrate(repeat: int = 7) -> float:
+    """
+    Эталонная нагрузка (чистый Python + мелкий numpy, как горячие пути движка), мкс.
+    Лучший из repeat: скорость машины, а не шум соседей.
+    """
+    import numpy as np
+
+    x = np.linspace(1.0, 2.0, 256)
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        acc = 0.0
+        for i in range(20_000):
+            acc += (i % 7) * 0.5
+        for _ in range(200):
+            acc += float(np.cumsum(x * 0.99)[-1])
+        best = min(best, time.perf_counter() - t0)
+    return best * 1e6
+
+
+def _per_call_us(fn, n: int, repeat: int = 5) -> float:
+    """Лучший из repeat прогонов, мкс на вызов: минимум меньше всего шумит от соседей по машине."""
+    runs = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(n):
+            fn()
+        runs.append((time.perf_counter() - t0) / n * 1e6)
+    return min(runs)
+
+
+def _candles(symbols: list[str], n: int = 3000):
+    import numpy as np
+
+    from app.backtest import Candles
+
+    t0 = 1_700_000_000_000
+    out = {}
+    for k, s in enumerate(symbols):
+        rng = np.random.default_rng(k)
+        c = 100 + np.cumsum(rng.normal(0, 0.15, n))
+        o = np.r_[100, c[:-1]]
+        out[s] = Candles(np.arange(n) * 60_000 + t0, o, np.maximum(o, c) + 0.05, np.minimum(o, c) - 0.05, c, np.ones(n) * 1000)
+    return out
+
+
+def _settings(symbols: list[str]) -> None:
+    from sqlmodel import Session
+
+    from app import repo
+    from app.db import engine
+
+    with Session(engine) as s:
+        repo.update_settings(s, {
+            "symbols": ",".join(symbols), "timeframe": "1m", "loop_interval_sec": 1, "cooldown_minutes": 1,
+            "entry_order_type": "market", "max_trades_per_day": 100_000, "sl_pct": 0.2, "tp_pct": 0.3,
+            "exit_mode": "soft", "use_exchange_sl_tp": False, "max_daily_loss_pct": 100.0,
+            "max_margin_pct": 2.0,  # позиции открыты по всем символам сразу — маржи sim должно хватать
+        })
+
+
+def _engine(data: dict, tmp: str, name: str):
+    from app.bot_engine import BotEngine
+    from app.exchange.sim import SimExchange
+    from app.ohlcv_store import OHLCVStore
+    from app.portfolio import Portfolio
+
+    sim = SimExchange(data, seed=0)  # speed=None: часы двигаем сами
+    eng = BotEngine(sim, store=OHLCVStore(os.path.join(tmp, f"ohlcv-{name}")),
+                    portfolio=Portfolio(os.path.join(tmp, f"portfolio-{name}.json")))
+    eng.running = True
+    return eng, sim
+
+
+# ---------- strategy ----------
+
+def bench_strategy(quick: bool) -> dict:
+    import numpy as np
+
+    from app.strategy import SignalState, decide_signal
+
+    n = 200 if quick else 2000
+    closes = list(100 + np.cumsum(np.random.default_rng(0).normal(0, 0.15, 200)))
+    st = SignalState()
+    for c in closes:
+        st.push_close(c)
+    stream = iter(list(100 + np.cumsum(np.random.default_rng(1).normal(0, 0.15, 10 * n * 5 + 10))))
+
+    def push():
+        st.push_close(next(stream))
+        st.signal()
+
+    return {
+        "strategy.decide_signal_200_us": _m(_per_call_us(lambda: decide_signal(closes), n), "us"),
+        "strategy.signal_push_us": _m(_per_call_us(push, 10 * n), "us"),
+    }
+
+
+# ---------- engine ----------
+
+def bench_engine(quick: bool, tmp: str) -> dict:
+    from types import SimpleNamespace
+
+    from app.models import Trade
+    from app.portfolio import SymbolState
+
+    symbols = [f"S{i:02d}/USDT:USDT" for i in range(4 if quick else 10)]
+    data = _candles(symbols)
+    _settings(symbols)
+    eng, sim = _engine(data, tmp, "cycle")
+    out = {}
+
+    n = 2000 if quick else 20000
+    out["engine.calc_qty_us"] = _m(_per_call_us(lambda: eng._calc_qty(100.0, 10_000.0, 0.5, 1.5, 2, 10.0), n), "us")
+
+    st = SimpleNamespace(trailing_enabled=True, trailing_activation_pct=0.1, trailing_pct=0.3)
+    t = Trade(symbol=SYMBOL, side="buy", qty=1.0, entry=100.0, sl=99.0, tp=103.0)
+    state = SymbolState(SYMBOL)
+    px = iter([100.0 + (i % 500) * 0.01 for i in range(n * 5 + 10)])
+    out["engine.trailing_sl_us"] = _m(_per_call_us(lambda: eng._trailing_sl(t, state, st, next(px)), n), "us")
+
+    async def run() -> dict:
+        res = {}
+        s = await eng._load_settings()
+
+        # _apply_trailing: новый SL -> update_trade в БД + событие
+        from sqlmodel import Session
+
+        from app import repo
+        from app.db import engine as db
+
+        with Session(db, expire_on_commit=False) as session:
+            tr = repo.add_trade(session, Trade(symbol=SYMBOL, side="buy", qty=1.0, entry=100.0, sl=99.0, tp=200.0))
+        trail = SimpleNamespace(trailing_enabled=True, trailing_activation_pct=0.01, trailing_pct=0.1,
+                                exit_mode="soft", use_exchange_sl_tp=False)
+        tstate = SymbolState(SYMBOL)
+        lat = []
+        for i in range(100 if quick else 500):
+            t0 = time.perf_counter()
+            await eng._apply_trailing(tr, tstate, trail, 101.0 + i * 0.05)  # каждый шаг подтягивает SL
+            lat.append((time.perf_counter() - t0) * 1000.0)
+        res["engine.apply_trailing_p50_ms"] = _m(statistics.median(lat), "ms", tol=1.0)  # запись в SQLite
+
+        # полный цикл символа (сигнал, вход/сопровождение/выход, запись в БД) на ручных часах
+        steps = 60 if quick else 300
+        lat = []
+        for _ in range(steps):
+            sim.clock.advance(60)
+            for sym in symbols:
+                t0 = time.perf_counter()
+                await eng._cycle(sym, eng._state(sym), s)
+                lat.append((time.perf_counter() - t0) * 1000.0)
+        res["engine.cycle_p50_ms"] = _m(statistics.median(lat), "ms", tol=1.0)
+        res["engine.cycle_p99_ms"] = _m(_pct(lat, 0.99), "ms", tol=2.0)
+        res["engine.cycles_per_sec"] = _m(len(lat) / (sum(lat) / 1000.0), "1/s", "higher", tol=0.6)
+        return res
+
+    out.update(asyncio.run(run()))
+    return out
+
+
+def bench_memory(quick: bool, tmp: str) -> dict:
+    """Прирост памяти (tracemalloc) на символ после первого цикла: SignalState, SymbolState, окно свечей."""
+    n = 20 if quick else 100
+    symbols = [f"M{i:03d}/USDT:USDT" for i in range(n)]
+    data = _candles(symbols, 600)
+    _settings(symbols)
+    eng, sim = _engine(data, tmp, "mem")
+
+    async def run():
+        s = await eng._load_settings()
+        await eng._cycle(symbols[0], eng._state(symbols[0]), s)  # прогрев импортов/кэшей
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        for sym in symbols[1:]:
+            await eng._cycle(sym, eng._state(sym), s)
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        grown = sum(x.size_diff for x in after.compare_to(before, "filename"))
+        return grown / (len(symbols) - 1)
+
+    per = asyncio.run(run())
+    return {"memory.per_symbol_kb": _m(per / 1024.0, "KiB", tol=0.2)}
+
+
+# ---------- repo / events ----------
+
+def bench_repo(quick: bool) -> dict:
+    from sqlmodel import Session
+
+    from app import repo
+    from app.db import engine
+    from app.event_sink import EventSink
+    from app.models import Trade
+
+    n = 300 if quick else 2000
+    with Session(engine, expire_on_commit=False) as s:
+        t0 = time.perf_counter()
+        ids = [repo.add_trade(s, Trade(symbol=SYMBOL, side="buy", qty=1.0, entry=100.0, sl=99.0, tp=102.0)).id
+               for _ in range(n)]
+        add = n / (time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        for i in ids:
+            repo.update_trade(s, i, sl=99.5)
+        upd = n / (time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        for i in ids:
+            repo.update_trade(s, i, exit_price=101.0, pnl_usdt=1.0, exit_fee_usdt=0.05, status="CLOSED")
+        close = n / (time.perf_counter() - t0)
+
+    # write-behind: emit с горячего пути, пачки пишет фоновый поток
+    m = 20_000 if quick else 200_000
+    sink = EventSink(drop=set(), sample={}, maxsize=m)  # очередь на весь прогон: меряем запись, не backpressure
+    t0 = time.perf_counter()
+    for i in range(m):
+        sink.emit("INFO", "BENCH", f"event {i}", SYMBOL)
+    emit_us = (time.perf_counter() - t0) / m * 1e6
+    sink.flush(timeout=120)
+    written = sink.written / (time.perf_counter() - t0)
+    sink.stop()
+    return {
+        # fsync SQLite: зависит от диска, не только от CPU — допуск шире
+        "repo.add_trade_per_sec": _m(add, "1/s", "higher", tol=0.6),
+        "repo.update_trade_per_sec": _m(upd, "1/s", "higher", tol=0.6),
+        "repo.close_trade_per_sec": _m(close, "1/s", "higher", tol=0.6),
+        "events.emit_us": _m(emit_us, "us"),
+        "events.written_per_sec": _m(written, "1/s", "higher", tol=0.6),
+    }
+
+
+# ---------- API ----------
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def bench_api(quick: bool, pollers: int) -> dict:
+    """uvicorn в потоке + pollers клиентов, которые без пауз опрашивают /trades и /events; бот пишет события."""
+    import uvicorn
+    from sqlmodel import Session
+
+    from app import repo
+    from app.db import engine
+    from app.event_sink import events
+    from app.main import app
+    from app.models import Event, Trade
+
+    with Session(engine) as s:
+        s.add_all(Trade(symbol=SYMBOL, side="buy", qty=1.0, entry=100, sl=99, tp=102, status="CLOSED") for _ in range(2000))
+        s.add_all(Event(level="INFO", type="SEED", message="x" * 40, symbol=SYMBOL) for _ in range(20_000))
+        s.commit()
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", access_log=False))
+    th = threading.Thread(target=server.run, daemon=True)
+    th.start()
+    base = f"http://127.0.0.1:{port}"
+    for _ in range(200):
+        if server.started:
+            break
+        time.sleep(0.05)
+
+    seconds = 2.0 if quick else 8.0
+    stop = threading.Event()
+    lat: dict[str, list[float]] = {"trades": [], "events": []}
+    lock = threading.Lock()
+
+    def poll(i: int):
+        paths = [("trades", "/trades?limit=50"), ("events", "/events?limit=200")]
+        k = i
+        while not stop.is_set():
+            name, path = paths[k % 2]
+            k += 1
+            t0 = time.perf_counter()
+            with urllib.request.urlopen(base + path) as r:
+                r.read()
+            dt = (time.perf_counter() - t0) * 1000.0
+            with lock:
+                lat[name].append(dt)
+
+    def bot():
+        i = 0
+        while not stop.is_set():
+            events.emit("INFO", "TRAIL_SL_UPDATED", f"{SYMBOL}: SL -> {i}", SYMBOL)
+            i += 1
+            time.sleep(0.002)
+
+    threads = [threading.Thread(target=poll, args=(i,)) for i in range(pollers)] + [threading.Thread(target=bot)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    server.should_exit = True
+    th.join(10)
+
+    out = {}
+    for name, xs in lat.items():
+        out[f"api.{name}_p50_ms"] = _m(statistics.median(xs) if xs else 0.0, "ms", tol=1.0)
+        out[f"api.{name}_p99_ms"] = _m(_pct(xs, 0.99), "ms", tol=2.0)
+    out["api.requests_per_sec"] = _m(sum(len(x) for x in lat.values()) / seconds, "1/s", "higher", tol=0.6)
+    return out
+
+
+# ---------- baseline ----------
+
+_TIMED = ("us", "ms", "1/s")  # нормируются на калибровку; память — как есть
+
+
+def compare(cur: dict, base: dict, tolerance: float | None = None) -> list[dict]:
+    """
+    Метрики из обоих прогонов: ratio = cur/base, для времени/пропускной способности —
+    с поправкой на калибровку машины (speed = base_cal / cur_cal).
+    regression — хуже baseline больше допуска: max(tolerance, tol метрики).
+    """
+    cal_b = base.get("meta", {}).get("calibration_us")
+    cal_c = cur.get("meta", {}).get("calibration_us")
+    speed = cal_b / cal_c if cal_b and cal_c else 1.0  # >1 — текущая машина быстрее
+    rows = []
+    for name, b in sorted(base.get("metrics", {}).items()):
+        c = cur["metrics"].get(name)
+        if c is None or not b["value"]:
+            continue
+        ratio = c["value"] / b["value"]
+        if c["unit"] in _TIMED:
+            ratio = ratio * speed if b["better"] == "lower" else ratio / speed
+        tol = max(tolerance or 0.0, c.get("tol", b.get("tol", 0.5)))
+        worse = ratio > 1 + tol if b["better"] == "lower" else ratio < 1 / (1 + tol)
+        rows.append({"metric": name, "baseline": b["value"], "current": c["value"], "unit": c["unit"],
+                     "ratio": round(ratio, 3), "tol": tol, "regression": worse})
+    return rows
+
+
+SUITES = ("strategy", "engine", "memory", "repo", "api")
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--only", default=",".join(SUITES), help="через запятую: " + ",".join(SUITES))
+    ap.add_argument("--quick", action="store_true", help="меньше итераций (smoke)")
+    ap.add_argument("--pollers", type=int, default=8, help="одновременных клиентов API")
+    ap.add_argument("--out", help="записать результат в файл (JSON)")
+    ap.add_argument("--compare", help="baseline JSON для сравнения")
+    ap.add_argument("--tolerance", type=float, default=None,
+                    help="гейт: exit 1, если метрика хуже больше чем на max(доля, tol метрики); без него — только отчёт")
+    ap.add_argument("--save", help="сохранить результат как baseline")
+    args = ap.parse_args(argv)
+    only = [x.strip() for x in args.only.split(",") if x.strip()]
+    unknown = set(only) - set(SUITES)
+    if unknown:
+        ap.error(f"unknown suites: {sorted(unknown)}")
+
+    with tempfile.TemporaryDirectory(prefix="bench-") as tmp:
+        _env(tmp)
+        from app.db import init_db
+        from app import models, strategy  # noqa: F401 — таблицы в metadata до create_all
+
+        init_db()
+        cal = _calibrate()
+        strategy.RANDOM_SIGNALS = False  # меряем настоящую логику сигнала, а не тестовый рандом
+        metrics: dict[str, dict] = {}
+        for name in SUITES:
+            if name not in only:
+                continue
+            t0 = time.perf_counter()
+            if name == "strategy":
+                metrics.update(bench_strategy(args.quick))
+            elif name == "engine":
+                metrics.update(bench_engine(args.quick, tmp))
+            elif name == "memory":
+                metrics.update(bench_memory(args.quick, tmp))
+            elif name == "repo":
+                metrics.update(bench_repo(args.quick))
+            elif name == "api":
+                metrics.update(bench_api(args.quick, args.pollers))
+            print(f"{name}: {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+            cal = min(cal, _calibrate())  # частота CPU плавает — берём лучший замер за весь прогон
+        from app.event_sink import events
+
+        events.stop()
+
+    result = {
+        "meta": {
+            "ts": datetime.utcnow().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "quick": args.quick,
+            "suites": only,
+            "calibration_us": round(cal, 1),
+        },
+        "metrics": metrics,
+    }
+    text = json.dumps(result, indent=2)
+    print(text)
+    for path in (args.out, args.save):
+        if path:
+            with open(path, "w") as f:
+                f.write(text + "\n")
+
+    if args.compare:
+        with open(args.compare) as f:
+            base = json.load(f)
+        rows = compare(result, base, args.tolerance)
+        # --quick и полный прогон — разная нагрузка (доля циклов со входом и т.п.), гейтом не служат
+        comparable = bool(base.get("meta", {}).get("quick")) == args.quick
+        if not comparable:
+            print(f"baseline quick={base.get('meta', {}).get('quick')} vs current quick={args.quick}: "
+                  "report only", file=sys.stderr)
+        for r in rows:
+            flag = "REGRESSION" if r["regression"] else "ok"
+            print(f"{r['metric']:<34} {r['baseline']:>12} -> {r['current']:>12} {r['unit']:<4} "
+                  f"x{r['ratio']:<6} (tol {r['tol']:<4}) {flag}", file=sys.stderr)
+        if args.tolerance is not None and comparable and any(r["regression"] for r in rows):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())